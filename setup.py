@@ -25,6 +25,12 @@ setup(
      demo_grammar = learn_to_normalize.demo_grammar:main
      evaluate = learn_to_normalize.evaluation.evaluate:main
      demo_normalize = learn_to_normalize.demo_normalize:main
+     fuzz_grammar = learn_to_normalize.fuzz_grammar:main
+     grammar_coverage = learn_to_normalize.grammar_coverage:main
+     inspect_addon = learn_to_normalize.addon.inspect_addon:main
+     compress_addon = learn_to_normalize.addon.compression:main
+     benchmark_fst_types = learn_to_normalize.benchmark_fst_types:main
+     profile_normalize = learn_to_normalize.profile_normalize:main
     """
 )
 
@@ -0,0 +1,29 @@
+"""
+Addon
+=====
+Utils to write and read addons with text normalization rules.
+Addon is a list of sections, one section per locale. Section is a dictionary
+with configs and serialized FARs of tokenizer and verbalizer.
+
+There are two layouts of the addon:
+
+- `msgpack` - whole list of sections is packed with msgpack. This is what `balacoon_frontend` expects.
+- `mapped` - small index header followed by FARs stored uncompressed at aligned offsets.
+  FARs can be memory-mapped and shared between processes instead of being copied to heap.
+
+.. autosummary::
+    :toctree: generated/
+    :nosignatures:
+    :template: class.rst
+
+    MappedAddon
+
+Content of addons can be inspected and compared with `inspect_addon` tool
+(`learn_to_normalize.addon.inspect_addon`, not imported here since it requires pynini).
+FARs in addon sections can optionally be compressed for distribution (`compress_addon` tool
+or `learn_to_normalize --compress`). Evaluation and demos unpack compressed addons transparently.
+
+"""
+
+from learn_to_normalize.addon.addon_io import MappedAddon, read_addon, write_addon
+from learn_to_normalize.addon.compression import compress_section, decompress_section
@@ -0,0 +1,243 @@
+"""
+Copyright 2022 Balacoon
+
+Reading and writing addons in different layouts.
+"""
+
+import mmap
+import struct
+from typing import Any, Dict, List, Union
+
+import msgpack
+
+LAYOUTS = ["msgpack", "mapped"]
+MAPPED_MAGIC = b"LTNADDON"
+MAPPED_VERSION = 1
+# magic, version, size of msgpack header that follows
+MAPPED_PREAMBLE = struct.Struct("<8sII")
+DEFAULT_ALIGNMENT = 4096
+
+
+def _align(offset: int, alignment: int) -> int:
+    """
+    rounds offset up to the multiple of alignment
+    """
+    return (offset + alignment - 1) // alignment * alignment
+
+
+def write_mapped_addon(sections: List[Dict[Any, Any]], path: str, alignment: int = DEFAULT_ALIGNMENT):
+    """
+    Writes addon in `mapped` layout: preamble, msgpack header with non-binary fields and
+    locations of binary fields, binary fields stored as is at aligned offsets.
+
+    Parameters
+    ----------
+    sections: List[Dict[Any, Any]]
+        addon sections to store
+    path: str
+        path to write addon to
+    alignment: int
+        alignment of binary fields within the file. page size allows to map FARs directly
+    """
+    # first pass - compute location of binary fields
+    header_sections = []
+    blobs = []
+    for section in sections:
+        header_section = {"fields": {}, "blobs": {}}
+        for key, value in section.items():
+            if isinstance(value, (bytes, bytearray, memoryview)):
+                header_section["blobs"][key] = len(blobs)
+                blobs.append(value)
+            else:
+                header_section["fields"][key] = value
+        header_sections.append(header_section)
+    # header size depends on offsets, so offsets are computed against upper bound of header size
+    placeholder = [[0xFFFFFFFFFFFFFFFF, len(x)] for x in blobs]
+    header_size = len(msgpack.packb({"alignment": alignment, "sections": header_sections, "blobs": placeholder}))
+    offset = _align(MAPPED_PREAMBLE.size + header_size, alignment)
+    locations = []
+    for blob in blobs:
+        locations.append([offset, len(blob)])
+        offset = _align(offset + len(blob), alignment)
+    header = msgpack.packb({"alignment": alignment, "sections": header_sections, "blobs": locations})
+
+    with open(path, "wb") as fp:
+        fp.write(MAPPED_PREAMBLE.pack(MAPPED_MAGIC, MAPPED_VERSION, len(header)))
+        fp.write(header)
+        for blob, (blob_offset, _) in zip(blobs, locations):
+            fp.write(b"\0" * (blob_offset - fp.tell()))
+            fp.write(blob)
+
+
+def write_addon(sections: List[Dict[Any, Any]], path: str, layout: str = "msgpack"):
+    """
+    Writes addon to disk
+
+    Parameters
+    ----------
+    sections: List[Dict[Any, Any]]
+        addon sections, one per locale
+    path: str
+        path to write addon to
+    layout: str
+        addon layout, one of `LAYOUTS`
+    """
+    if layout == "msgpack":
+        with open(path, "wb") as fp:
+            msgpack.dump(sections, fp)
+    elif layout == "mapped":
+        write_mapped_addon(sections, path)
+    else:
+        raise RuntimeError("Unknown addon layout: {}. Pick one from {}".format(layout, LAYOUTS))
+
+
+def is_mapped_addon(path: str) -> bool:
+    """
+    Checks if addon at given path has `mapped` layout
+    """
+    with open(path, "rb") as fp:
+        return fp.read(len(MAPPED_MAGIC)) == MAPPED_MAGIC
+
+
+class MappedAddon:
+    """
+    Reader of addon in `mapped` layout. File is memory-mapped, binary fields are
+    exposed as memoryviews into the mapping, so nothing is copied to heap and
+    pages are shared between processes mapping the same addon.
+    """
+
+    def __init__(self, path: str):
+        """
+        Parameters
+        ----------
+        path: str
+            path to the addon in `mapped` layout
+        """
+        self._path = path
+        with open(path, "rb") as fp:
+            self._mmap = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, header_size = MAPPED_PREAMBLE.unpack_from(self._mmap, 0)
+        if magic != MAPPED_MAGIC:
+            raise RuntimeError("{} is not an addon with mapped layout".format(path))
+        if version != MAPPED_VERSION:
+            raise RuntimeError("Unsupported version of mapped addon {}: {}".format(path, version))
+        header_start = MAPPED_PREAMBLE.size
+        self._header = msgpack.unpackb(
+            self._mmap[header_start: header_start + header_size], strict_map_key=False
+        )
+        self._view = memoryview(self._mmap)
+
+    def __len__(self) -> int:
+        return len(self._header["sections"])
+
+    def get_blob(self, section_idx: int, key: Any) -> memoryview:
+        """
+        Returns binary field of the section without copying it
+
+        Parameters
+        ----------
+        section_idx: int
+            index of the section in the addon
+        key: Any
+            name of binary field, for ex. `TextNormalizer.AddonFields.TOKENIZER`
+
+        Returns
+        -------
+        blob: memoryview
+            view into memory-mapped file
+        """
+        blob_idx = self._header["sections"][section_idx]["blobs"][key]
+        offset, size = self._header["blobs"][blob_idx]
+        return self._view[offset: offset + size]
+
+    def get_section(self, section_idx: int) -> Dict[Any, Union[Any, memoryview]]:
+        """
+        Returns section of the addon, where binary fields are memoryviews into memory-mapped file
+
+        Parameters
+        ----------
+        section_idx: int
+            index of the section in the addon
+
+        Returns
+        -------
+        section: Dict[Any, Union[Any, memoryview]]
+            fields of the section
+        """
+        header_section = self._header["sections"][section_idx]
+        section = dict(header_section["fields"])
+        for key in header_section["blobs"]:
+            section[key] = self.get_blob(section_idx, key)
+        return section
+
+    def get_sections(self) -> List[Dict[Any, Union[Any, memoryview]]]:
+        """
+        Returns
+        -------
+        sections: List[Dict[Any, Union[Any, memoryview]]]
+            all the sections of the addon, see :func:`.get_section`
+        """
+        return [self.get_section(i) for i in range(len(self))]
+
+    def get_layout(self) -> List[Dict[Any, List[int]]]:
+        """
+        Describes where binary fields are located, for inspection.
+
+        Returns
+        -------
+        layout: List[Dict[Any, List[int]]]
+            per section, mapping from binary field name to its offset and size in the file
+        """
+        return [
+            {key: self._header["blobs"][idx] for key, idx in section["blobs"].items()}
+            for section in self._header["sections"]
+        ]
+
+    def extract(self, section_idx: int, key: Any, out_path: str):
+        """
+        Stores binary field into a separate file, for ex. to inspect FAR with OpenFST tools.
+
+        Parameters
+        ----------
+        section_idx: int
+            index of the section in the addon
+        key: Any
+            name of binary field
+        out_path: str
+            path to store binary field to
+        """
+        with open(out_path, "wb") as fp:
+            fp.write(self.get_blob(section_idx, key))
+
+    def close(self):
+        """
+        Releases memory mapping. Views obtained from the addon should be released before that.
+        """
+        self._view.release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def read_addon(path: str) -> List[Dict[Any, Any]]:
+    """
+    Reads addon of any layout.
+
+    Parameters
+    ----------
+    path: str
+        path to the addon
+
+    Returns
+    -------
+    sections: List[Dict[Any, Any]]
+        addon sections. For `mapped` layout, binary fields are memoryviews into memory-mapped file.
+    """
+    if is_mapped_addon(path):
+        return MappedAddon(path).get_sections()
+    with open(path, "rb") as fp:
+        return msgpack.unpack(fp, strict_map_key=False)
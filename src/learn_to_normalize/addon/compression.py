@@ -0,0 +1,311 @@
+"""
+Copyright 2022 Balacoon
+
+Optional compression of binary fields (serialized FARs) of addon sections.
+Compressed sections are marked with `COMPRESSION_KEY` field. balacoon_frontend
+expects raw FARs, so compressed addons are meant for distribution and should be
+unpacked (see `compress_addon --codec none`) before they are loaded.
+Only `msgpack` layout can be compressed, `mapped` one stores raw FARs to memory-map them.
+"""
+
+import os
+import mmap
+import time
+import zlib
+import logging
+import argparse
+import tempfile
+from typing import Any, Callable, Dict, List, Tuple
+
+import msgpack
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+from learn_to_normalize.addon.addon_io import LAYOUTS, is_mapped_addon, read_addon, write_addon
+
+# field of a section that holds the name of codec binary fields are compressed with
+COMPRESSION_KEY = "compression"
+NO_COMPRESSION = "none"
+CODECS = [NO_COMPRESSION, "zlib", "lz4", "zstd"]
+# how `COMPRESSION_KEY` looks like in packed addon
+COMPRESSION_MARKER = msgpack.packb(COMPRESSION_KEY)
+
+
+def parse_args():
+    ap = argparse.ArgumentParser(
+        description="Compresses or decompresses binary fields of addon, "
+        "or reports size vs decompression time trade-off of available codecs",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    ap.add_argument("addon", help="Addon to process")
+    ap.add_argument("out", nargs="?", help="Path to store processed addon to")
+    ap.add_argument(
+        "--codec",
+        default="zstd",
+        choices=CODECS,
+        help="Codec to compress binary fields with. `none` decompresses the addon. "
+        "If codec is not installed, falls back to zlib",
+    )
+    ap.add_argument("--level", type=int, help="Compression level, by default - codec default")
+    ap.add_argument("--layout", choices=LAYOUTS, help="Layout of produced addon, by default - same as input")
+    ap.add_argument(
+        "--report",
+        action="store_true",
+        help="Instead of processing, measure compressed size and decompression time with all available codecs",
+    )
+    args = ap.parse_args()
+    if not args.report and not args.out:
+        ap.error("Path to store processed addon is required")
+    if not args.report and args.codec != NO_COMPRESSION and get_layout(args) == "mapped":
+        ap.error("Mapped layout stores uncompressed FARs to memory-map them, use `--layout msgpack` to compress")
+    return args
+
+
+def get_layout(args: argparse.Namespace) -> str:
+    """
+    layout of processed addon: requested one or the same as input
+    """
+    return args.layout or ("mapped" if is_mapped_addon(args.addon) else "msgpack")
+
+
+def get_available_codecs() -> List[str]:
+    """
+    Returns
+    -------
+    codecs: List[str]
+        codecs that can be used in current environment. zstd and lz4 require optional packages
+    """
+    available = [NO_COMPRESSION, "zlib"]
+    if lz4 is not None:
+        available.append("lz4")
+    if zstandard is not None:
+        available.append("zstd")
+    return available
+
+
+def resolve_codec(codec: str) -> str:
+    """
+    Falls back to zlib if requested codec is not installed
+    """
+    if codec not in CODECS:
+        raise RuntimeError("Unknown codec {}, pick one from {}".format(codec, CODECS))
+    if codec not in get_available_codecs():
+        logging.warning("{} is not installed, falling back to zlib".format(codec))
+        return "zlib"
+    return codec
+
+
+def _get_compressor(codec: str, level: int = None) -> Callable[[bytes], bytes]:
+    if codec == "zlib":
+        return lambda x: zlib.compress(x, 6 if level is None else level)
+    if codec == "lz4":
+        return lambda x: lz4.frame.compress(x, compression_level=0 if level is None else level)
+    if codec == "zstd":
+        compressor = zstandard.ZstdCompressor(level=3 if level is None else level)
+        return compressor.compress
+    raise RuntimeError("Can't compress with {}".format(codec))
+
+
+def _get_decompressor(codec: str) -> Callable[[bytes], bytes]:
+    if codec == "zlib":
+        return zlib.decompress
+    if codec == "lz4":
+        if lz4 is None:
+            raise RuntimeError("lz4 package is required to decompress the addon")
+        return lz4.frame.decompress
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard package is required to decompress the addon")
+        return zstandard.ZstdDecompressor().decompress
+    raise RuntimeError("Can't decompress {}".format(codec))
+
+
+def _is_binary(value: Any) -> bool:
+    return isinstance(value, (bytes, bytearray, memoryview))
+
+
+def is_compressed(section: Dict[Any, Any]) -> bool:
+    """
+    checks if binary fields of section are compressed
+    """
+    return section.get(COMPRESSION_KEY, NO_COMPRESSION) != NO_COMPRESSION
+
+
+def compress_section(section: Dict[Any, Any], codec: str, level: int = None) -> Dict[Any, Any]:
+    """
+    Compresses binary fields of addon section
+
+    Parameters
+    ----------
+    section: Dict[Any, Any]
+        addon section, possibly already compressed
+    codec: str
+        one of `CODECS`. If it is not installed, zlib is used. `none` decompresses the section
+    level: int
+        compression level, if None - default of the codec
+
+    Returns
+    -------
+    section: Dict[Any, Any]
+        new section with compressed binary fields and `COMPRESSION_KEY` field
+    """
+    section = decompress_section(section)
+    codec = resolve_codec(codec)
+    if codec == NO_COMPRESSION:
+        return section
+    compress = _get_compressor(codec, level)
+    compressed = {key: compress(bytes(value)) if _is_binary(value) else value for key, value in section.items()}
+    compressed[COMPRESSION_KEY] = codec
+    return compressed
+
+
+def decompress_section(section: Dict[Any, Any]) -> Dict[Any, Any]:
+    """
+    Restores raw binary fields of addon section. Uncompressed sections are returned as is
+
+    Parameters
+    ----------
+    section: Dict[Any, Any]
+        addon section
+
+    Returns
+    -------
+    section: Dict[Any, Any]
+        section with raw FARs, without `COMPRESSION_KEY` field
+    """
+    if not is_compressed(section):
+        return section
+    decompress = _get_decompressor(section[COMPRESSION_KEY])
+    return {
+        key: decompress(value) if _is_binary(value) else value
+        for key, value in section.items() if key != COMPRESSION_KEY
+    }
+
+
+def may_be_compressed(path: str) -> bool:
+    """
+    Cheap check whether addon can have compressed sections: looks for packed `COMPRESSION_KEY`
+    in the raw bytes of the file, without unpacking it. False positives are possible,
+    if FARs happen to contain the same bytes, so the addon has to be unpacked to be sure.
+
+    Parameters
+    ----------
+    path: str
+        path to the addon
+
+    Returns
+    -------
+    flag: bool
+        False if addon is certainly not compressed
+    """
+    if os.path.getsize(path) == 0:
+        return False
+    with open(path, "rb") as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        return data.find(COMPRESSION_MARKER) >= 0
+
+
+def ensure_uncompressed(path: str) -> str:
+    """
+    Returns path to addon that can be loaded by balacoon_frontend. If addon at given path
+    is compressed, it is unpacked into a temporary file.
+
+    Parameters
+    ----------
+    path: str
+        path to the addon
+
+    Returns
+    -------
+    path: str
+        same path if addon is not compressed, otherwise path to unpacked copy
+    """
+    if not may_be_compressed(path):
+        return path
+    if is_mapped_addon(path):
+        # header of mapped addon is small, FARs are not read
+        if any(is_compressed(x) for x in read_addon(path)):
+            raise RuntimeError("{} has mapped layout but compressed FARs, which can't be memory-mapped. "
+                               "Unpack it with `compress_addon --codec none`".format(path))
+        return path
+    sections = read_addon(path)
+    if not any(is_compressed(x) for x in sections):
+        return path
+    fd, unpacked_path = tempfile.mkstemp(suffix=".addon")
+    os.close(fd)
+    write_addon([decompress_section(x) for x in sections], unpacked_path)
+    logging.info("Unpacked compressed addon {} to {}".format(path, unpacked_path))
+    return unpacked_path
+
+
+def _measure(func: Callable[[], Any], repeat: int) -> float:
+    """
+    best time of several runs, in seconds
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def compare_codecs(blobs: List[bytes], level: int = None, repeat: int = 5) -> List[Tuple[str, int, float, float]]:
+    """
+    Measures how well available codecs compress given blobs and how fast they decompress
+
+    Parameters
+    ----------
+    blobs: List[bytes]
+        binary fields of an addon
+    level: int
+        compression level, if None - default of each codec
+    repeat: int
+        number of runs to measure time over, the best one is taken
+
+    Returns
+    -------
+    results: List[Tuple[str, int, float, float]]
+        codec, total compressed size, compression time and decompression time, in seconds
+    """
+    results = []
+    for codec in get_available_codecs():
+        if codec == NO_COMPRESSION:
+            results.append((codec, sum(len(x) for x in blobs), 0.0, 0.0))
+            continue
+        compress, decompress = _get_compressor(codec, level), _get_decompressor(codec)
+        compressed = [compress(x) for x in blobs]
+        compress_time = _measure(lambda: [compress(x) for x in blobs], 1)
+        decompress_time = _measure(lambda: [decompress(x) for x in compressed], repeat)
+        results.append((codec, sum(len(x) for x in compressed), compress_time, decompress_time))
+    return results
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    args = parse_args()
+    sections = [decompress_section(x) for x in read_addon(args.addon)]
+    if args.report:
+        blobs = [bytes(value) for section in sections for value in section.values() if _is_binary(value)]
+        results = compare_codecs(blobs, level=args.level)
+        raw_size = results[0][1]
+        logging.info("{:<8} {:>12} {:>8} {:>14} {:>16}".format(
+            "codec", "size", "ratio", "compress,ms", "decompress,ms"))
+        for codec, size, compress_time, decompress_time in results:
+            logging.info("{:<8} {:>12} {:>8.3f} {:>14.2f} {:>16.2f}".format(
+                codec, size, size / float(max(raw_size, 1)), 1000 * compress_time, 1000 * decompress_time))
+        missing = [x for x in CODECS if x not in get_available_codecs()]
+        if missing:
+            logging.info("Not installed: {}".format(", ".join(missing)))
+        return
+    layout = get_layout(args)
+    processed = [compress_section(x, args.codec, level=args.level) for x in sections]
+    write_addon(processed, args.out, layout=layout)
+    logging.info("Stored {} ({} -> {} bytes)".format(
+        args.out, os.path.getsize(args.addon), os.path.getsize(args.out)))
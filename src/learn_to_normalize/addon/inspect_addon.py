@@ -0,0 +1,308 @@
+"""
+Copyright 2022 Balacoon
+
+Tool to look inside of addons: sizes of sections, configs,
+statistics of FSTs stored in FARs. Two addons can be compared
+side by side, flagging size regressions, which increase load time
+and memory footprint of the frontend.
+"""
+
+import os
+import sys
+import difflib
+import logging
+import argparse
+import tempfile
+from typing import Any, Callable, Dict, List
+
+import msgpack
+import pynini
+import pywrapfst
+from balacoon_frontend import TextNormalizer as tn
+
+from learn_to_normalize.addon.addon_io import is_mapped_addon, read_addon
+from learn_to_normalize.addon.compression import COMPRESSION_KEY, NO_COMPRESSION, decompress_section
+
+# properties of FSTs to report. Sortedness and determinism define how fast composition is at runtime
+FST_PROPERTIES = [
+    ("acceptor", pynini.ACCEPTOR),
+    ("i_deterministic", pynini.I_DETERMINISTIC),
+    ("o_deterministic", pynini.O_DETERMINISTIC),
+    ("i_label_sorted", pynini.I_LABEL_SORTED),
+    ("o_label_sorted", pynini.O_LABEL_SORTED),
+    ("epsilons", pynini.EPSILONS),
+    ("weighted", pynini.WEIGHTED),
+    ("cyclic", pynini.CYCLIC),
+]
+CONFIG_FIELDS = [
+    tn.AddonFields.TOKENIZER_CONFIG,
+    tn.AddonFields.VERBALIZER_CONFIG,
+    tn.AddonFields.VERBALIZER_SPECIFICATION,
+]
+
+
+def parse_args():
+    ap = argparse.ArgumentParser(
+        description="Inspects addon with text normalization rules or compares two addons",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    subparsers = ap.add_subparsers(dest="command", required=True)
+    inspect_ap = subparsers.add_parser("inspect", help="Describes content of the addon")
+    inspect_ap.add_argument("addon", help="Addon to inspect")
+    inspect_ap.add_argument("--no-fst", action="store_true", help="Skip loading FSTs, only report sizes and configs")
+    inspect_ap.add_argument("--configs", action="store_true", help="Print contents of configs")
+    diff_ap = subparsers.add_parser("diff", help="Compares two addons")
+    diff_ap.add_argument("old", help="Reference addon, for ex. currently deployed one")
+    diff_ap.add_argument("new", help="Addon to compare against the reference")
+    diff_ap.add_argument("--no-fst", action="store_true", help="Skip loading FSTs, only compare sizes and configs")
+    diff_ap.add_argument(
+        "--max-growth",
+        default=0.05,
+        type=float,
+        help="Relative growth of addon or any of its binary fields, that is flagged as a regression. "
+        "If any regression is found, tool exits with non-zero code",
+    )
+    args = ap.parse_args()
+    return args
+
+
+def get_fst_stats(fst: pywrapfst.Fst) -> Dict[str, Any]:
+    """
+    Computes statistics of a single FST
+
+    Parameters
+    ----------
+    fst: pywrapfst.Fst
+        fst to describe, of any type
+
+    Returns
+    -------
+    stats: Dict[str, Any]
+        type of fst and arcs, number of states and arcs and properties from `FST_PROPERTIES`
+    """
+    stats = {
+        "fst_type": fst.fst_type(),
+        "arc_type": fst.arc_type(),
+        "states": sum(1 for _ in fst.states()),
+        "arcs": sum(fst.num_arcs(state) for state in fst.states()),
+    }
+    mask = FST_PROPERTIES[0][1]
+    for _, flag in FST_PROPERTIES[1:]:
+        mask |= flag
+    properties = fst.properties(mask, True)
+    for name, flag in FST_PROPERTIES:
+        stats[name] = bool(properties & flag)
+    return stats
+
+
+def get_far_stats(far_bytes: bytes) -> Dict[str, Dict[str, Any]]:
+    """
+    Describes FSTs stored in serialized FAR
+
+    Parameters
+    ----------
+    far_bytes: bytes
+        FAR as stored in addon
+
+    Returns
+    -------
+    stats: Dict[str, Dict[str, Any]]
+        rule name mapped to statistics of its fst, see :func:`get_fst_stats`
+    """
+    # FAR can only be read from a file
+    fd, far_path = tempfile.mkstemp(suffix=".far")
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(far_bytes)
+        # pywrapfst reader keeps fst types, while pynini converts everything to vector fsts
+        far = pywrapfst.FarReader.open(far_path)
+        stats = {}
+        while not far.done():
+            stats[far.get_key()] = get_fst_stats(far.get_fst())
+            far.next()
+        del far
+    finally:
+        os.remove(far_path)
+    return stats
+
+
+def _field_size(value: Any) -> int:
+    """
+    size of section field, as it contributes to the addon
+    """
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    return len(msgpack.packb(value))
+
+
+def describe_addon(path: str, with_fst: bool = True) -> Dict[str, Any]:
+    """
+    Describes content of the addon
+
+    Parameters
+    ----------
+    path: str
+        path to addon
+    with_fst: bool
+        if True, FARs are loaded to compute statistics of FSTs
+
+    Returns
+    -------
+    description: Dict[str, Any]
+        size and layout of the addon and description of each section:
+        locale, sizes of fields, names of binary fields (FARs), configs and statistics of FSTs
+    """
+    description = {
+        "path": path,
+        "size": os.path.getsize(path),
+        "layout": "mapped" if is_mapped_addon(path) else "msgpack",
+        "sections": [],
+    }
+    for idx, section in enumerate(read_addon(path)):
+        section_description = {
+            "locale": str(section.get(tn.AddonFields.LOCALE, idx)),
+            "compression": section.get(COMPRESSION_KEY, NO_COMPRESSION),
+            "sizes": {},
+            "binary": [],
+            "configs": {},
+            "fsts": {},
+        }
+        raw_section = decompress_section(section) if with_fst else section
+        for key, value in section.items():
+            name = key.decode("utf-8") if isinstance(key, bytes) else str(key)
+            section_description["sizes"][name] = _field_size(value)
+            if isinstance(value, (bytes, bytearray, memoryview)):
+                section_description["binary"].append(name)
+                if with_fst:
+                    section_description["fsts"][name] = get_far_stats(bytes(raw_section[key]))
+            elif key in CONFIG_FIELDS:
+                section_description["configs"][name] = value
+        description["sections"].append(section_description)
+    return description
+
+
+def _format_size(size: int) -> str:
+    for unit in ["B", "KB", "MB"]:
+        if abs(size) < 1024:
+            return "{:.1f}{}".format(size, unit) if unit != "B" else "{}B".format(size)
+        size /= 1024.0
+    return "{:.1f}GB".format(size)
+
+
+def report_description(description: Dict[str, Any], show_configs: bool = False):
+    """
+    Writes description of addon into the log
+    """
+    logging.info("{}: {}, {} layout, {} section(s)".format(
+        description["path"], _format_size(description["size"]), description["layout"],
+        len(description["sections"])))
+    for section in description["sections"]:
+        logging.info("Section [{}], compression: {}".format(section["locale"], section["compression"]))
+        for key, size in sorted(section["sizes"].items(), key=lambda x: -x[1]):
+            logging.info("  {:<28} {:>10}".format(key, _format_size(size)))
+        for key, rules in section["fsts"].items():
+            for rule, stats in rules.items():
+                flags = [name for name, _ in FST_PROPERTIES if stats[name]]
+                logging.info("  {}/{}: {} fst ({}), {} states, {} arcs, properties: {}".format(
+                    key, rule, stats["fst_type"], stats["arc_type"], stats["states"], stats["arcs"],
+                    ", ".join(flags) or "-"))
+        if show_configs:
+            for key, config in section["configs"].items():
+                logging.info("  {}:\n{}".format(key, config))
+
+
+def _growth(old: int, new: int) -> float:
+    if old == 0:
+        return float("inf") if new > 0 else 0.0
+    return (new - old) / float(old)
+
+
+def diff_descriptions(old: Dict[str, Any], new: Dict[str, Any], max_growth: float = 0.05) -> List[str]:
+    """
+    Compares two addons side by side, writing differences into the log
+
+    Parameters
+    ----------
+    old: Dict[str, Any]
+        description of reference addon, see :func:`describe_addon`
+    new: Dict[str, Any]
+        description of addon to compare
+    max_growth: float
+        relative growth of size that is considered to be a regression
+
+    Returns
+    -------
+    regressions: List[str]
+        descriptions of found size regressions
+    """
+    regressions = []
+    logging.info("{:<48} {:>10} {:>10} {:>9}".format("", "old", "new", "change"))
+
+    def _compare(name: str, old_value: int, new_value: int, check: bool, as_size: bool = True):
+        growth = _growth(old_value, new_value)
+        fmt = _format_size if as_size else str
+        mark = ""
+        if check and growth > max_growth:
+            mark = " <- regression"
+            regressions.append("{} grew by {:.1%}: {} -> {}".format(name, growth, fmt(old_value), fmt(new_value)))
+        logging.info("{:<48} {:>10} {:>10} {:>+8.1%}{}".format(name, fmt(old_value), fmt(new_value), growth, mark))
+
+    _compare("addon", old["size"], new["size"], check=True)
+    old_sections: Dict[str, Dict[str, Any]] = {x["locale"]: x for x in old["sections"]}
+    new_sections: Dict[str, Dict[str, Any]] = {x["locale"]: x for x in new["sections"]}
+    for locale in sorted(set(old_sections) | set(new_sections)):
+        if locale not in new_sections or locale not in old_sections:
+            logging.info("Section [{}] is only in {} addon".format(locale, "old" if locale in old_sections else "new"))
+            continue
+        _diff_sections(locale, old_sections[locale], new_sections[locale], _compare)
+    return regressions
+
+
+def _diff_sections(locale: str, old_section: Dict[str, Any], new_section: Dict[str, Any], compare: Callable):
+    """
+    compares sections of two addons with the same locale: sizes of fields,
+    statistics of FSTs and configs. `compare` logs a single compared value, see :func:`diff_descriptions`
+    """
+    binary = set(old_section["binary"]) | set(new_section["binary"])
+    for key in sorted(set(old_section["sizes"]) | set(new_section["sizes"])):
+        compare("[{}] {}".format(locale, key), old_section["sizes"].get(key, 0),
+                new_section["sizes"].get(key, 0), check=key in binary)
+    for key in sorted(set(old_section["fsts"]) & set(new_section["fsts"])):
+        old_rules, new_rules = old_section["fsts"][key], new_section["fsts"][key]
+        for rule in sorted(set(old_rules) & set(new_rules)):
+            name = "[{}] {}/{}".format(locale, key, rule)
+            _diff_fst_stats(name, old_rules[rule], new_rules[rule], compare)
+    for key in sorted(set(old_section["configs"]) | set(new_section["configs"])):
+        old_config = old_section["configs"].get(key, "").splitlines()
+        new_config = new_section["configs"].get(key, "").splitlines()
+        diff = list(difflib.unified_diff(old_config, new_config, "old", "new", lineterm=""))
+        if diff:
+            logging.info("[{}] {} differs:\n{}".format(locale, key, "\n".join(diff)))
+
+
+def _diff_fst_stats(name: str, old_stats: Dict[str, Any], new_stats: Dict[str, Any], compare: Callable):
+    """
+    compares statistics of the same fst in two addons, see :func:`get_fst_stats`
+    """
+    for stat in ["states", "arcs"]:
+        compare("{} {}".format(name, stat), old_stats[stat], new_stats[stat], check=False, as_size=False)
+    for prop, _ in FST_PROPERTIES + [("fst_type", None)]:
+        if old_stats[prop] != new_stats[prop]:
+            logging.info("{} {}: {} -> {}".format(name, prop, old_stats[prop], new_stats[prop]))
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    args = parse_args()
+    if args.command == "inspect":
+        report_description(describe_addon(args.addon, with_fst=not args.no_fst), show_configs=args.configs)
+        return
+    old = describe_addon(args.old, with_fst=not args.no_fst)
+    new = describe_addon(args.new, with_fst=not args.no_fst)
+    regressions = diff_descriptions(old, new, max_growth=args.max_growth)
+    if regressions:
+        for regression in regressions:
+            logging.warning("Size regression: {}".format(regression))
+        sys.exit(1)
@@ -0,0 +1,186 @@
+"""
+Copyright 2022 Balacoon
+
+Benchmark of grammars exported as different FST types.
+For each type, FAR is loaded in a fresh process, which reports
+size on disk, load time and memory it takes. Tokenizer is also
+applied to inputs from a corpus, same as runtime does, to measure tokenizer latency,
+i.e. composition of input with tokenizer and search of the best path. Verbalizer is applied
+per token, so its latency is not measured, and reported latency is not the latency of whole normalization.
+"""
+
+import os
+import time
+import logging
+import argparse
+import resource
+import tempfile
+import multiprocessing
+from typing import Any, Dict, List, Tuple
+
+import pynini
+import pywrapfst
+
+from learn_to_normalize.evaluation.data_iterator_factory import get_data_iterator, get_supported_datasets
+from learn_to_normalize.grammar_utils.fst_types import DEFAULT_FST_TYPE, get_supported_fst_types, write_far
+from learn_to_normalize.grammar_utils.grammar_loader import GrammarLoader
+
+# grammar name -> module, class and rule name under which fst is stored in addon FAR
+GRAMMARS = {
+    "tokenizer": ("classify.classify", "ClassifyFst", "TOKENIZE_AND_CLASSIFY"),
+    "verbalizer": ("verbalize.verbalize", "VerbalizeFst", "ALL"),
+}
+
+
+def parse_args():
+    ap = argparse.ArgumentParser(
+        description="Compares size, load time, memory and tokenizer latency of grammars "
+        "exported as different FST types",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    ap.add_argument("--grammars", required=True, help="Directory with grammars")
+    ap.add_argument(
+        "--dataset",
+        required=True,
+        choices=get_supported_datasets(),
+        help="Dataset name, defines how to parse data from datadir",
+    )
+    ap.add_argument("--datadir", required=True, help="Location of the data, see `evaluate`")
+    ap.add_argument("--subset", default="test", help="Subset of the data to take inputs from")
+    ap.add_argument("--num", default=1000, type=int, help="Number of utterances to benchmark on")
+    ap.add_argument(
+        "--types",
+        nargs="+",
+        help="FST types to benchmark. By default - all types supported by current OpenFST build",
+    )
+    ap.add_argument(
+        "--fsts",
+        nargs="+",
+        default=["tokenizer", "verbalizer"],
+        choices=list(GRAMMARS.keys()),
+        help="Grammars to benchmark",
+    )
+    ap.add_argument("--work-dir", help="Directory to store FARs to. By default - temporary directory")
+    args = ap.parse_args()
+    return args
+
+
+def _get_rss() -> int:
+    """
+    resident memory of current process in bytes
+    """
+    try:
+        with open("/proc/self/statm", "r") as fp:
+            return int(fp.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # peak memory is the best estimate outside of linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _benchmark_far(job: Tuple[str, List[str]]) -> Dict[str, Any]:
+    """
+    Loads FAR and applies it to inputs if any. Runs in a fresh process,
+    so that memory taken by the fst can be measured.
+    """
+    far_path, texts = job
+    rss_before = _get_rss()
+    start = time.perf_counter()
+    reader = pywrapfst.FarReader.open(far_path)
+    fst = reader.get_fst()
+    load_time = time.perf_counter() - start
+    rss = _get_rss() - rss_before
+    latencies, outputs = [], []
+    for text in texts:
+        start = time.perf_counter()
+        try:
+            lattice = pywrapfst.compose(pynini.accep(pynini.escape(text)), fst)
+            best = pywrapfst.shortestpath(lattice, nshortest=1, unique=True)
+            latencies.append(time.perf_counter() - start)
+            outputs.append(pynini.Fst.from_pywrapfst(best).string())
+        except Exception:
+            outputs.append(None)
+    return {"fst_type": fst.fst_type(), "load_time": load_time, "rss": rss,
+            "latencies": latencies, "outputs": outputs}
+
+
+def _percentile(values: List[float], share: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(int(share * len(values)), len(values) - 1)]
+
+
+def _export(fst: pynini.Fst, rule_name: str, fst_types: List[str], work_dir: str,
+            prefix: str) -> List[Tuple[str, str, int]]:
+    """
+    stores fst as each of the types, skipping types fst can't be converted to.
+    Returns fst type, path to FAR and its size
+    """
+    exported = []
+    for fst_type in fst_types:
+        far_path = os.path.join(work_dir, "{}.{}.far".format(prefix, fst_type))
+        try:
+            write_far(fst, rule_name, far_path, fst_type=fst_type)
+        except RuntimeError as e:
+            logging.warning("Skipping {} {}: {}".format(prefix, fst_type, e))
+            continue
+        exported.append((fst_type, far_path, os.path.getsize(far_path)))
+    return exported
+
+
+def report(rows: List[Tuple[str, str, int, Dict[str, Any]]]):
+    """
+    Writes benchmark results into the log. Outputs of each grammar are compared
+    against outputs of its default export, which is what runtime uses
+    """
+    logging.info("{:<12} {:<20} {:>10} {:>10} {:>10} {:>12} {:>12} {:>8} {:>10}".format(
+        "fst", "fst type", "size,KB", "load,ms", "rss,MB", "tok.mean,ms", "tok.p95,ms", "failed", "mismatch"))
+    references = {name: result["outputs"] for name, fst_type, _, result in rows if fst_type == DEFAULT_FST_TYPE}
+    for name, _, size, result in rows:
+        latencies = result["latencies"]
+        mismatches = "-"
+        if name in references:
+            mismatches = sum(x != y for x, y in zip(references[name], result["outputs"]))
+        logging.info("{:<12} {:<20} {:>10.1f} {:>10.2f} {:>10.2f} {:>12.3f} {:>12.3f} {:>8} {:>10}".format(
+            name, result["fst_type"], size / 1024.0, 1000 * result["load_time"],
+            result["rss"] / 1024.0 / 1024.0, 1000 * sum(latencies) / max(len(latencies), 1),
+            1000 * _percentile(latencies, 0.95), result["outputs"].count(None), mismatches))
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+
+    fst_types = args.types or get_supported_fst_types()
+    # default export is the reference for outputs, it is always benchmarked first
+    fst_types = [DEFAULT_FST_TYPE] + [x for x in fst_types if x != DEFAULT_FST_TYPE]
+    loader = GrammarLoader(args.grammars)
+    data_iterator = get_data_iterator(name=args.dataset, location=args.datadir, subset=args.subset,
+                                      n_utterances=args.num)
+    texts = [unnormalized for unnormalized, _ in data_iterator]
+
+    rows = []  # (grammar, fst type, size, benchmark result)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        work_dir = args.work_dir or tmp_dir
+        os.makedirs(work_dir, exist_ok=True)
+        # each FAR is loaded in a fresh process, one at a time, so measurements don't interfere
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(processes=1, maxtasksperchild=1) as pool:
+            for name in args.fsts:
+                module, cls, rule_name = GRAMMARS[name]
+                fst = loader.get_grammar(module, cls).fst
+                exported = _export(fst, rule_name, fst_types, work_dir, name)
+                if not exported:
+                    logging.warning("{} couldn't be exported as any of {}".format(name, fst_types))
+                    continue
+                inputs = texts if name == "tokenizer" else []
+                results = pool.map(_benchmark_far, [(path, inputs) for _, path, _ in exported], chunksize=1)
+                rows.extend((name, fst_type, size, result)
+                            for (fst_type, _, size), result in zip(exported, results))
+
+    if not rows:
+        logging.warning("Nothing to benchmark")
+        return
+    logging.info("Benchmarked on {} utterances. Latency is of tokenizer only (composition with input "
+                 "and best path search), verbalization is not measured".format(len(texts)))
+    report(rows)
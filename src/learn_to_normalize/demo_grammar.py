@@ -1,16 +1,23 @@
 """
 Copyright 2022 Balacoon
 
-Interactive demo for specific grammar
+Interactive demo for specific grammar.
+In watch mode, grammar is rebuilt whenever grammar files change
+and inputs from a probe file are re-run through it, showing what changed.
+Only affected modules are reloaded, but the grammar fst is rebuilt in full.
 """
 
 import argparse
 import logging
 import sys
+import time
+from typing import Dict, List, Optional
 
 import pynini
 
+from learn_to_normalize.grammar_utils.base_fst import BaseFst, LatticeSizeError
 from learn_to_normalize.grammar_utils.grammar_loader import GrammarLoader
+from learn_to_normalize.grammar_utils.grammar_watcher import GrammarWatcher
 
 
 def parse_args():
@@ -26,20 +33,148 @@ def parse_args():
         required=True,
         help="Grammar class to use test, for ex. AbbreviationFst",
     )
+    ap.add_argument(
+        "--lattice-stats",
+        action="store_true",
+        help="Report size of the lattice and time of composition / best path search for each input",
+    )
+    ap.add_argument(
+        "--prune-weight",
+        type=float,
+        help="If provided, prunes paths of the lattice worse than the best one by this threshold",
+    )
+    ap.add_argument(
+        "--max-lattice-states",
+        default=-1,
+        type=int,
+        help="If > 0, inputs producing larger lattices are reported as errors",
+    )
+    ap.add_argument(
+        "--probe",
+        help="File with inputs, one per line, to run through the grammar instead of reading stdin",
+    )
+    ap.add_argument(
+        "--watch",
+        action="store_true",
+        help="Watch grammar modules and data files, rebuilding the grammar on changes "
+        "and showing how outputs for --probe inputs changed. Only modules affected by a change are reloaded, "
+        "but the grammar is rebuilt in full, including its sub-grammars",
+    )
+    ap.add_argument("--interval", default=1.0, type=float, help="How often to check for changes in watch mode, sec")
     args = ap.parse_args()
+    if args.watch and not args.probe:
+        ap.error("--watch requires --probe")
     return args
 
 
+def apply_grammar(grammar: BaseFst, line: str, args: argparse.Namespace) -> Optional[str]:
+    """
+    Applies grammar to a single input, reporting lattice stats if requested.
+    Returns None if lattice is too big
+    """
+    stats = {} if args.lattice_stats else None
+    try:
+        result = grammar.apply(pynini.escape(line), prune_weight=args.prune_weight,
+                               max_lattice_states=args.max_lattice_states, stats=stats)
+    except LatticeSizeError as e:
+        logging.error(str(e))
+        return None
+    if stats:
+        pruned = ""
+        if "pruned_states" in stats:
+            pruned = " ({} states, {} arcs after pruning)".format(stats["pruned_states"], stats["pruned_arcs"])
+        logging.info("lattice: {} states, {} arcs{}, compose {:.2f}ms, shortest path {:.2f}ms".format(
+            stats["states"], stats["arcs"], pruned, 1000 * stats["compose_time"],
+            1000 * stats["shortestpath_time"]))
+    return result
+
+
+def read_probe(path: str) -> List[str]:
+    """
+    reads non-empty lines of the probe file
+    """
+    with open(path, "r", encoding="utf-8") as fp:
+        return [line.strip() for line in fp if line.strip()]
+
+
+def run_probe(grammar: BaseFst, texts: List[str], args: argparse.Namespace) -> Dict[str, str]:
+    """
+    Applies grammar to probe inputs, returns outputs for each input.
+    Inputs grammar fails on get an error description as output
+    """
+    outputs = {}
+    for text in texts:
+        try:
+            result = apply_grammar(grammar, text, args)
+            outputs[text] = "<lattice is too big>" if result is None else result
+        except Exception as e:
+            outputs[text] = "<failed: {}>".format(e)
+    return outputs
+
+
+def watch(loader: GrammarLoader, args: argparse.Namespace, outputs: Dict[str, str]):
+    """
+    Rebuilds grammar when grammar files change and shows how outputs for probe inputs changed.
+    Only modules affected by the change are reloaded, see :class:`GrammarWatcher`,
+    while the grammar is rebuilt in full, so build time includes all of its sub-grammars.
+    """
+    watcher = GrammarWatcher(loader, extra_paths=[args.probe])
+    logging.info("Watching {} for changes, press Ctrl+C to stop".format(loader.grammars_dir))
+    pending = set()  # changes that are not applied yet, for ex. because of errors in grammars
+    while True:
+        time.sleep(args.interval)
+        changed = watcher.poll()
+        if not changed:
+            continue
+        logging.info("Changed: {}".format(", ".join(changed)))
+        pending.update(changed)
+        start = time.perf_counter()
+        try:
+            reloaded = watcher.reload(sorted(pending))
+            grammar = loader.get_grammar(args.module, args.name)
+        except Exception as e:
+            # grammar is probably in the middle of editing
+            logging.error("Failed to rebuild {}: {}: {}".format(args.name, type(e).__name__, e))
+            continue
+        pending = set()
+        build_time = time.perf_counter() - start
+        start = time.perf_counter()
+        new_outputs = run_probe(grammar, read_probe(args.probe), args)
+        probe_time = time.perf_counter() - start
+        diffs = 0
+        for text, result in new_outputs.items():
+            if outputs.get(text) != result:
+                diffs += 1
+                logging.info("{}\n  - {}\n  + {}".format(text, outputs.get(text, "<new input>"), result))
+        logging.info("Reloaded {} module(s), rebuilt {} in {:.2f}s, probe of {} inputs in {:.2f}s, {} changed".format(
+            len(reloaded), args.name, build_time, len(new_outputs), probe_time, diffs))
+        outputs = new_outputs
+
+
 def main():
     logging.basicConfig(level=logging.INFO)
     args = parse_args()
 
     loader = GrammarLoader(args.grammars)
+    start = time.perf_counter()
     grammar = loader.get_grammar(args.module, args.name)
-    logging.info("Provide input for {} grammar and press ENTER:".format(args.name))
+    logging.info("Built {} in {:.2f}s".format(args.name, time.perf_counter() - start))
 
+    if args.probe:
+        start = time.perf_counter()
+        outputs = run_probe(grammar, read_probe(args.probe), args)
+        for text, result in outputs.items():
+            logging.info("{}\n  {}".format(text, result))
+        logging.info("Probe of {} inputs in {:.2f}s".format(len(outputs), time.perf_counter() - start))
+        if args.watch:
+            try:
+                watch(loader, args, outputs)
+            except KeyboardInterrupt:
+                logging.info("Stopped watching")
+        return
+
+    logging.info("Provide input for {} grammar and press ENTER:".format(args.name))
     for line in sys.stdin:
-        line = line.strip()
-        text = pynini.escape(line)
-        result = grammar.apply(text)
-        logging.info(result)
+        result = apply_grammar(grammar, line.strip(), args)
+        if result is not None:
+            logging.info(result)
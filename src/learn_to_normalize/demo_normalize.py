@@ -8,7 +8,7 @@ import time
 import logging
 import argparse
 
-from balacoon_frontend import TextNormalizer
+from learn_to_normalize.normalizers.normalizer_factory import add_normalizer_args, create_normalizer, close_normalizer
 
 
 def parse_args():
@@ -27,6 +27,7 @@ def parse_args():
         "--file",
         help="If provided, reads utterances to normalize from a file"
     )
+    add_normalizer_args(ap)
     args = ap.parse_args()
     return args
 
@@ -35,7 +36,7 @@ def main():
     logging.basicConfig(level=logging.INFO)
     args = parse_args()
 
-    normalizer = TextNormalizer(args.addon, args.locale)
+    normalizer = create_normalizer(args.addon, args.locale, args)
     if args.file:
         num = 0
         elapsed = 0
@@ -48,10 +49,14 @@ def main():
                     elapsed += time.time() - start
                     num += 1
         logging.info("Normalizing at {} seconds / utterance".format(elapsed / float(num)))
+        close_normalizer(normalizer)
     else:
-        while True:
-            utterance = input("Enter text: ")
-            if not utterance:
-                logging.info("No normalization for empty string")
-                continue
-            logging.info(normalizer.normalize(utterance))
+        try:
+            while True:
+                utterance = input("Enter text: ")
+                if not utterance:
+                    logging.info("No normalization for empty string")
+                    continue
+                logging.info(normalizer.normalize(utterance))
+        except (EOFError, KeyboardInterrupt):
+            close_normalizer(normalizer)
@@ -17,6 +17,15 @@ Text-normalization datasets supported:
     :toctree: generated
 
     learn_to_normalize.evaluation.google_data
+    learn_to_normalize.evaluation.pair_data_iterators
+
+In-house formats can be plugged in without modifying this package,
+by registering data iterators:
+
+.. autosummary::
+    :toctree: generated
+
+    learn_to_normalize.evaluation.dataset_registry
 
 In order to run evaluation and generate report with mismatches:
 
@@ -28,5 +37,19 @@ In order to run evaluation and generate report with mismatches:
     evaluate --addon work_dir/normalization.addon --dataset google_en
         --datadir src/learn_to_normalize/evaluation/google_data/en_with_types/
         --subset test --log report.txt
+    # google data can be read directly from the archive downloaded from Kaggle
+    evaluate --addon work_dir/normalization.addon --dataset google_en
+        --datadir en_with_types.tgz.zip --subset test
+    # store a record per utterance for later analysis (parquet requires pyarrow)
+    evaluate --addon work_dir/normalization.addon --dataset google_en
+        --datadir en_with_types.tgz.zip --subset all --results results.parquet
+    # evaluate on tab-separated pairs streamed from another job
+    sample_production_text | evaluate --addon work_dir/normalization.addon --dataset stdin --datadir -
+    # normalize each repeated utterance only once, reporting unique-level metrics additionally
+    evaluate --addon work_dir/normalization.addon --dataset google_en
+        --datadir en_with_types.tgz.zip --subset all --dedup 1000000
+    # compare candidate addons side by side in a single pass over the data
+    evaluate --addon deployed.addon work_dir/normalization.addon --dataset google_en
+        --datadir en_with_types.tgz.zip --subset test --log comparison.txt
 
 """
\ No newline at end of file
@@ -5,11 +5,19 @@ base class data iterator.
 shows interface that data interator should implement
 """
 
-from typing import Tuple
+from typing import List, Tuple
 from abc import ABC, abstractmethod
 
 
 class DataIterator(ABC):
+    # capabilities of data iterator, overridden by implementations:
+    # whether position in the data can be stored with `tell` and restored with `seek`
+    SUPPORTS_SEEKING = False
+    # whether `shard` is implemented natively, without reading the whole data
+    SUPPORTS_SHARDING = False
+    # whether `estimate_length` returns an estimate
+    SUPPORTS_LENGTH_ESTIMATION = False
+
     def __init__(self, location: str, subset: str = "test", n_utterances: int = -1):
         """
         creates data iterator
@@ -47,3 +55,97 @@ class DataIterator(ABC):
             pair of strings: original and normalized utterances.
         """
         pass
+
+    def get_semiotic_classes(self) -> List[str]:
+        """
+        Semiotic classes present in the utterance that was returned last.
+        Data iterators that have no such annotation return an empty list.
+
+        Returns
+        -------
+        classes: List[str]
+            semiotic classes of the last utterance
+        """
+        return []
+
+    def get_token_spans(self) -> List[Tuple[str, int, int]]:
+        """
+        Boundaries of annotated tokens in normalized version of the utterance that was returned last.
+        Allows to compute token-level metrics. Data iterators that have no token annotation
+        return an empty list.
+
+        Returns
+        -------
+        spans: List[Tuple[str, int, int]]
+            semiotic class, index of the first word and index past the last word of each token
+            in whitespace-split normalized utterance
+        """
+        return []
+
+    def estimate_length(self) -> int:
+        """
+        Estimates number of utterances to iterate over, without reading all the data.
+
+        Returns
+        -------
+        length: int
+            approximate number of utterances, -1 if data iterator can't estimate it
+        """
+        return -1
+
+    def tell(self) -> int:
+        """
+        Returns position in the data, that can be passed to :func:`.seek`
+        to resume iteration from the next utterance. Only supported if `SUPPORTS_SEEKING`.
+        """
+        raise RuntimeError("{} doesn't support seeking".format(type(self).__name__))
+
+    def seek(self, position: int):
+        """
+        Resumes iteration from a position previously returned by :func:`.tell`.
+        Only supported if `SUPPORTS_SEEKING`.
+        """
+        raise RuntimeError("{} doesn't support seeking".format(type(self).__name__))
+
+    def shard(self, index: int, count: int) -> "DataIterator":
+        """
+        Deterministically splits the data into `count` non-overlapping shards.
+        By default every `count`-th utterance is taken, which requires reading all the data.
+        Data iterators that `SUPPORTS_SHARDING` split the data without reading it all.
+
+        Parameters
+        ----------
+        index: int
+            index of the shard to iterate over, from 0 to count - 1
+        count: int
+            total number of shards
+
+        Returns
+        -------
+        data_iterator: DataIterator
+            iterator over the shard
+        """
+        from learn_to_normalize.evaluation.sampling import ShardedDataIterator
+        return ShardedDataIterator(self, index, count)
+
+    def sample(self, n: int, seed: int = 0, stratified: bool = False) -> "DataIterator":
+        """
+        Reproducibly samples `n` utterances, reading the data once
+        and keeping only the sample in memory.
+
+        Parameters
+        ----------
+        n: int
+            number of utterances to sample
+        seed: int
+            random seed
+        stratified: bool
+            if True, sample is balanced across semiotic classes
+
+        Returns
+        -------
+        data_iterator: DataIterator
+            iterator over the sample
+        """
+        from learn_to_normalize.evaluation.sampling import SampledDataIterator
+        return SampledDataIterator(self, n, seed=seed, stratified=stratified)
@@ -9,26 +9,40 @@ from enum import Enum
 from typing import List
 
 from learn_to_normalize.evaluation.data_iterator import DataIterator
-from learn_to_normalize.evaluation.google_data.google_data_iterator import GoogleDataIterator
+from learn_to_normalize.evaluation.dataset_registry import describe_capabilities, get_registered_datasets
+
+# modules with built-in data iterators, importing them registers the datasets
+import learn_to_normalize.evaluation.google_data.google_data_iterator  # noqa: F401
+import learn_to_normalize.evaluation.pair_data_iterators  # noqa: F401
 
 
 class Datasets(Enum):
     """
-    Names of datasets supported for evalation
+    Names of datasets supported for evalation out of the box.
+    More can be added with :func:`learn_to_normalize.evaluation.dataset_registry.register_dataset`
     """
     GOOGLE_EN = "google_en"
 
 
 def get_supported_datasets() -> List[str]:
     """
-    helper function that returns all supported dataset names
+    helper function that returns all supported dataset names,
+    including ones registered by other packages
 
     Returns
     -------
     res: List[str]
         list of names that can be passed to :func:`.get_data_iterator`
     """
-    return [x.value for x in Datasets]
+    return sorted(get_registered_datasets())
+
+
+def describe_datasets() -> str:
+    """
+    human readable list of supported datasets and their capabilities
+    """
+    datasets = get_registered_datasets()
+    return "\n".join("`{}` - {}".format(name, describe_capabilities(datasets[name])) for name in sorted(datasets))
 
 
 def get_data_iterator(name: str, location: str, subset: str, n_utterances: int = -1) -> DataIterator:
@@ -41,14 +55,15 @@ def get_data_iterator(name: str, location: str, subset: str, n_utterances: int =
         dataset name, check :func:`get_supported_datasets` for the
         list of possible values.
     location: str
-        downloaded and unpacked directory with the dataset
+        downloaded and unpacked directory with the dataset.
+        Google data can also be read directly from downloaded archive.
     subset: str
         Subset of the data to iterate through. Passed to data iterator
     n_utterances: int
         if > 0, reads only first n_utterances from the subset
     """
-    if name == Datasets.GOOGLE_EN.value:
-        return GoogleDataIterator(location=location, subset=subset, n_utterances=n_utterances)
-    else:
+    datasets = get_registered_datasets()
+    if name not in datasets:
         raise RuntimeError("Unknown dataset: {}. Please pick one from the list {}".format(
             name, str(get_supported_datasets())))
+    return datasets[name](location=location, subset=subset, n_utterances=n_utterances)
@@ -0,0 +1,166 @@
+"""
+Copyright 2022 Balacoon
+
+helpers to stream text data files directly from
+compressed files and archives, without unpacking them on disk.
+"""
+
+import io
+import os
+import bz2
+import glob
+import gzip
+import lzma
+import tarfile
+import zipfile
+from typing import BinaryIO, Iterator, Set, TextIO, Tuple
+
+# large buffers amortize decompression and reading calls
+DEFAULT_BUFFER_SIZE = 16 * 1024 * 1024
+
+COMPRESSED_SUFFIXES = {
+    ".gz": lambda x: gzip.GzipFile(fileobj=x, mode="rb"),
+    ".bz2": lambda x: bz2.BZ2File(x, mode="rb"),
+    ".xz": lambda x: lzma.LZMAFile(x, mode="rb"),
+}
+TAR_SUFFIXES = (".tar", ".tgz", ".tar.gz", ".tbz2", ".tar.bz2", ".txz", ".tar.xz")
+
+
+def strip_compression_suffix(name: str) -> str:
+    """
+    Returns base name of data file without compression suffix,
+    for ex. "output-00099-of-00100" for "data/output-00099-of-00100.gz"
+    """
+    name = os.path.basename(name)
+    root, ext = os.path.splitext(name)
+    return root if ext in COMPRESSED_SUFFIXES else name
+
+
+def is_archive(name: str) -> bool:
+    """
+    checks if data file is an archive with multiple data files
+    """
+    return name.endswith(TAR_SUFFIXES) or name.endswith(".zip")
+
+
+class _SequentialReader(io.RawIOBase):
+    """
+    Adapter for members of streamed tar archive, which can't be seeked
+    and don't implement the full io interface.
+    """
+
+    def __init__(self, fileobj: BinaryIO):
+        self._fileobj = fileobj
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return False
+
+    def readinto(self, buffer) -> int:
+        data = self._fileobj.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def _to_text(fileobj: BinaryIO, name: str, buffer_size: int) -> TextIO:
+    """
+    wraps binary stream into buffered text stream, decompressing it depending on the name
+    """
+    _, ext = os.path.splitext(name)
+    if ext in COMPRESSED_SUFFIXES:
+        # decompress in large chunks
+        fileobj = io.BufferedReader(COMPRESSED_SUFFIXES[ext](fileobj), buffer_size=buffer_size)
+    return io.TextIOWrapper(fileobj, encoding="utf-8")
+
+
+def open_text(path: str, buffer_size: int = DEFAULT_BUFFER_SIZE) -> TextIO:
+    """
+    Opens plain or compressed (gzip, bz2, xz - by extension) text file for reading
+
+    Parameters
+    ----------
+    path: str
+        path to the file to open
+    buffer_size: int
+        size of read buffer
+
+    Returns
+    -------
+    stream: TextIO
+        text stream with decompressed content
+    """
+    return _to_text(open(path, "rb", buffering=buffer_size), path, buffer_size)
+
+
+def _is_selected(name: str, names: Set[str]) -> bool:
+    """
+    checks if data file passes the filter by base name
+    """
+    return not names or strip_compression_suffix(name) in names
+
+
+def _iter_tar(fileobj: BinaryIO, names: Set[str], buffer_size: int) -> Iterator[Tuple[str, TextIO]]:
+    """
+    iterates over members of tar archive sequentially, so archive is never unpacked on disk
+    """
+    with tarfile.open(fileobj=fileobj, mode="r|*", bufsize=buffer_size) as tar:
+        for member in tar:
+            if member.isfile() and not is_archive(member.name) and _is_selected(member.name, names):
+                member_file = io.BufferedReader(_SequentialReader(tar.extractfile(member)), buffer_size=buffer_size)
+                yield member.name, _to_text(member_file, member.name, buffer_size)
+
+
+def _iter_archive(path: str, names: Set[str], buffer_size: int) -> Iterator[Tuple[str, TextIO]]:
+    """
+    iterates over data files in tar or zip archive. Zip archives may contain
+    tar archives (this is how Kaggle distributes google data: `en_with_types.tgz.zip`)
+    """
+    if not path.endswith(".zip"):
+        with open(path, "rb", buffering=buffer_size) as fp:
+            yield from _iter_tar(fp, names, buffer_size)
+        return
+    with zipfile.ZipFile(path) as archive:
+        for info in archive.infolist():
+            if info.is_dir():
+                continue
+            if info.filename.endswith(TAR_SUFFIXES):
+                with archive.open(info) as fp:
+                    yield from _iter_tar(fp, names, buffer_size)
+            elif _is_selected(info.filename, names):
+                yield info.filename, _to_text(archive.open(info), info.filename, buffer_size)
+
+
+def iter_text_streams(
+    location: str, names: Set[str] = None, buffer_size: int = DEFAULT_BUFFER_SIZE
+) -> Iterator[Tuple[str, TextIO]]:
+    """
+    Iterates over data files at given location, opening them as text streams.
+    Location can be a directory, a single (possibly compressed) file or an archive.
+    Directories can contain compressed files and archives as well.
+    Streams should be consumed before requesting the next one, since archives are read sequentially.
+
+    Parameters
+    ----------
+    location: str
+        where to look for the data files
+    names: Set[str]
+        if provided, only data files with those base names (without compression suffix) are opened
+    buffer_size: int
+        size of read buffers
+
+    Returns
+    -------
+    streams: Iterator[Tuple[str, TextIO]]
+        name of the data file and text stream to read it from
+    """
+    if os.path.isdir(location):
+        paths = sorted(glob.glob(os.path.join(location, "*")))
+    else:
+        paths = [location]
+    for path in paths:
+        if is_archive(path):
+            yield from _iter_archive(path, names, buffer_size)
+        elif os.path.isfile(path) and _is_selected(path, names):
+            yield path, open_text(path, buffer_size)
@@ -0,0 +1,100 @@
+"""
+Copyright 2022 Balacoon
+
+registry of data iterators that can be used for evaluation.
+Data iterators are registered either with :func:`register_dataset` decorator
+or, from other packages, via entry points of `learn_to_normalize.datasets` group:
+
+.. code-block::
+
+    # setup.py of the package with in-house data iterator
+    entry_points={
+        "learn_to_normalize.datasets": [
+            "my_format = my_package.my_module:MyDataIterator",
+        ],
+    }
+"""
+
+import logging
+from typing import Callable, Dict, List, Type
+
+from learn_to_normalize.evaluation.data_iterator import DataIterator
+
+ENTRY_POINTS_GROUP = "learn_to_normalize.datasets"
+
+_REGISTRY: Dict[str, Type[DataIterator]] = {}
+_entry_points_loaded = False
+
+
+def register_dataset(name: str) -> Callable[[Type[DataIterator]], Type[DataIterator]]:
+    """
+    Class decorator that registers data iterator under dataset name
+
+    Parameters
+    ----------
+    name: str
+        dataset name, which is passed to `evaluate --dataset`
+
+    Returns
+    -------
+    decorator: Callable[[Type[DataIterator]], Type[DataIterator]]
+        decorator that registers the class and returns it unchanged
+    """
+    def decorator(cls: Type[DataIterator]) -> Type[DataIterator]:
+        if not issubclass(cls, DataIterator):
+            raise RuntimeError("{} registered as {} should inherit DataIterator".format(cls.__name__, name))
+        registered = _REGISTRY.get(name)
+        if registered is not None and registered is not cls:
+            raise RuntimeError("Dataset {} is already registered by {}".format(name, registered.__name__))
+        _REGISTRY[name] = cls
+        return cls
+    return decorator
+
+
+def _load_entry_points():
+    """
+    registers data iterators declared by installed packages
+    """
+    global _entry_points_loaded
+    if _entry_points_loaded:
+        return
+    _entry_points_loaded = True
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        return
+    eps = entry_points()
+    # python < 3.10 returns a dict of groups
+    group = eps.select(group=ENTRY_POINTS_GROUP) if hasattr(eps, "select") else eps.get(ENTRY_POINTS_GROUP, [])
+    for entry_point in group:
+        if entry_point.name in _REGISTRY:
+            continue
+        try:
+            register_dataset(entry_point.name)(entry_point.load())
+        except Exception as e:
+            logging.warning("Failed to load dataset {} from {}: {}".format(entry_point.name, entry_point.value, e))
+
+
+def get_registered_datasets() -> Dict[str, Type[DataIterator]]:
+    """
+    Returns
+    -------
+    datasets: Dict[str, Type[DataIterator]]
+        dataset names mapped to classes of data iterators, including the ones from entry points
+    """
+    _load_entry_points()
+    return dict(_REGISTRY)
+
+
+def describe_capabilities(cls: Type[DataIterator]) -> str:
+    """
+    human readable summary of what data iterator supports
+    """
+    capabilities: List[str] = []
+    if cls.SUPPORTS_SEEKING:
+        capabilities.append("seeking")
+    if cls.SUPPORTS_SHARDING:
+        capabilities.append("sharding")
+    if cls.SUPPORTS_LENGTH_ESTIMATION:
+        capabilities.append("length estimation")
+    return ", ".join(capabilities) or "sequential reading only"
@@ -0,0 +1,105 @@
+"""
+Copyright 2022 Balacoon
+
+Deduplication of evaluation data. Corpora derived from Wikipedia
+repeat the same utterances a lot, each unique pair of
+unnormalized/normalized utterance only needs to be normalized once.
+"""
+
+import hashlib
+import logging
+from typing import List, Optional, Tuple
+
+from learn_to_normalize.evaluation.metrics import NormalizationMetrics
+from learn_to_normalize.normalizers.cached_normalizer import LruCache
+
+
+class PairDeduplicator:
+    """
+    Remembers normalization results of seen unnormalized/normalized pairs, keyed by their digest.
+    Memory is bounded by number of remembered pairs: least recently seen pairs are evicted,
+    and if they occur again, they are normalized and counted as unique once more.
+
+    Besides occurrence-weighted metrics (every utterance counts, comparable to evaluation
+    without deduplication), tracks metrics over unique pairs only.
+    """
+
+    def __init__(self, max_entries: int = 1000000):
+        """
+        Parameters
+        ----------
+        max_entries: int
+            max number of unique pairs to remember
+        """
+        self._cache = LruCache(max_entries=max_entries)
+        self.unique_metrics = NormalizationMetrics()
+
+    @staticmethod
+    def get_digest(unnormalized: str, normalized: str) -> bytes:
+        """
+        compact key of the pair, 16 bytes regardless of the length of utterances
+        """
+        hasher = hashlib.blake2b(digest_size=16)
+        hasher.update(unnormalized.encode("utf-8"))
+        hasher.update(b"\0")
+        hasher.update(normalized.encode("utf-8"))
+        return hasher.digest()
+
+    def get(self, unnormalized: str, normalized: str) -> Optional[str]:
+        """
+        Looks up result of normalizing the pair, if it was seen before
+
+        Parameters
+        ----------
+        unnormalized: str
+            input utterance
+        normalized: str
+            expected normalization
+
+        Returns
+        -------
+        result: Optional[str]
+            normalization obtained for the same pair earlier or None if pair is new
+        """
+        return self._cache.get(self.get_digest(unnormalized, normalized))
+
+    def put(
+        self,
+        unnormalized: str,
+        normalized: str,
+        result: str,
+        classes: List[str] = None,
+        token_spans: List[Tuple[str, int, int]] = None,
+    ):
+        """
+        Remembers result of normalizing a new pair and accounts it in unique-level metrics
+
+        Parameters
+        ----------
+        unnormalized: str
+            input utterance
+        normalized: str
+            expected normalization
+        result: str
+            obtained normalization
+        classes: List[str]
+            semiotic classes present in the utterance, if known
+        token_spans: List[Tuple[str, int, int]]
+            boundaries of tokens in expected normalization, if known
+        """
+        self._cache.put(self.get_digest(unnormalized, normalized), result)
+        self.unique_metrics.add(normalized, result, classes, token_spans)
+
+    def report(self):
+        """
+        Writes number of unique pairs and unique-level metrics into the log
+        """
+        stats = self._cache.get_stats()
+        occurrences = stats["hits"] + stats["misses"]
+        logging.warning("Deduplication: {} utterances, {} unique pairs ({:.2%}), {} evicted".format(
+            occurrences, stats["misses"], stats["misses"] / float(max(occurrences, 1)), stats["evictions"]))
+        logging.warning("Unique-level sentence accuracy: {}".format(self.unique_metrics.get_sentence_accuracy()))
+        token_accuracy = self.unique_metrics.get_token_accuracy()
+        if token_accuracy >= 0:
+            logging.warning("Unique-level token accuracy: {}".format(token_accuracy))
+        logging.warning("Unique-level word error rate: {}".format(self.unique_metrics.get_word_error_rate()))
@@ -5,13 +5,24 @@ Tool to run evaluation of the rules on large corpus.
 Can be used to evaluate or enhance existing rules.
 """
 
+import os
+import time
 import tqdm
 import logging
 import argparse
+from typing import List, Optional, Tuple
 
-from balacoon_frontend import TextNormalizer
-
-from learn_to_normalize.evaluation.data_iterator_factory import get_supported_datasets, get_data_iterator
+from learn_to_normalize.evaluation.data_iterator_factory import (
+    describe_datasets,
+    get_supported_datasets,
+    get_data_iterator,
+)
+from learn_to_normalize.evaluation.deduplication import PairDeduplicator
+from learn_to_normalize.evaluation.metrics import NormalizationMetrics
+from learn_to_normalize.evaluation.mismatch_clusters import MismatchClusterer
+from learn_to_normalize.evaluation.multi_addon import MultiAddonEvaluator
+from learn_to_normalize.evaluation.result_writer import RESULT_FORMATS, ResultWriter
+from learn_to_normalize.normalizers.normalizer_factory import add_normalizer_args, create_normalizer, close_normalizer
 
 
 def setup_logger(log_path: str = None):
@@ -36,18 +47,45 @@ def parse_args():
     ap.add_argument(
         "--addon",
         required=True,
-        help="Pack addon with text normalization rules obtained with `learn_to_normalize`",
+        nargs="+",
+        help="Pack addon with text normalization rules obtained with `learn_to_normalize`. "
+        "If several addons are given, each utterance is normalized with all of them in parallel workers, "
+        "and addons are compared side by side. Then --results, --cache-path and --offenders "
+        "are stored per addon, with index of the addon added, i.e. results.<idx>.tsv",
+    )
+    ap.add_argument(
+        "--locale",
+        default=[""],
+        nargs="+",
+        help="If addon has multiple normalization sections, disambiguate one to use, by providing locale. "
+        "When comparing addons, either a single locale for all addons or a locale per addon",
+    )
+    ap.add_argument(
+        "--dedup",
+        default=0,
+        type=int,
+        help="If > 0, repeated unnormalized/normalized pairs are normalized only once, remembering up to "
+        "that many unique pairs. Metrics are still weighted by occurrences, unique-level metrics are reported "
+        "additionally. Repeated pairs are still stored to --results (flagged as deduplicated, with 0 latency) "
+        "and accounted in mismatch clusters, while mismatches without --cluster are logged once per unique pair",
+    )
+    ap.add_argument(
+        "--batch-size",
+        default=64,
+        type=int,
+        help="Number of utterances sent to addon workers at once, when comparing several addons",
     )
     ap.add_argument(
         "--dataset",
         required=True,
         choices=get_supported_datasets(),
-        help="Dataset name, defines how to parse data from datadir",
+        help="Dataset name, defines how to parse data from datadir. Supported datasets:\n" + describe_datasets(),
     )
     ap.add_argument(
         "--datadir",
         required=True,
-        help="Directory with the data",
+        help="Directory with the data. Depending on dataset, can also be an archive or a compressed file. "
+        "For `stdin` dataset, pass `-`",
     )
     ap.add_argument(
         "--subset",
@@ -60,6 +98,28 @@ def parse_args():
         type=int,
         help="Number of sentences to read from a subset. By default - reads all"
     )
+    ap.add_argument(
+        "--shard",
+        help="Evaluate only a shard of the data, specified as <index>/<count>, for ex. 0/4. "
+        "Shards with the same count don't overlap, which allows to split evaluation between nodes",
+    )
+    ap.add_argument(
+        "--sample",
+        default=-1,
+        type=int,
+        help="If > 0, evaluates on reproducible random sample of that many utterances",
+    )
+    ap.add_argument(
+        "--stratified",
+        action="store_true",
+        help="Balance --sample across semiotic classes",
+    )
+    ap.add_argument(
+        "--seed",
+        default=0,
+        type=int,
+        help="Random seed for --sample",
+    )
     ap.add_argument(
         "--ignore-case",
         action="store_true",
@@ -69,32 +129,173 @@ def parse_args():
         "--log",
         help="If provided, additionally stores the log into specified path",
     )
+    ap.add_argument(
+        "--cluster",
+        action="store_true",
+        help="Instead of reporting every mismatch, group them by semiotic class and kind of difference, "
+        "and report most frequent clusters with a few exemplars",
+    )
+    ap.add_argument(
+        "--top-clusters",
+        default=100,
+        type=int,
+        help="Number of most frequent clusters to report with --cluster",
+    )
+    ap.add_argument(
+        "--exemplars",
+        default=3,
+        type=int,
+        help="Number of exemplars to keep per cluster with --cluster",
+    )
+    ap.add_argument(
+        "--results",
+        help="If provided, stores a record per utterance (input, expected, obtained, match, tags, latency, "
+        "deduplicated) "
+        "into specified path, for later analysis",
+    )
+    ap.add_argument(
+        "--results-format",
+        choices=RESULT_FORMATS,
+        help="Format of --results. By default deduced from extension, falling back to jsonl. "
+        "parquet requires pyarrow, if it is not installed, msgpack is used instead",
+    )
+    add_normalizer_args(ap)
     args = ap.parse_args()
+    if len(args.locale) == 1:
+        args.locale = args.locale * len(args.addon)
+    if len(args.locale) != len(args.addon):
+        ap.error("Provide either a single locale or a locale per addon")
+    if args.dedup > 0 and len(args.addon) > 1:
+        ap.error("--dedup is only supported when evaluating a single addon")
+    if args.results and not args.results_format:
+        extension = os.path.splitext(args.results)[1].lstrip(".")
+        args.results_format = extension if extension in RESULT_FORMATS else "jsonl"
     return args
 
 
-def main():
-    args = parse_args()
-    setup_logger(log_path=args.log)
+def compare_addons(data_iterator, args: argparse.Namespace):
+    """
+    Evaluates several addons in a single pass over the data, see :class:`MultiAddonEvaluator`
+    """
+    evaluator = MultiAddonEvaluator(args.addon, args.locale, args)
+    batch = []
+    length = data_iterator.estimate_length()
+    try:
+        for unnormalized, normalized in tqdm.tqdm(data_iterator, total=length if length > 0 else None):
+            batch.append((unnormalized, normalized, data_iterator.get_semiotic_classes(),
+                          data_iterator.get_token_spans()))
+            if len(batch) >= args.batch_size:
+                evaluator.evaluate(batch)
+                batch = []
+        if batch:
+            evaluator.evaluate(batch)
+    finally:
+        # workers are not daemonic, they have to be stopped even if evaluation failed
+        evaluator.close()
+    evaluator.report(args.top_clusters)
+
+
+def log_mismatch(normalized: str, result: str, unnormalized: str):
+    """
+    Writes utterance that is normalized not as expected into the log
+    """
+    logging.warning("\nExpected: " + normalized)
+    logging.warning("Obtained: " + result)
+    logging.warning("Original: " + unnormalized)
+    len_diff = abs(len(result) - len(normalized))
+    if len(result) == 0:
+        logging.warning("No output^^^^^")
+    elif len_diff > len(normalized) * 0.3:
+        logging.warning("Big difference^^^^^")
+
+
+def create_data_iterator(args: argparse.Namespace):
+    """
+    Creates data iterator over the evaluation data, sharded and sampled according to arguments
+    """
     data_iterator = get_data_iterator(name=args.dataset, location=args.datadir, subset=args.subset, n_utterances=args.num)
-    tn = TextNormalizer(args.addon)
+    if args.shard:
+        index, count = [int(x) for x in args.shard.split("/")]
+        data_iterator = data_iterator.shard(index, count)
+    if args.sample > 0:
+        data_iterator = data_iterator.sample(args.sample, seed=args.seed, stratified=args.stratified)
+    return data_iterator
+
+
+def report_metrics(metrics: NormalizationMetrics, clusterer: Optional[MismatchClusterer],
+                   deduplicator: Optional[PairDeduplicator], top_clusters: int):
+    """
+    Writes collected metrics into the log, as well as mismatch clusters and unique-level metrics if enabled
+    """
+    if clusterer:
+        clusterer.report(top_clusters)
+    metrics.report()
+    if deduplicator:
+        deduplicator.report()
+
+
+def normalize_pair(tn, deduplicator: Optional[PairDeduplicator], unnormalized: str, normalized: str,
+                   classes: List[str], token_spans: List[Tuple[str, int, int]],
+                   ignore_case: bool) -> Tuple[str, float, bool]:
+    """
+    Normalizes utterance, unless the same pair was normalized before.
+    Returns obtained normalization, latency and whether result is taken from a previous occurrence
+    """
+    result = deduplicator.get(unnormalized, normalized) if deduplicator else None
+    if result is not None:
+        return result, 0.0, True
+    start = time.perf_counter()
+    result = tn.normalize(unnormalized)
+    latency = time.perf_counter() - start
+    if ignore_case:
+        result = result.lower()
+    if deduplicator:
+        deduplicator.put(unnormalized, normalized, result, classes, token_spans)
+    return result, latency, False
+
+
+def evaluate_addon(data_iterator, args: argparse.Namespace):
+    """
+    Evaluates single addon, logging mismatches and metrics
+    """
+    tn = create_normalizer(args.addon[0], args.locale[0], args)
+    clusterer = MismatchClusterer(max_exemplars=args.exemplars) if args.cluster else None
+    metrics = NormalizationMetrics()
+    writer = ResultWriter(args.results, args.results_format) if args.results else None
+    deduplicator = PairDeduplicator(max_entries=args.dedup) if args.dedup > 0 else None
     total_num, incorrect_num = 0, 0
-    for unnormalized, normalized in tqdm.tqdm(data_iterator):
-        result = tn.normalize(unnormalized)
+    length = data_iterator.estimate_length()
+    for unnormalized, normalized in tqdm.tqdm(data_iterator, total=length if length > 0 else None):
         total_num += 1
         if args.ignore_case:
-            result = result.lower()
             normalized = normalized.lower()
+        classes, token_spans = data_iterator.get_semiotic_classes(), data_iterator.get_token_spans()
+        result, latency, is_repeated = normalize_pair(
+            tn, deduplicator, unnormalized, normalized, classes, token_spans, args.ignore_case)
+        metrics.add(normalized, result, classes, token_spans)
+        if writer:
+            writer.write(unnormalized, normalized, result, classes, latency, deduplicated=is_repeated)
         if result != normalized:
-            logging.warning("\nExpected: " + normalized)
-            logging.warning("Obtained: " + result)
-            logging.warning("Original: " + unnormalized)
-            len_diff = abs(len(result) - len(normalized))
-            if len(result) == 0:
-                logging.warning("No output^^^^^")
-            elif len_diff > len(normalized) * 0.3:
-                logging.warning("Big difference^^^^^")
             incorrect_num += 1
+            if clusterer:
+                clusterer.add(normalized, result, unnormalized, classes)
+            elif not is_repeated:
+                log_mismatch(normalized, result, unnormalized)
+    close_normalizer(tn)
+    if writer:
+        writer.close()
+        logging.info("Stored results to {}".format(writer.path))
+    report_metrics(metrics, clusterer, deduplicator, args.top_clusters)
     accuracy = (total_num - incorrect_num) / float(total_num)
     logging.warning("Accuracy: {}".format(accuracy))
 
+
+def main():
+    args = parse_args()
+    setup_logger(log_path=args.log)
+    data_iterator = create_data_iterator(args)
+    if len(args.addon) > 1:
+        compare_addons(data_iterator, args)
+    else:
+        evaluate_addon(data_iterator, args)
+
@@ -51,10 +51,16 @@ Adapters that help to work with google data:
 
     GoogleDataIterator
     ParsedUtterance
+    CompactParsedUtterance
+    ParsedUtteranceStore
 
 .. _paper: https://arxiv.org/abs/1611.00068
 .. _dataset page: https://www.kaggle.com/datasets/richardwilliamsproat/text-normalization-for-english-russian-and-polish
 """
 
 from learn_to_normalize.evaluation.google_data.google_data_iterator import GoogleDataIterator
-from learn_to_normalize.evaluation.google_data.parsed_utterance import ParsedUtterance
\ No newline at end of file
+from learn_to_normalize.evaluation.google_data.parsed_utterance import ParsedUtterance
+from learn_to_normalize.evaluation.google_data.compact_parsed_utterance import (
+    CompactParsedUtterance,
+    ParsedUtteranceStore,
+)
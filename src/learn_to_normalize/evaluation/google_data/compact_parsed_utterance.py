@@ -0,0 +1,270 @@
+"""
+Copyright 2022 Balacoon
+
+memory-efficient counterparts of ParsedUtterance,
+used when google data is processed at scale or
+materialized in memory.
+"""
+
+from array import array
+from typing import Dict, Iterator, List, Tuple
+
+from learn_to_normalize.evaluation.google_data.parsed_utterance import ParsedUtterance
+
+
+class CompactParsedUtterance:
+    """
+    Drop-in replacement of :class:`ParsedUtterance` with lower allocation.
+    Has no per-instance dict, semiotic classes are stored as interned ids,
+    utterance texts are accumulated utf-8 encoded in byte buffers, so no string
+    is kept per token, and token boundaries of normalized utterance are kept as word offsets.
+    Strings are only created by the getters.
+
+    Ids of semiotic classes are assigned in order of appearance, so they are only
+    meaningful within the current process. Only names of semiotic classes are exposed
+    (:func:`.get_semiotic_classes`, :func:`.get_token_spans`), ids should not be
+    stored or passed to other processes.
+    """
+
+    __slots__ = (
+        "_tag_ids",
+        "_unnormalized",
+        "_has_unnormalized",
+        "_normalized",
+        "_normalized_words",
+        "_token_spans",
+        "_next_token_prefix",
+        "_is_first_qoute",
+    )
+
+    # registry of interned semiotic classes shared by all utterances of the process
+    TAG_IDS: Dict[str, int] = {}
+    TAG_NAMES: List[str] = []
+
+    def __init__(self):
+        self._tag_ids = array("B")
+        self._unnormalized = bytearray()  # space-separated unnormalized tokens, with punctuation attached
+        self._has_unnormalized = False  # whether there is a token punctuation can be attached to
+        self._normalized = bytearray()
+        self._normalized_words = 0
+        # flattened (tag id, first word, end word) triples of tokens present in normalized utterance
+        self._token_spans = array("I")
+        self._next_token_prefix = ""
+        self._is_first_qoute = True
+
+    @classmethod
+    def get_tag_id(cls, tag: str) -> int:
+        """
+        Interns semiotic class
+
+        Parameters
+        ----------
+        tag: str
+            semiotic class, for ex. CARDINAL
+
+        Returns
+        -------
+        tag_id: int
+            id of the semiotic class, shared by all utterances
+        """
+        tag_id = cls.TAG_IDS.get(tag)
+        if tag_id is None:
+            tag_id = len(cls.TAG_NAMES)
+            if tag_id > 255:
+                raise RuntimeError("Too many distinct semiotic classes, failed to intern {}".format(tag))
+            cls.TAG_IDS[tag] = tag_id
+            cls.TAG_NAMES.append(tag)
+        return tag_id
+
+    def _append_to_last(self, unnormalized: str):
+        """
+        attaches string to the last unnormalized token
+        """
+        self._unnormalized += unnormalized.encode("utf-8")
+
+    def add_token(self, tag: str, unnormalized: str, normalized: str):
+        """
+        once a line from data file is read, add that info into
+        currently parsed utterance. Follows :func:`ParsedUtterance.add_token`
+        """
+        self._tag_ids.append(self.get_tag_id(tag))
+        if tag == "PUNCT":
+            if not self._has_unnormalized or unnormalized in ["(", "{", "["]:
+                self._next_token_prefix += unnormalized
+            elif unnormalized == "\"":
+                if self._is_first_qoute:
+                    self._is_first_qoute = False
+                    self._next_token_prefix += unnormalized
+                else:
+                    self._append_to_last(unnormalized)
+                    self._is_first_qoute = True
+            else:
+                if self._next_token_prefix:
+                    unnormalized = self._next_token_prefix + unnormalized
+                    self._next_token_prefix = ""
+                self._append_to_last(unnormalized)
+        else:
+            normalized = ParsedUtterance._convert_normalized(tag, unnormalized, normalized)
+            if normalized and normalized != "sil":
+                if self._normalized:
+                    self._normalized += b" "
+                self._normalized += normalized.encode("utf-8")
+                words_num = len(normalized.split())
+                self._token_spans.extend(
+                    (self._tag_ids[-1], self._normalized_words, self._normalized_words + words_num))
+                self._normalized_words += words_num
+            if self._next_token_prefix:
+                unnormalized = self._next_token_prefix + unnormalized
+                self._next_token_prefix = ""
+            if self._has_unnormalized:
+                self._unnormalized += b" "
+            self._unnormalized += unnormalized.encode("utf-8")
+            self._has_unnormalized = True
+
+    def has_semiotic_class(self, tag: str) -> bool:
+        """
+        checks if this utterance has particular semiotic class
+        """
+        tag_id = self.TAG_IDS.get(tag)
+        return tag_id is not None and tag_id in self._tag_ids
+
+    def get_semiotic_classes(self) -> List[str]:
+        """
+        Returns
+        -------
+        classes: List[str]
+            distinct semiotic classes of added tokens
+        """
+        return [self.TAG_NAMES[x] for x in sorted(set(self._tag_ids))]
+
+    def get_token_spans(self) -> List[Tuple[str, int, int]]:
+        """
+        Boundaries of google tokens in normalized utterance. Tokens that don't
+        produce any words (punctuation) are omitted.
+
+        Returns
+        -------
+        spans: List[Tuple[str, int, int]]
+            semiotic class, index of the first word and index past the last word
+            of each token in whitespace-split normalized utterance
+        """
+        spans = self._token_spans
+        return [(self.TAG_NAMES[spans[i]], spans[i + 1], spans[i + 2]) for i in range(0, len(spans), 3)]
+
+    def get_unnormalized(self) -> str:
+        """
+        getter to return unnomralized utterance as a single string
+        """
+        # remove space after slash if any
+        return self._unnormalized.decode("utf-8").replace("/ ", "/")
+
+    def get_normalized(self) -> str:
+        """
+        getter to return normalized utterance as a single string.
+        """
+        return self._normalized.decode("utf-8")
+
+    def get_tokens_num(self) -> int:
+        """
+        getter that returns number of tokens that were added to this utterance
+        """
+        return len(self._tag_ids)
+
+    def is_empty(self) -> bool:
+        """
+        checks if any tokens where added to the utterance
+        """
+        return self.get_tokens_num() == 0
+
+
+class ParsedUtteranceStore:
+    """
+    Materialized collection of parsed utterances. Texts of all utterances are stored
+    utf-8 encoded in a single shared buffer, with offsets kept in arrays. This allows
+    to keep whole subsets of the data in memory for multi-pass analysis, paying
+    a few bytes per character instead of a few Python objects per token.
+    Semiotic classes are interned by the store itself, independently of
+    :class:`CompactParsedUtterance`, so the store stays valid when pickled to another process.
+    """
+
+    def __init__(self):
+        self._text = bytearray()
+        # for utterance i, unnormalized text is [2i, 2i + 1), normalized one is [2i + 1, 2i + 2)
+        self._text_offsets = array("Q", [0])
+        self._tags = bytearray()
+        self._tag_offsets = array("Q", [0])
+        self._tag_ids: Dict[str, int] = {}
+        self._tag_names: List[str] = []
+
+    def append(self, utterance: CompactParsedUtterance):
+        """
+        Stores utterance in the collection
+
+        Parameters
+        ----------
+        utterance: CompactParsedUtterance
+            parsed utterance to store
+        """
+        for text in (utterance.get_unnormalized(), utterance.get_normalized()):
+            self._text += text.encode("utf-8")
+            self._text_offsets.append(len(self._text))
+        for tag in utterance.get_semiotic_classes():
+            tag_id = self._tag_ids.get(tag)
+            if tag_id is None:
+                tag_id = len(self._tag_names)
+                if tag_id > 255:
+                    raise RuntimeError("Too many distinct semiotic classes, failed to store {}".format(tag))
+                self._tag_ids[tag] = tag_id
+                self._tag_names.append(tag)
+            self._tags.append(tag_id)
+        self._tag_offsets.append(len(self._tags))
+
+    def __len__(self) -> int:
+        return len(self._tag_offsets) - 1
+
+    def _get_text(self, idx: int) -> str:
+        return self._text[self._text_offsets[idx]: self._text_offsets[idx + 1]].decode("utf-8")
+
+    def __getitem__(self, idx: int) -> Tuple[str, str]:
+        """
+        Parameters
+        ----------
+        idx: int
+            index of utterance in the collection
+
+        Returns
+        -------
+        utterance: Tuple[str, str]
+            unnormalized and normalized versions of the utterance
+        """
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("Utterance index {} is out of range".format(idx))
+        return self._get_text(2 * idx), self._get_text(2 * idx + 1)
+
+    def __iter__(self) -> Iterator[Tuple[str, str]]:
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def get_semiotic_classes(self, idx: int) -> List[str]:
+        """
+        Parameters
+        ----------
+        idx: int
+            index of utterance in the collection
+
+        Returns
+        -------
+        tags: List[str]
+            semiotic classes present in the utterance
+        """
+        tag_ids = self._tags[self._tag_offsets[idx]: self._tag_offsets[idx + 1]]
+        return [self._tag_names[x] for x in tag_ids]
+
+    def has_semiotic_class(self, idx: int, tag: str) -> bool:
+        """
+        checks if utterance in the collection has particular semiotic class
+        """
+        tag_id = self._tag_ids.get(tag)
+        return tag_id is not None and tag_id in self._tags[self._tag_offsets[idx]: self._tag_offsets[idx + 1]]
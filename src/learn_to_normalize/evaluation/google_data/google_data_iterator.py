@@ -5,16 +5,20 @@ Iterates over google dataset.
 Format is token per line, so some logic to merge utterances is required.
 """
 
-import os
 import re
-import glob
 import logging
-from typing import Tuple
+from typing import List, Tuple
 
 from learn_to_normalize.evaluation.data_iterator import DataIterator
-from learn_to_normalize.evaluation.google_data.parsed_utterance import ParsedUtterance
+from learn_to_normalize.evaluation.data_source import DEFAULT_BUFFER_SIZE, iter_text_streams
+from learn_to_normalize.evaluation.dataset_registry import register_dataset
+from learn_to_normalize.evaluation.google_data.compact_parsed_utterance import (
+    CompactParsedUtterance,
+    ParsedUtteranceStore,
+)
 
 
+@register_dataset("google_en")
 class GoogleDataIterator(DataIterator):
     """
     Data iterator over Google text normalization data
@@ -37,12 +41,19 @@ class GoogleDataIterator(DataIterator):
 
     Data iterator parses those data files and composes pairs of unnomralized/normalized utterances.
     It needs to tackle punctuation marks and spelling.
+
+    Data files can be read directly from compressed files (`.gz`, `.bz2`, `.xz`) and
+    archives (`.tgz`, `.tar.*`, `.zip`, including `en_with_types.tgz.zip` as downloaded from Kaggle),
+    so the data doesn't need to be unpacked on disk.
     """
 
     GOOGLE_SEMIOTIC_CLASSES = ["ADDRESS", "CARDINAL", "DATE", "DECIMAL", "DIGIT", "ELECTRONIC", "FRACTION",
                                "LETTERS", "MEASURE", "MONEY", "ORDINAL", "TELEPHONE", "TIME", "VERBATIM"]
 
-    def __init__(self, location: str, subset: str = "test", n_utterances: int = -1):
+    TEST_FILE = "output-00099-of-00100"
+
+    def __init__(self, location: str, subset: str = "test", n_utterances: int = -1,
+                 buffer_size: int = DEFAULT_BUFFER_SIZE):
         """
         constructor of google data iterator
 
@@ -50,7 +61,8 @@ class GoogleDataIterator(DataIterator):
         ----------
         location: str
             directory with the data, for ex. downloaded and unpacked
-            https://storage.googleapis.com/kaggle-data-sets/869240/1481083/compressed/en_with_types.tgz.zip
+            https://storage.googleapis.com/kaggle-data-sets/869240/1481083/compressed/en_with_types.tgz.zip.
+            Alternatively, path to the downloaded archive itself or to a single (compressed) data file.
         subset: str
             subset of the data to iterate over. supported values:
 
@@ -61,22 +73,22 @@ class GoogleDataIterator(DataIterator):
 
         n_utterances: int
             number of utterances to read from subset
+        buffer_size: int
+            size of read buffer, large buffers make reading compressed data faster
         """
         # find data files to read
-        self._data_files = []  # list of data files to read
-        self._data_file_idx = 0  # which data file is currently parsed
+        self._location = location
+        self._buffer_size = buffer_size
+        self._data_names = set()  # which data files to read, all if empty
         self._n_tokens = -1  # max number of tokens to read
         self._n_utterances = n_utterances  # max number of utterances to read
         self._expected_semiotic = ""  # which semiotic class to pick
         if subset == "test":
-            test_file = os.path.join(location, "output-00099-of-00100")
-            assert os.path.isfile(test_file), "{} is not in {}".format(test_file, location)
-            self._data_files = [test_file]
+            self._data_names = {self.TEST_FILE}
             self._n_tokens = 100002
             self._n_utterances = -1
-            logging.info("For `test` subset processing first {} tokens from {}".format(self._n_tokens, test_file))
+            logging.info("For `test` subset processing first {} tokens from {}".format(self._n_tokens, self.TEST_FILE))
         elif subset == "all" or subset in self.GOOGLE_SEMIOTIC_CLASSES:
-            self._data_files = glob.glob(os.path.join(location, "*"))
             if subset != "all":
                 # subset specifies which semiotic class to preselect
                 self._expected_semiotic = subset
@@ -85,7 +97,12 @@ class GoogleDataIterator(DataIterator):
                                "Use test/toy/all or any from {}".format(subset, str(self.GOOGLE_SEMIOTIC_CLASSES)))
 
         # set up class members that track current state of reading data
+        self._streams = None  # data files that are still to be read
+        self._opened_data_files = 0  # how many data files were opened so far
         self._current_data_file = None  # data file from which we currently read
+        self._current_data_name = ""  # name of data file from which we currently read
+        self._last_semiotic_classes = []  # semiotic classes of the last returned utterance
+        self._last_token_spans = []  # boundaries of tokens in the last returned utterance
         self._processed_tokens = 0  # how many tokens we already processed
         self._processed_utterances = 0  # how many utterances we already processed
 
@@ -93,7 +110,11 @@ class GoogleDataIterator(DataIterator):
         """
         Reset iterating through data.
         """
-        self._data_file_idx = 0
+        if self._current_data_file is not None:
+            self._current_data_file.close()
+            self._current_data_file = None
+        self._streams = iter_text_streams(self._location, names=self._data_names, buffer_size=self._buffer_size)
+        self._opened_data_files = 0
         self._processed_tokens = 0
         self._processed_utterances = 0
         return self
@@ -107,7 +128,7 @@ class GoogleDataIterator(DataIterator):
             self._processed_utterances, self._processed_tokens))
         raise StopIteration
 
-    def _get_utterance(self) -> Tuple[str, str]:
+    def _read_utterance(self) -> CompactParsedUtterance:
         """
         helper function that attempts to read a single utterance from a data file.
         it reads lines before it finds "<eos>".
@@ -115,50 +136,108 @@ class GoogleDataIterator(DataIterator):
         """
         if self._current_data_file is None:
             # need to open file to read
-            if self._data_file_idx >= len(self._data_files):
+            if self._streams is None:
+                self.__iter__()
+            next_stream = next(self._streams, None)
+            if next_stream is None:
                 # reached the end, no more data files to iterate over
+                if self._opened_data_files == 0:
+                    raise RuntimeError("No data files to read in {}".format(self._location))
                 self._raise_stop_iteration()
-            data_file_path = self._data_files[self._data_file_idx]
-            logging.info("Opening {} for parsing".format(data_file_path))
-            self._current_data_file = open(data_file_path, "r")
-        utterance = ParsedUtterance()
+            self._current_data_name, self._current_data_file = next_stream
+            self._opened_data_files += 1
+            logging.info("Opening {} for parsing".format(self._current_data_name))
+        utterance = CompactParsedUtterance()
         while True:
-            line = self._current_data_file.readline().strip()
-            if line.startswith("<eos>"):
-                # found end of utterance, process what was read before
-                break
+            line = self._current_data_file.readline()
             if not line:
                 # reached end of file
-                self._data_file_idx += 1
+                self._current_data_file.close()
                 self._current_data_file = None
                 break
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("<eos>"):
+                # found end of utterance, process what was read before
+                break
             parts = line.split("\t")
             if len(parts) != 3:
-                raise RuntimeError("Can't parse [{}] from {}".format(line, self._data_files[self._data_file_idx]))
+                raise RuntimeError("Can't parse [{}] from {}".format(line, self._current_data_name))
             utterance.add_token(*parts)
+        return utterance
 
-        if utterance.is_empty():
-            # nothing was read from this file, attempt again recursively
-            return self._get_utterance()
-        else:
-            if self._expected_semiotic and utterance.has_semiotic_class(self._expected_semiotic):
+    def _get_parsed_utterance(self) -> CompactParsedUtterance:
+        """
+        reads utterances until the one that passes subset selection
+        and sanity checks is found.
+        """
+        while True:
+            utterance = self._read_utterance()
+            if utterance.is_empty():
+                # nothing was read from this file, attempt again
+                continue
+            if self._expected_semiotic and not utterance.has_semiotic_class(self._expected_semiotic):
                 # current line doesn't have a semiotic class of interest, skip
-                return self._get_utterance()
-            else:
-                # get what was accumulated
-                unnorm, norm = utterance.get_unnormalized(), utterance.get_normalized()
-                # quick sanity check to confirm that utterance parsed properly
-                if re.match("^[A-Za-z-' ]+$", norm):
-                    self._processed_tokens += utterance.get_tokens_num()
-                    self._processed_utterances += 1
-                    return unnorm, norm
-                else:
-                    # probably failed to parse
-                    logging.warning("Failed to parse utterance from {}. "
-                                    "Normalized utterance [{}] contains unusual characters. "
-                                    "Original utterance: [{}]".format(
-                        self._data_files[self._data_file_idx], norm, unnorm))
-                    return self._get_utterance()
+                continue
+            # quick sanity check to confirm that utterance parsed properly
+            norm = utterance.get_normalized()
+            if re.match("^[A-Za-z-' ]+$", norm):
+                self._processed_tokens += utterance.get_tokens_num()
+                self._processed_utterances += 1
+                return utterance
+            # probably failed to parse
+            logging.warning("Failed to parse utterance from {}. "
+                            "Normalized utterance [{}] contains unusual characters. "
+                            "Original utterance: [{}]".format(
+                self._current_data_name, norm, utterance.get_unnormalized()))
+
+    def _get_utterance(self) -> Tuple[str, str]:
+        """
+        reads next utterance and returns unnormalized and normalized versions of it
+        """
+        utterance = self._get_parsed_utterance()
+        self._last_semiotic_classes = utterance.get_semiotic_classes()
+        self._last_token_spans = utterance.get_token_spans()
+        return utterance.get_unnormalized(), utterance.get_normalized()
+
+    def get_semiotic_classes(self) -> List[str]:
+        """
+        Semiotic classes of the last returned utterance, as annotated in google data
+        """
+        return self._last_semiotic_classes
+
+    def get_token_spans(self) -> List[Tuple[str, int, int]]:
+        """
+        Boundaries of google tokens in normalized version of the last returned utterance
+        """
+        return self._last_token_spans
+
+    def _is_exhausted(self) -> bool:
+        """
+        checks if requested number of tokens or utterances is already read
+        """
+        enough_tokens = 0 < self._n_tokens <= self._processed_tokens
+        enough_utterances = 0 < self._n_utterances <= self._processed_utterances
+        return enough_tokens or enough_utterances
+
+    def materialize(self) -> ParsedUtteranceStore:
+        """
+        Reads the whole subset into memory, in a compact form.
+
+        Returns
+        -------
+        store: ParsedUtteranceStore
+            all the utterances of the subset
+        """
+        store = ParsedUtteranceStore()
+        self.__iter__()
+        try:
+            while not self._is_exhausted():
+                store.append(self._get_parsed_utterance())
+        except StopIteration:
+            pass
+        return store
 
     def __next__(self) -> Tuple[str, str]:
         """
@@ -171,8 +250,6 @@ class GoogleDataIterator(DataIterator):
             specifically it is unnormalized and normalized versions
             of the utterance.
         """
-        enough_tokens = 0 < self._n_tokens <= self._processed_tokens
-        enough_utterances = 0 < self._n_utterances <= self._processed_utterances
-        if enough_tokens or enough_utterances:
+        if self._is_exhausted():
             self._raise_stop_iteration()
         return self._get_utterance()
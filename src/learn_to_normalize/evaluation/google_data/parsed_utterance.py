@@ -53,6 +53,25 @@ class ParsedUtterance:
             new_parts.append("".join(cur_word))
         return " ".join(new_parts)
 
+    @classmethod
+    def _convert_normalized(cls, tag: str, unnormalized: str, normalized: str) -> str:
+        """
+        converts normalized token of non punctuation semiotic class
+        from google data conventions to Balacoon ones.
+        """
+        if normalized == "<self>":
+            normalized = unnormalized.lower()
+        if tag == "LETTERS":
+            normalized = normalized.replace(" ", "").upper()
+        if tag == "VERBATIM" and re.match("[a-z]( [a-z])+", normalized):
+            # its an abbreviation
+            normalized = normalized.replace(" ", "").upper()
+        # replace all non-ascii characters if any
+        normalized = unidecode.unidecode(normalized)
+        # strip all "_letter" suffixes if any
+        normalized = cls._strip_letter_suffix(normalized)
+        return normalized
+
     def add_token(self, tag: str, unnormalized: str, normalized: str):
         """
         once a line from data file is read, add that info into
@@ -82,17 +101,7 @@ class ParsedUtterance:
                 self._unnormalized[-1] = self._unnormalized[-1] + unnormalized
         else:
             # this is non punct semiotic class
-            if normalized == "<self>":
-                normalized = unnormalized.lower()
-            if tag == "LETTERS":
-                normalized = normalized.replace(" ", "").upper()
-            if tag == "VERBATIM" and re.match("[a-z]( [a-z])+", normalized):
-                # its an abbreviation
-                normalized = normalized.replace(" ", "").upper()
-            # replace all non-ascii characters if any
-            normalized = unidecode.unidecode(normalized)
-            # strip all "_letter" suffixes if any
-            normalized = self._strip_letter_suffix(normalized)
+            normalized = self._convert_normalized(tag, unnormalized, normalized)
             if normalized and normalized != "sil":
                 self._normalized.append(normalized)
             if self._next_token_prefix:
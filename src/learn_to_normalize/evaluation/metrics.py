@@ -0,0 +1,233 @@
+"""
+Copyright 2022 Balacoon
+
+Word and token level metrics of text normalization.
+Obtained normalization is aligned to the reference one with edit distance,
+which allows to compute word error rate and tell which of annotated
+tokens were normalized correctly. Token-level accuracy is what
+Google text normalization paper reports.
+"""
+
+import logging
+from array import array
+from typing import Dict, List, Tuple
+
+# backtrace operations
+_MATCH, _SUBSTITUTE, _DELETE, _INSERT = 0, 1, 2, 3
+
+
+def align_words(reference: List[str], hypothesis: List[str]) -> Tuple[int, List[bool], List[int]]:
+    """
+    Aligns hypothesis to reference with Levenshtein distance over words.
+    Common prefix and suffix are matched directly, so dynamic programming
+    only runs over the differing middle part, which is usually short.
+
+    Parameters
+    ----------
+    reference: List[str]
+        reference words
+    hypothesis: List[str]
+        obtained words
+
+    Returns
+    -------
+    edits: int
+        number of substitutions, deletions and insertions
+    matched: List[bool]
+        for each reference word, whether it is aligned to identical hypothesis word
+    insertions: List[int]
+        number of hypothesis words inserted before each reference word,
+        with the last element counting insertions after the last reference word
+    """
+    ref_len, hyp_len = len(reference), len(hypothesis)
+    matched = [True] * ref_len
+    insertions = [0] * (ref_len + 1)
+    if reference == hypothesis:
+        return 0, matched, insertions
+    prefix = 0
+    while prefix < ref_len and prefix < hyp_len and reference[prefix] == hypothesis[prefix]:
+        prefix += 1
+    suffix = 0
+    while (suffix < ref_len - prefix and suffix < hyp_len - prefix
+           and reference[ref_len - 1 - suffix] == hypothesis[hyp_len - 1 - suffix]):
+        suffix += 1
+    # map words of the middle part to ids, so that comparisons are cheap
+    vocab: Dict[str, int] = {}
+    ref = [vocab.setdefault(x, len(vocab)) for x in reference[prefix: ref_len - suffix]]
+    hyp = [vocab.setdefault(x, len(vocab)) for x in hypothesis[prefix: hyp_len - suffix]]
+    edits, trace = _fill_trace(ref, hyp)
+    _backtrace(trace, len(ref), len(hyp), prefix, matched, insertions)
+    return edits, matched, insertions
+
+
+def _fill_trace(ref: List[int], hyp: List[int]) -> Tuple[int, array]:
+    """
+    Computes Levenshtein distance between sequences of word ids.
+    Returns the distance and full matrix of backtrace operations,
+    while cost is kept only for the previous row.
+    """
+    rows, cols = len(ref) + 1, len(hyp) + 1
+    trace = array("B", [_INSERT]) * (rows * cols)
+    for i in range(1, rows):
+        trace[i * cols] = _DELETE
+    prev = list(range(cols))
+    for i in range(1, rows):
+        cur = [i] + [0] * (cols - 1)
+        ref_word = ref[i - 1]
+        row = i * cols
+        for j in range(1, cols):
+            if hyp[j - 1] == ref_word:
+                cost, op = prev[j - 1], _MATCH
+            else:
+                cost, op = prev[j - 1] + 1, _SUBSTITUTE
+            if prev[j] + 1 < cost:
+                cost, op = prev[j] + 1, _DELETE
+            if cur[j - 1] + 1 < cost:
+                cost, op = cur[j - 1] + 1, _INSERT
+            cur[j] = cost
+            trace[row + j] = op
+        prev = cur
+    return prev[-1], trace
+
+
+def _backtrace(trace: array, ref_len: int, hyp_len: int, offset: int, matched: List[bool], insertions: List[int]):
+    """
+    Follows backtrace operations from :func:`_fill_trace`, marking reference words that are not matched
+    and counting insertions. `offset` is position of aligned middle part in the whole reference
+    """
+    cols = hyp_len + 1
+    i, j = ref_len, hyp_len
+    while i > 0 or j > 0:
+        op = trace[i * cols + j]
+        if op == _INSERT:
+            insertions[offset + i] += 1
+            j -= 1
+        else:
+            if op != _MATCH:
+                matched[offset + i - 1] = False
+            i -= 1
+            if op != _DELETE:
+                j -= 1
+
+
+class NormalizationMetrics:
+    """
+    Accumulates sentence, word and token level metrics over evaluated utterances,
+    overall and per semiotic class.
+
+    - sentence accuracy of a class - share of utterances with that class,
+      which are normalized exactly as expected
+    - token accuracy of a class - share of tokens of that class, whose normalized words are
+      all matched in the alignment, without insertions inside or around the token.
+      Tokens that produce no words (punctuation) are not counted.
+    - word error rate - edits needed to turn obtained normalization into expected one,
+      divided by number of words in expected normalization
+    """
+
+    def __init__(self):
+        self._utterances = 0
+        self._correct_utterances = 0
+        self._words = 0
+        self._edits = 0
+        self._class_utterances: Dict[str, List[int]] = {}  # class -> [total, correct]
+        self._class_tokens: Dict[str, List[int]] = {}  # class -> [total, correct]
+
+    def add(
+        self, expected: str, obtained: str, classes: List[str] = None, token_spans: List[Tuple[str, int, int]] = None
+    ):
+        """
+        Aligns obtained normalization to expected one and updates the metrics
+
+        Parameters
+        ----------
+        expected: str
+            reference normalization
+        obtained: str
+            normalization produced by the rules
+        classes: List[str]
+            semiotic classes present in the utterance, if known
+        token_spans: List[Tuple[str, int, int]]
+            boundaries of tokens in expected normalization, if known.
+            See :func:`DataIterator.get_token_spans`
+        """
+        is_correct = expected == obtained
+        reference = expected.split()
+        self._utterances += 1
+        self._correct_utterances += is_correct
+        self._words += len(reference)
+        for tag in classes or []:
+            counts = self._class_utterances.setdefault(tag, [0, 0])
+            counts[0] += 1
+            counts[1] += is_correct
+        if is_correct:
+            # fast path, no need to align
+            for tag, start, end in token_spans or []:
+                if end > start:
+                    counts = self._class_tokens.setdefault(tag, [0, 0])
+                    counts[0] += 1
+                    counts[1] += 1
+            return
+        edits, matched, insertions = align_words(reference, obtained.split())
+        self._edits += edits
+        for tag, start, end in token_spans or []:
+            if end <= start:
+                continue
+            counts = self._class_tokens.setdefault(tag, [0, 0])
+            counts[0] += 1
+            counts[1] += all(matched[start:end]) and not any(insertions[start: end + 1])
+
+    def get_word_error_rate(self) -> float:
+        """
+        word error rate over all the added utterances
+        """
+        return self._edits / float(max(self._words, 1))
+
+    def get_sentence_accuracy(self) -> float:
+        """
+        share of utterances normalized exactly as expected
+        """
+        return self._correct_utterances / float(max(self._utterances, 1))
+
+    def get_token_accuracy(self) -> float:
+        """
+        share of tokens normalized correctly, -1 if no token annotation was provided
+        """
+        total = sum(x[0] for x in self._class_tokens.values())
+        if total == 0:
+            return -1.0
+        return sum(x[1] for x in self._class_tokens.values()) / float(total)
+
+    def get_per_class(self) -> Dict[str, Tuple[int, float, int, float]]:
+        """
+        Returns
+        -------
+        per_class: Dict[str, Tuple[int, float, int, float]]
+            for each semiotic class: number of utterances with it, sentence accuracy,
+            number of tokens of the class and token accuracy. Accuracy is -1 if there were no samples
+        """
+        per_class = {}
+        for tag in sorted(set(self._class_utterances) | set(self._class_tokens)):
+            utt_total, utt_correct = self._class_utterances.get(tag, [0, 0])
+            tok_total, tok_correct = self._class_tokens.get(tag, [0, 0])
+            per_class[tag] = (
+                utt_total, utt_correct / float(utt_total) if utt_total else -1.0,
+                tok_total, tok_correct / float(tok_total) if tok_total else -1.0,
+            )
+        return per_class
+
+    def report(self):
+        """
+        Writes the metrics into the log
+        """
+        per_class = self.get_per_class()
+        if per_class:
+            logging.warning("\n{:<12} {:>10} {:>10} {:>10} {:>10}".format(
+                "class", "sentences", "sent.acc", "tokens", "token.acc"))
+            for tag, (utt_total, utt_acc, tok_total, tok_acc) in per_class.items():
+                logging.warning("{:<12} {:>10} {:>10} {:>10} {:>10}".format(
+                    tag, utt_total, "{:.4f}".format(utt_acc) if utt_total else "-",
+                    tok_total, "{:.4f}".format(tok_acc) if tok_total else "-"))
+        token_accuracy = self.get_token_accuracy()
+        if token_accuracy >= 0:
+            logging.warning("Token accuracy: {}".format(token_accuracy))
+        logging.warning("Word error rate: {}".format(self.get_word_error_rate()))
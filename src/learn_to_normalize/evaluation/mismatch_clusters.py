@@ -0,0 +1,181 @@
+"""
+Copyright 2022 Balacoon
+
+Aggregation of evaluation mismatches into clusters,
+so that reports on large corpora stay readable.
+"""
+
+import difflib
+import logging
+from typing import Dict, List, Tuple
+
+# words that are produced when numbers are expanded. Their exact values don't matter for clustering
+NUMBER_WORDS = set(
+    "zero oh o one two three four five six seven eight nine ten eleven twelve thirteen fourteen fifteen sixteen "
+    "seventeen eighteen nineteen twenty thirty forty fifty sixty seventy eighty ninety hundred thousand million "
+    "billion trillion first second third fourth fifth sixth seventh eighth ninth tenth eleventh twelfth "
+    "twentieth thirtieth hundredth thousandth point minus and".split()
+)
+
+# max number of matching words between differing spans, for them to be merged
+MAX_GAP = 2
+
+
+def _word_shape(word: str) -> str:
+    """
+    maps word to its class used in diff signature
+    """
+    if word in NUMBER_WORDS:
+        return "#"
+    if word.isupper():
+        # spelled out
+        return "A"
+    return word
+
+
+def _span_shape(words: List[str]) -> str:
+    """
+    maps span of words to a shape, collapsing repeated word classes,
+    so that numbers of different lengths get the same shape.
+    """
+    shapes = []
+    for word in words:
+        shape = _word_shape(word)
+        if shapes and shapes[-1].rstrip("+") == shape and shape in ("#", "A"):
+            shapes[-1] = shape + "+"
+        else:
+            shapes.append(shape)
+    return " ".join(shapes) or "_"
+
+
+def get_diff_signature(expected: str, obtained: str) -> str:
+    """
+    Computes normalized signature of the difference between expected and obtained
+    normalization. Mismatches that differ in the same way (for ex. digit-by-digit vs. cardinal reading
+    of a number) get the same signature, no matter what actual numbers are.
+
+    Parameters
+    ----------
+    expected: str
+        reference normalization
+    obtained: str
+        normalization produced by the rules
+
+    Returns
+    -------
+    signature: str
+        signature of differing spans, for ex. "# # # # -> #+"
+    """
+    expected_words, obtained_words = expected.split(), obtained.split()
+    matcher = difflib.SequenceMatcher(a=expected_words, b=obtained_words, autojunk=False)
+    # differing spans separated by just a couple of matching words are merged,
+    # since those usually come from the same token, for ex. "two [thousand] five [hundred] ..."
+    spans = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        if spans and i1 - spans[-1][1] <= MAX_GAP:
+            spans[-1][1], spans[-1][3] = i2, j2
+        else:
+            spans.append([i1, i2, j1, j2])
+    return " | ".join(
+        "{} -> {}".format(_span_shape(expected_words[i1:i2]), _span_shape(obtained_words[j1:j2]))
+        for i1, i2, j1, j2 in spans
+    )
+
+
+class MismatchClusterer:
+    """
+    Incrementally groups mismatches by semiotic classes of the utterance and diff signature.
+    Keeps count and a few exemplars per cluster. Memory is bounded: when number of clusters grows
+    beyond twice `max_clusters`, only `max_clusters` most frequent ones are kept.
+    """
+
+    def __init__(self, max_clusters: int = 10000, max_exemplars: int = 3):
+        """
+        Parameters
+        ----------
+        max_clusters: int
+            number of clusters to keep
+        max_exemplars: int
+            number of exemplars (expected, obtained, original) to keep per cluster
+        """
+        self._max_clusters = max_clusters
+        self._max_exemplars = max_exemplars
+        self._clusters: Dict[Tuple[str, str], list] = {}  # key -> [count, exemplars]
+        self._pruned = 0  # mismatches that were dropped with pruned clusters
+        self.total = 0
+
+    def add(self, expected: str, obtained: str, original: str, classes: List[str] = None):
+        """
+        Adds mismatch to the clusters
+
+        Parameters
+        ----------
+        expected: str
+            reference normalization
+        obtained: str
+            normalization produced by the rules
+        original: str
+            unnormalized utterance
+        classes: List[str]
+            semiotic classes present in the utterance if known
+        """
+        self.total += 1
+        informative = sorted(set(classes or []) - {"PLAIN", "PUNCT"})
+        key = ("+".join(informative) or "PLAIN", get_diff_signature(expected, obtained))
+        cluster = self._clusters.get(key)
+        if cluster is None:
+            cluster = self._clusters[key] = [0, []]
+        cluster[0] += 1
+        if len(cluster[1]) < self._max_exemplars:
+            cluster[1].append((expected, obtained, original))
+        if len(self._clusters) > 2 * self._max_clusters:
+            self._prune()
+
+    def _prune(self):
+        """
+        keeps only most frequent clusters
+        """
+        ranked = sorted(self._clusters.items(), key=lambda x: x[1][0], reverse=True)
+        self._clusters = dict(ranked[:self._max_clusters])
+        self._pruned += sum(x[1][0] for x in ranked[self._max_clusters:])
+
+    def get_top(self, n: int = -1) -> List[Tuple[str, str, int, List[Tuple[str, str, str]]]]:
+        """
+        Returns most frequent clusters
+
+        Parameters
+        ----------
+        n: int
+            number of clusters to return. if <= 0, returns all
+
+        Returns
+        -------
+        clusters: List[Tuple[str, str, int, List[Tuple[str, str, str]]]]
+            semiotic classes, diff signature, count and exemplars of each cluster
+        """
+        ranked = sorted(self._clusters.items(), key=lambda x: x[1][0], reverse=True)
+        if n > 0:
+            ranked = ranked[:n]
+        return [(classes, signature, count, exemplars) for (classes, signature), (count, exemplars) in ranked]
+
+    def report(self, n: int = 50):
+        """
+        Writes clusters into the log, starting from the most frequent
+
+        Parameters
+        ----------
+        n: int
+            number of clusters to report
+        """
+        logging.warning("\n{} mismatches grouped into {} clusters{}".format(
+            self.total, len(self._clusters),
+            ", {} mismatches from rare clusters dropped".format(self._pruned) if self._pruned else ""))
+        for rank, (classes, signature, count, exemplars) in enumerate(self.get_top(n)):
+            logging.warning("\n#{} [{}] {} mismatches ({:.2f}%): {}".format(
+                rank + 1, classes, count, 100.0 * count / self.total, signature))
+            for expected, obtained, original in exemplars:
+                logging.warning("  Expected: " + expected)
+                logging.warning("  Obtained: " + obtained)
+                logging.warning("  Original: " + original)
@@ -0,0 +1,260 @@
+"""
+Copyright 2022 Balacoon
+
+Evaluation of several addons in a single pass over the corpus.
+Each utterance is read and parsed once and normalized with every addon,
+addons running in separate worker processes. Results are reported
+side by side, together with how often addons disagree.
+"""
+
+import os
+import copy
+import time
+import logging
+import argparse
+import multiprocessing
+from multiprocessing.connection import Connection
+from typing import List, Tuple
+
+from learn_to_normalize.evaluation.metrics import NormalizationMetrics
+from learn_to_normalize.evaluation.mismatch_clusters import MismatchClusterer
+from learn_to_normalize.evaluation.result_writer import ResultWriter
+from learn_to_normalize.normalizers.normalizer_factory import create_normalizer, close_normalizer
+
+# unnormalized, normalized, semiotic classes, token spans
+Sample = Tuple[str, str, List[str], List[Tuple[str, int, int]]]
+
+
+def _worker_loop(conn: Connection, addon: str, locale: str, args: argparse.Namespace):
+    """
+    Entry point of a worker that normalizes batches of utterances with a single addon.
+    Replies with normalized utterances and latencies until None is received.
+    """
+    normalizer = create_normalizer(addon, locale, args)
+    while True:
+        texts = conn.recv()
+        if texts is None:
+            break
+        results = []
+        try:
+            for text in texts:
+                start = time.perf_counter()
+                normalized = normalizer.normalize(text)
+                results.append((normalized, time.perf_counter() - start))
+        except Exception as e:
+            conn.send((False, "Failed to normalize [{}]: {}".format(text, e)))
+            continue
+        conn.send((True, results))
+    close_normalizer(normalizer)
+
+
+def _percentile(values: List[float], share: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(int(share * len(values)), len(values) - 1)]
+
+
+def get_results_path(path: str, idx: int) -> str:
+    """
+    path to store results of addon with given index, i.e. results.parquet -> results.1.parquet
+    """
+    root, ext = os.path.splitext(path)
+    return "{}.{}{}".format(root, idx, ext)
+
+
+class MultiAddonEvaluator:
+    """
+    Normalizes batches of utterances with several addons, each in its own worker process,
+    and accumulates metrics per addon as well as pairwise disagreement between addons.
+    Utterances on which addons disagree are written into the log.
+    """
+
+    def __init__(self, addons: List[str], locales: List[str], args: argparse.Namespace):
+        """
+        Parameters
+        ----------
+        addons: List[str]
+            addons to compare
+        locales: List[str]
+            locale to pick from each of the addons
+        args: argparse.Namespace
+            arguments of `evaluate`, used to create normalizers and configure reporting
+        """
+        self._addons = addons
+        self._ignore_case = args.ignore_case
+        self._context = multiprocessing.get_context("spawn")
+        self._workers = []
+        for idx, (addon, locale) in enumerate(zip(addons, locales)):
+            conn, child_conn = self._context.Pipe()
+            # workers are not daemonic, so normalizers can spawn their own workers, see `--timeout`
+            process = self._context.Process(target=_worker_loop, args=(child_conn, addon, locale,
+                                                                       self._get_worker_args(args, idx)))
+            process.start()
+            child_conn.close()
+            self._workers.append((process, conn))
+        self._metrics = [NormalizationMetrics() for _ in addons]
+        self._latencies: List[List[float]] = [[] for _ in addons]
+        self._clusterers = None
+        if args.cluster:
+            self._clusterers = [MismatchClusterer(max_exemplars=args.exemplars) for _ in addons]
+        self._writers = None
+        if args.results:
+            self._writers = [ResultWriter(get_results_path(args.results, idx), args.results_format)
+                             for idx in range(len(addons))]
+        num = len(addons)
+        self._disagreements = [[0] * num for _ in range(num)]  # number of utterances addons normalize differently
+        self._only_correct = [[0] * num for _ in range(num)]  # number of utterances only addon `i` got right
+        self._utterances = 0
+
+    @staticmethod
+    def _get_worker_args(args: argparse.Namespace, idx: int) -> argparse.Namespace:
+        """
+        arguments to create normalizer of addon with given index. Files normalizers write to
+        are distinct per addon, so workers don't write into the same file concurrently
+        """
+        args = copy.copy(args)
+        if args.cache_path:
+            args.cache_path = get_results_path(args.cache_path, idx)
+        if args.offenders:
+            args.offenders = get_results_path(args.offenders, idx)
+        return args
+
+    def evaluate(self, batch: List[Sample]):
+        """
+        Normalizes batch of utterances with all the addons and updates the metrics
+
+        Parameters
+        ----------
+        batch: List[Sample]
+            unnormalized utterances, expected normalizations, semiotic classes and token spans
+        """
+        addon_results = self._normalize([unnormalized for unnormalized, _, _, _ in batch])
+        for sample_idx, (unnormalized, normalized, classes, spans) in enumerate(batch):
+            self._utterances += 1
+            if self._ignore_case:
+                normalized = normalized.lower()
+            obtained = []
+            for idx, results in enumerate(addon_results):
+                result, latency = results[sample_idx]
+                if self._ignore_case:
+                    result = result.lower()
+                obtained.append(result)
+                self._latencies[idx].append(latency)
+                self._metrics[idx].add(normalized, result, classes, spans)
+                if self._writers:
+                    self._writers[idx].write(unnormalized, normalized, result, classes, latency)
+                if self._clusterers and result != normalized:
+                    self._clusterers[idx].add(normalized, result, unnormalized, classes)
+            self._compare(unnormalized, normalized, obtained)
+
+    def _normalize(self, texts: List[str]) -> List[List[Tuple[str, float]]]:
+        """
+        normalizes texts with all the addons, returns normalized texts and latencies per addon
+        """
+        # send to all the workers first, so addons normalize the batch in parallel
+        errors = {}  # addon index -> error
+        for idx, (_, conn) in enumerate(self._workers):
+            try:
+                conn.send(texts)
+            except OSError:
+                errors[idx] = "Worker normalizing with {} died".format(self._addons[idx])
+        # collect replies of all the workers before raising, so none is left in a pipe
+        addon_results = []
+        for idx, (_, conn) in enumerate(self._workers):
+            if idx in errors:
+                continue
+            try:
+                is_ok, results = conn.recv()
+            except EOFError:
+                errors[idx] = "Worker normalizing with {} died".format(self._addons[idx])
+                continue
+            if not is_ok:
+                errors[idx] = "{}: {}".format(self._addons[idx], results)
+            addon_results.append(results)
+        if errors:
+            raise RuntimeError("; ".join(errors[idx] for idx in sorted(errors)))
+        return addon_results
+
+    def _compare(self, unnormalized: str, normalized: str, obtained: List[str]):
+        """
+        updates pairwise disagreement of addons and logs utterances they disagree on
+        """
+        if all(x == obtained[0] for x in obtained[1:]):
+            return
+        for i in range(len(obtained)):
+            for j in range(len(obtained)):
+                if i != j and obtained[i] != obtained[j]:
+                    self._disagreements[i][j] += 1
+                    self._only_correct[i][j] += obtained[i] == normalized
+        logging.warning("\nOriginal: " + unnormalized)
+        logging.warning("Expected: " + normalized)
+        for idx, result in enumerate(obtained):
+            logging.warning("[{}] {}: {}".format(idx, "ok" if result == normalized else "obtained", result))
+
+    def close(self):
+        """
+        stops workers and finalizes result files. Safe to call after a failure,
+        workers that died or can't be reached are terminated
+        """
+        for process, conn in self._workers:
+            try:
+                conn.send(None)
+            except OSError:
+                # worker died, pipe is broken
+                process.terminate()
+            process.join()
+            conn.close()
+        self._workers = []
+        if self._writers:
+            for writer in self._writers:
+                writer.close()
+                logging.info("Stored results to {}".format(writer.path))
+            self._writers = None
+
+    def report(self, top_clusters: int = 100):
+        """
+        Writes side by side comparison of addons into the log
+
+        Parameters
+        ----------
+        top_clusters: int
+            number of most frequent mismatch clusters to report per addon, if clustering is enabled
+        """
+        if self._clusterers:
+            for idx, clusterer in enumerate(self._clusterers):
+                logging.warning("\nMismatch clusters of [{}] {}".format(idx, self._addons[idx]))
+                clusterer.report(top_clusters)
+        logging.warning("\nEvaluated {} addons on {} utterances".format(len(self._addons), self._utterances))
+        for idx, addon in enumerate(self._addons):
+            logging.warning("[{}] {}".format(idx, addon))
+        logging.warning("{:<6} {:>10} {:>10} {:>10} {:>10} {:>10}".format(
+            "addon", "sent.acc", "token.acc", "WER", "mean,ms", "p95,ms"))
+        for idx, (metrics, latencies) in enumerate(zip(self._metrics, self._latencies)):
+            token_accuracy = metrics.get_token_accuracy()
+            logging.warning("{:<6} {:>10.4f} {:>10} {:>10.4f} {:>10.3f} {:>10.3f}".format(
+                "[{}]".format(idx), metrics.get_sentence_accuracy(),
+                "{:.4f}".format(token_accuracy) if token_accuracy >= 0 else "-", metrics.get_word_error_rate(),
+                1000 * sum(latencies) / max(len(latencies), 1), 1000 * _percentile(latencies, 0.95)))
+        per_class = [metrics.get_per_class() for metrics in self._metrics]
+        tags = sorted(set(tag for x in per_class for tag in x))
+        if tags:
+            logging.warning("\nSentence / token accuracy per class")
+            logging.warning("{:<12} {:>10} ".format("class", "sentences") + " ".join(
+                "{:>15}".format("[{}]".format(idx)) for idx in range(len(self._addons))))
+            for tag in tags:
+                columns = []
+                for stats in per_class:
+                    utt_total, utt_acc, tok_total, tok_acc = stats.get(tag, (0, -1.0, 0, -1.0))
+                    columns.append("{:>15}".format("{} / {}".format(
+                        "{:.4f}".format(utt_acc) if utt_total else "-",
+                        "{:.4f}".format(tok_acc) if tok_total else "-")))
+                logging.warning("{:<12} {:>10} ".format(tag, per_class[0].get(tag, (0,))[0]) + " ".join(columns))
+        logging.warning("\nPairwise disagreement")
+        for i in range(len(self._addons)):
+            for j in range(i + 1, len(self._addons)):
+                differ = self._disagreements[i][j]
+                logging.warning("[{}] vs [{}]: differ on {} utterances ({:.2%}), only [{}] correct: {}, "
+                                "only [{}] correct: {}".format(
+                                    i, j, differ, differ / float(max(self._utterances, 1)),
+                                    i, self._only_correct[i][j], j, self._only_correct[j][i]))
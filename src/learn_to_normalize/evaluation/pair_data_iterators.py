@@ -0,0 +1,225 @@
+"""
+Copyright 2022 Balacoon
+
+Data iterators over simple tab-separated pairs of unnormalized/normalized
+utterances, one pair per line:
+
+::
+
+    On May 5th	on may fifth	DATE
+    It costs $3.	it costs three dollars	MONEY
+
+Third column is optional and contains comma-separated semiotic classes of the utterance.
+"""
+
+import os
+import sys
+from abc import abstractmethod
+from typing import BinaryIO, List, Tuple
+
+from learn_to_normalize.evaluation.data_iterator import DataIterator
+from learn_to_normalize.evaluation.data_source import DEFAULT_BUFFER_SIZE
+from learn_to_normalize.evaluation.dataset_registry import register_dataset
+
+# amount of data to read to estimate average length of a line
+_LENGTH_ESTIMATION_BYTES = 1024 * 1024
+
+
+def parse_pair_line(line: bytes) -> Tuple[str, str, List[str]]:
+    """
+    Parses a line of tab-separated pairs
+
+    Parameters
+    ----------
+    line: bytes
+        line without trailing newline
+
+    Returns
+    -------
+    pair: Tuple[str, str, List[str]]
+        unnormalized and normalized utterance and semiotic classes, if provided
+    """
+    parts = line.decode("utf-8").split("\t")
+    if len(parts) < 2 or len(parts) > 3:
+        raise RuntimeError("Can't parse [{}], expected 2 or 3 tab-separated columns".format(line))
+    classes = parts[2].split(",") if len(parts) == 3 and parts[2] else []
+    return parts[0], parts[1], classes
+
+
+class _PairDataIterator(DataIterator):
+    """
+    Common part of data iterators that read tab-separated pairs from a binary stream.
+    Implementations provide `_open` and may restrict the range of bytes to read.
+    """
+
+    def __init__(self, location: str, subset: str = "all", n_utterances: int = -1):
+        """
+        Parameters
+        ----------
+        location: str
+            where to read the pairs from
+        subset: str
+            `all` or `test` to read all the pairs, otherwise
+            name of semiotic class to select utterances with
+        n_utterances: int
+            number of utterances to read, if -1 - reads all
+        """
+        self._location = location
+        self._expected_semiotic = "" if subset in ("all", "test") else subset
+        self._n_utterances = n_utterances
+        self._stream = None
+        self._position = 0  # offset of the next line in the stream
+        self._end = -1  # offset past which lines are not read, -1 for end of the stream
+        self._processed_utterances = 0
+        self._last_semiotic_classes = []
+
+    @abstractmethod
+    def _open(self) -> BinaryIO:
+        """
+        opens stream to read pairs from, positioned at the first line to read
+        """
+        pass
+
+    def __iter__(self):
+        self._stream = self._open()
+        self._processed_utterances = 0
+        return self
+
+    def __next__(self) -> Tuple[str, str]:
+        if self._stream is None:
+            self.__iter__()
+        while True:
+            if 0 < self._n_utterances <= self._processed_utterances:
+                raise StopIteration
+            if 0 <= self._end <= self._position:
+                # lines starting at or past the end belong to the next shard
+                raise StopIteration
+            line = self._stream.readline()
+            if not line:
+                raise StopIteration
+            self._position += len(line)
+            line = line.rstrip(b"\r\n")
+            if not line:
+                continue
+            unnormalized, normalized, classes = parse_pair_line(line)
+            if self._expected_semiotic and self._expected_semiotic not in classes:
+                continue
+            self._processed_utterances += 1
+            self._last_semiotic_classes = classes
+            return unnormalized, normalized
+
+    def get_semiotic_classes(self) -> List[str]:
+        """
+        Semiotic classes of the last returned utterance, if provided in the third column
+        """
+        return self._last_semiotic_classes
+
+
+@register_dataset("tsv")
+class TsvDataIterator(_PairDataIterator):
+    """
+    High-throughput reader of a plain (uncompressed) file with tab-separated pairs.
+    File is read in binary mode with large buffers and lines are decoded one by one.
+    Shards are contiguous byte ranges of the file, aligned to line boundaries,
+    so each shard reads only its part of the file.
+    """
+
+    SUPPORTS_SEEKING = True
+    SUPPORTS_SHARDING = True
+    SUPPORTS_LENGTH_ESTIMATION = True
+
+    def __init__(self, location: str, subset: str = "all", n_utterances: int = -1,
+                 start: int = 0, end: int = -1, buffer_size: int = DEFAULT_BUFFER_SIZE):
+        """
+        Parameters
+        ----------
+        location: str
+            path to the tsv file
+        subset: str
+            `all` or `test` to read all the pairs, otherwise
+            name of semiotic class to select utterances with
+        n_utterances: int
+            number of utterances to read, if -1 - reads all
+        start: int
+            offset in bytes to start reading from. If it is in the middle of a line, reading starts with the next one
+        end: int
+            offset in bytes, lines starting at or after it are not read. -1 to read till the end of file
+        buffer_size: int
+            size of read buffer
+        """
+        super().__init__(location, subset=subset, n_utterances=n_utterances)
+        if not os.path.isfile(location):
+            raise RuntimeError("{} is not a file with tab-separated pairs".format(location))
+        self._subset = subset
+        self._start = start
+        self._end = end
+        self._buffer_size = buffer_size
+
+    def _open(self) -> BinaryIO:
+        if self._stream is not None:
+            self._stream.close()
+        stream = open(self._location, "rb", buffering=self._buffer_size)
+        self._position = self._start
+        if self._start > 0:
+            # skip partial line, it belongs to the previous shard
+            stream.seek(self._start - 1)
+            self._position += len(stream.readline()) - 1
+        return stream
+
+    def tell(self) -> int:
+        """
+        offset in bytes of the line to read next
+        """
+        return self._position
+
+    def seek(self, position: int):
+        """
+        continue reading from an offset returned by :func:`.tell`
+        """
+        if self._stream is None:
+            self.__iter__()
+        self._stream.seek(position)
+        self._position = position
+
+    def shard(self, index: int, count: int) -> DataIterator:
+        """
+        Splits the file into `count` byte ranges of the same size.
+        `n_utterances` limit applies to each shard separately.
+        """
+        if not 0 <= index < count:
+            raise RuntimeError("Shard index should be in [0, {}), got {}".format(count, index))
+        end = self._end if self._end >= 0 else os.path.getsize(self._location)
+        size = end - self._start
+        return TsvDataIterator(
+            self._location, subset=self._subset, n_utterances=self._n_utterances,
+            start=self._start + size * index // count, end=self._start + size * (index + 1) // count,
+            buffer_size=self._buffer_size,
+        )
+
+    def estimate_length(self) -> int:
+        """
+        Estimates number of lines from average length of lines in the beginning of the range.
+        Doesn't account for `subset` selection.
+        """
+        end = self._end if self._end >= 0 else os.path.getsize(self._location)
+        with open(self._location, "rb") as fp:
+            fp.seek(self._start)
+            chunk = fp.read(min(_LENGTH_ESTIMATION_BYTES, end - self._start))
+        lines = chunk.count(b"\n")
+        if lines == 0:
+            return 1 if chunk else 0
+        length = int((end - self._start) * lines / len(chunk))
+        return min(length, self._n_utterances) if self._n_utterances > 0 else length
+
+
+@register_dataset("stdin")
+class StdinDataIterator(_PairDataIterator):
+    """
+    Reads tab-separated pairs streamed into standard input, for ex. from a sampling job.
+    `location` is ignored. Data can be iterated over only once.
+    """
+
+    def _open(self) -> BinaryIO:
+        if self._stream is not None:
+            raise RuntimeError("Standard input can be iterated over only once")
+        return sys.stdin.buffer
@@ -0,0 +1,202 @@
+"""
+Copyright 2022 Balacoon
+
+Machine-readable output of evaluation: one record per utterance,
+written in batches by a background thread, so that storing
+the results doesn't slow the evaluation down.
+"""
+
+import os
+import json
+import queue
+import logging
+import threading
+from typing import Any, Dict, Iterator, List
+
+import msgpack
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+RESULT_FORMATS = ["jsonl", "parquet", "msgpack"]
+# fields of a single record
+RESULT_FIELDS = ["input", "expected", "obtained", "match", "tags", "latency", "deduplicated"]
+
+
+def _get_parquet_schema():
+    return pyarrow.schema([
+        ("input", pyarrow.string()),
+        ("expected", pyarrow.string()),
+        ("obtained", pyarrow.string()),
+        ("match", pyarrow.bool_()),
+        ("tags", pyarrow.list_(pyarrow.string())),
+        ("latency", pyarrow.float64()),
+        ("deduplicated", pyarrow.bool_()),
+    ])
+
+
+class ResultWriter:
+    """
+    Writes evaluation results into a file. Supported formats:
+
+    - `jsonl` - json object per line
+    - `parquet` - columnar parquet file with a row group per batch, requires `pyarrow`.
+      If `pyarrow` is not installed, falls back to `msgpack`
+    - `msgpack` - stream of msgpack maps, one per batch, with a list of values per field
+
+    Records are accumulated into batches, which are serialized and written
+    in a separate thread. Use :func:`read_results` to load the results back.
+    """
+
+    def __init__(self, path: str, fmt: str = "jsonl", batch_size: int = 4096, max_pending: int = 16):
+        """
+        Parameters
+        ----------
+        path: str
+            where to store the results
+        fmt: str
+            format of the results, one of RESULT_FORMATS
+        batch_size: int
+            number of records written at once
+        max_pending: int
+            number of batches that can wait to be written, before evaluation is blocked
+        """
+        if fmt not in RESULT_FORMATS:
+            raise RuntimeError("Unsupported format of results {}, use one of {}".format(fmt, RESULT_FORMATS))
+        if fmt == "parquet" and pyarrow is None:
+            fmt = "msgpack"
+            path = os.path.splitext(path)[0] + ".msgpack"
+            logging.warning("pyarrow is not installed, storing results as msgpack to {}".format(path))
+        self.path = path
+        self.format = fmt
+        self._batch_size = batch_size
+        self._batch: List[List[Any]] = []
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._error = None
+        if fmt == "jsonl":
+            self._fp = open(path, "w", encoding="utf-8")
+        else:
+            self._fp = open(path, "wb")
+        self._parquet_writer = None
+        if fmt == "parquet":
+            self._parquet_writer = pyarrow.parquet.ParquetWriter(self._fp, _get_parquet_schema())
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+
+    def _write_batch(self, batch: List[List[Any]]):
+        """
+        serializes batch of records into the file
+        """
+        if self.format == "jsonl":
+            self._fp.write("".join(
+                json.dumps(dict(zip(RESULT_FIELDS, record)), ensure_ascii=False) + "\n" for record in batch))
+        else:
+            columns = {name: [record[i] for record in batch] for i, name in enumerate(RESULT_FIELDS)}
+            if self.format == "parquet":
+                table = pyarrow.Table.from_pydict(columns, schema=_get_parquet_schema())
+                self._parquet_writer.write_table(table)
+            else:
+                self._fp.write(msgpack.packb(columns, use_bin_type=True))
+
+    def _write_loop(self):
+        """
+        runs in background thread, writes batches until None is received
+        """
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                return
+            if self._error is not None:
+                # keep draining the queue, so that evaluation is not blocked
+                continue
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                self._error = e
+
+    def _check_error(self):
+        if self._error is not None:
+            raise RuntimeError("Failed to write results to {}: {}".format(self.path, self._error))
+
+    def write(self, unnormalized: str, expected: str, obtained: str, tags: List[str] = None, latency: float = 0.0,
+              deduplicated: bool = False):
+        """
+        Adds a record of evaluating a single utterance
+
+        Parameters
+        ----------
+        unnormalized: str
+            input utterance
+        expected: str
+            reference normalization
+        obtained: str
+            normalization produced by the rules
+        tags: List[str]
+            semiotic classes of the utterance, if known
+        latency: float
+            time spent on normalization, in seconds
+        deduplicated: bool
+            whether result is taken from previous occurrence of the same pair, without normalization.
+            Latency of such records is 0
+        """
+        self._batch.append([unnormalized, expected, obtained, expected == obtained, list(tags or []), latency,
+                            deduplicated])
+        if len(self._batch) >= self._batch_size:
+            self._check_error()
+            self._queue.put(self._batch)
+            self._batch = []
+
+    def close(self):
+        """
+        Writes remaining records and waits for the background thread to finish
+        """
+        if self._batch:
+            self._queue.put(self._batch)
+            self._batch = []
+        self._queue.put(None)
+        self._thread.join()
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+        self._fp.close()
+        self._check_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def read_results(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Reads results stored by :class:`ResultWriter`. Format is deduced from the extension.
+
+    Parameters
+    ----------
+    path: str
+        path to results file (`.jsonl`, `.parquet` or `.msgpack`)
+
+    Returns
+    -------
+    records: Iterator[Dict[str, Any]]
+        records with input, expected, obtained, match, tags, latency and deduplicated fields
+    """
+    if path.endswith(".jsonl"):
+        with open(path, "r", encoding="utf-8") as fp:
+            for line in fp:
+                yield json.loads(line)
+    elif path.endswith(".parquet"):
+        if pyarrow is None:
+            raise RuntimeError("pyarrow is required to read {}".format(path))
+        for batch in pyarrow.parquet.ParquetFile(path).iter_batches():
+            yield from batch.to_pylist()
+    elif path.endswith(".msgpack"):
+        with open(path, "rb") as fp:
+            for columns in msgpack.Unpacker(fp, raw=False):
+                for values in zip(*[columns[x] for x in RESULT_FIELDS]):
+                    yield dict(zip(RESULT_FIELDS, values))
+    else:
+        raise RuntimeError("Can't deduce format of results from {}".format(path))
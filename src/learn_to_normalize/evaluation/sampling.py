@@ -0,0 +1,168 @@
+"""
+Copyright 2022 Balacoon
+
+data iterators that wrap another data iterator
+in order to shard or subsample the data deterministically.
+"""
+
+import random
+import logging
+from typing import Dict, List, Tuple
+
+from learn_to_normalize.evaluation.data_iterator import DataIterator
+
+# semiotic classes that are present almost in every utterance and are not used for stratification
+NON_INFORMATIVE_CLASSES = {"PLAIN", "PUNCT"}
+
+
+class ShardedDataIterator(DataIterator):
+    """
+    Iterates over every `count`-th utterance of wrapped data iterator, starting from `index`.
+    Shards with the same `count` and different `index` cover the data without overlaps,
+    which allows to split work between nodes reproducibly.
+    """
+
+    def __init__(self, data_iterator: DataIterator, index: int, count: int):
+        """
+        Parameters
+        ----------
+        data_iterator: DataIterator
+            iterator to shard
+        index: int
+            index of the shard, from 0 to count - 1
+        count: int
+            total number of shards
+        """
+        if not 0 <= index < count:
+            raise RuntimeError("Shard index should be in [0, {}), got {}".format(count, index))
+        self._data_iterator = data_iterator
+        self._index = index
+        self._count = count
+        self._position = 0
+
+    def __iter__(self):
+        iter(self._data_iterator)
+        self._position = 0
+        return self
+
+    def __next__(self) -> Tuple[str, str]:
+        while True:
+            pair = next(self._data_iterator)
+            position = self._position
+            self._position += 1
+            if position % self._count == self._index:
+                return pair
+
+    def get_semiotic_classes(self) -> List[str]:
+        return self._data_iterator.get_semiotic_classes()
+
+    def estimate_length(self) -> int:
+        length = self._data_iterator.estimate_length()
+        return length // self._count if length > 0 else -1
+
+    def get_token_spans(self) -> List[Tuple[str, int, int]]:
+        return self._data_iterator.get_token_spans()
+
+
+class SampledDataIterator(DataIterator):
+    """
+    Iterates over a random subset of `n` utterances from wrapped data iterator.
+    The data is read once with reservoir sampling, so only the sample is kept in memory.
+    Sampled utterances are returned in the order they appear in the data.
+
+    If `stratified`, sampling is balanced across semiotic classes: each utterance is
+    attributed to its rarest (seen so far) semiotic class, a reservoir of size `n`
+    is kept per class and the final sample takes utterances from the classes in turns.
+    """
+
+    SUPPORTS_LENGTH_ESTIMATION = True
+
+    def __init__(self, data_iterator: DataIterator, n: int, seed: int = 0, stratified: bool = False):
+        """
+        Parameters
+        ----------
+        data_iterator: DataIterator
+            iterator to sample from
+        n: int
+            number of utterances to sample
+        seed: int
+            random seed, same seed gives the same sample
+        stratified: bool
+            whether to balance the sample across semiotic classes
+        """
+        self._data_iterator = data_iterator
+        self._n = n
+        self._seed = seed
+        self._stratified = stratified
+        self._sample = []  # list of (position, unnormalized, normalized, semiotic classes, token spans)
+        self._sample_idx = 0
+
+    @staticmethod
+    def _add_to_reservoir(reservoir: List, seen: int, item: Tuple, capacity: int, rng: random.Random):
+        """
+        Algorithm R: keeps uniform sample of `capacity` items out of `seen` ones
+        """
+        if len(reservoir) < capacity:
+            reservoir.append(item)
+        else:
+            idx = rng.randrange(seen)
+            if idx < capacity:
+                reservoir[idx] = item
+
+    def _collect_uniform(self, rng: random.Random) -> List[Tuple]:
+        reservoir = []
+        for position, (unnorm, norm) in enumerate(self._data_iterator):
+            item = (position, unnorm, norm, self._data_iterator.get_semiotic_classes(),
+                    self._data_iterator.get_token_spans())
+            self._add_to_reservoir(reservoir, position + 1, item, self._n, rng)
+        return reservoir
+
+    def _collect_stratified(self, rng: random.Random) -> List[Tuple]:
+        reservoirs: Dict[str, List[Tuple]] = {}
+        seen: Dict[str, int] = {}
+        for position, (unnorm, norm) in enumerate(self._data_iterator):
+            classes = self._data_iterator.get_semiotic_classes()
+            informative = sorted(set(classes) - NON_INFORMATIVE_CLASSES) or ["PLAIN"]
+            stratum = min(informative, key=lambda x: seen.get(x, 0))
+            seen[stratum] = seen.get(stratum, 0) + 1
+            item = (position, unnorm, norm, classes, self._data_iterator.get_token_spans())
+            self._add_to_reservoir(reservoirs.setdefault(stratum, []), seen[stratum], item, self._n, rng)
+        # take utterances from strata in turns, until sample is complete
+        sample = []
+        strata = [reservoirs[x] for x in sorted(reservoirs)]
+        for reservoir in strata:
+            rng.shuffle(reservoir)
+        while len(sample) < self._n and any(strata):
+            for reservoir in strata:
+                if reservoir and len(sample) < self._n:
+                    sample.append(reservoir.pop())
+        logging.info("Sampled {} utterances from {} semiotic classes: {}".format(
+            len(sample), len(seen), ", ".join("{}={}".format(x, seen[x]) for x in sorted(seen))))
+        return sample
+
+    def __iter__(self):
+        rng = random.Random(self._seed)
+        sample = self._collect_stratified(rng) if self._stratified else self._collect_uniform(rng)
+        self._sample = sorted(sample, key=lambda x: x[0])
+        self._sample_idx = 0
+        return self
+
+    def __next__(self) -> Tuple[str, str]:
+        if self._sample_idx >= len(self._sample):
+            raise StopIteration
+        _, unnorm, norm, _, _ = self._sample[self._sample_idx]
+        self._sample_idx += 1
+        return unnorm, norm
+
+    def estimate_length(self) -> int:
+        return self._n
+
+    def get_semiotic_classes(self) -> List[str]:
+        if self._sample_idx == 0:
+            return []
+        return self._sample[self._sample_idx - 1][3]
+
+    def get_token_spans(self) -> List[Tuple[str, int, int]]:
+        if self._sample_idx == 0:
+            return []
+        return self._sample[self._sample_idx - 1][4]
@@ -0,0 +1,303 @@
+"""
+Copyright 2022 Balacoon
+
+Fuzzer that searches for inputs with worst-case latency.
+Inputs are sampled from the language accepted by grammars,
+mutated and timed. Slowest and failing inputs are stored
+as a corpus, that can seed regression tests.
+"""
+
+import os
+import heapq
+import time
+import random
+import logging
+import argparse
+from typing import Any, Callable, List, Tuple
+
+import pynini
+
+from learn_to_normalize.grammar_utils.base_fst import BaseFst
+from learn_to_normalize.grammar_utils.grammar_loader import GrammarLoader
+from learn_to_normalize.grammar_utils.shortcuts import single_char_punct_str
+
+
+def parse_args():
+    ap = argparse.ArgumentParser(
+        description="Searches for inputs that are slow to normalize or fail normalization",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    ap.add_argument("--grammars", required=True, help="Directory with grammars")
+    ap.add_argument(
+        "--grammar",
+        action="append",
+        help="Grammar to fuzz as <module>:<class>, for ex. classify.cardinal:CardinalFst. "
+        "Can be specified multiple times. By default fuzzes classify.classify:ClassifyFst",
+    )
+    ap.add_argument(
+        "--addon",
+        help="If provided, full addon normalization is timed instead of grammar application. "
+        "Grammars are still used to sample inputs",
+    )
+    ap.add_argument("--locale", default="", help="Locale to pick from multi-locale addon")
+    ap.add_argument("--samples", default=200, type=int, help="Number of inputs to sample from each grammar")
+    ap.add_argument("--max-length", default=50, type=int, help="Max length of a path sampled from a grammar")
+    ap.add_argument("--mutations", default=3, type=int, help="Number of mutations applied to each input")
+    ap.add_argument(
+        "--rounds",
+        default=3,
+        type=int,
+        help="Number of rounds that mutate the slowest inputs found so far further",
+    )
+    ap.add_argument("--keep", default=50, type=int, help="Number of slowest / failing inputs to keep per grammar")
+    ap.add_argument("--seed", default=42, type=int, help="Random seed for sampling and mutations")
+    ap.add_argument("--out", default="fuzz_corpus", help="Directory to store found inputs to")
+    args = ap.parse_args()
+    return args
+
+
+class LatencyFuzzer:
+    """
+    Samples inputs from the grammar, mutates them and keeps track
+    of the slowest and failing ones.
+    """
+
+    def __init__(self, grammar: BaseFst, measure: Callable[[str], Any], keep: int = 50, seed: int = 42):
+        """
+        Parameters
+        ----------
+        grammar: BaseFst
+            grammar to sample inputs from
+        measure: Callable[[str], Any]
+            function that processes unescaped input, its execution time is measured
+        keep: int
+            number of slowest / failing inputs to keep
+        seed: int
+            seed for sampling and mutations
+        """
+        self._grammar = grammar
+        self._measure = measure
+        self._keep = keep
+        self._seed = seed
+        self._rng = random.Random(seed)
+        self._slowest = []  # heap of (elapsed, text)
+        self._failing = {}  # text -> error message
+        self._seen = set()
+        self.measured = 0
+
+    def sample(self, num: int, max_length: int) -> List[str]:
+        """
+        Samples random paths from the grammar and returns their input strings
+
+        Parameters
+        ----------
+        num: int
+            number of paths to sample
+        max_length: int
+            max length of a path
+
+        Returns
+        -------
+        inputs: List[str]
+            unique input strings accepted by the grammar
+        """
+        lattice = pynini.randgen(self._grammar.fst, npath=num, seed=self._seed, max_length=max_length)
+        return sorted(set(lattice.paths().istrings()))
+
+    def mutate(self, text: str, pool: List[str]) -> str:
+        """
+        Applies random mutation to the text. Mutations try to grow
+        the input in a way that stresses composition: repeated substrings,
+        runs of digits or punctuation, splicing with other inputs.
+
+        Parameters
+        ----------
+        text: str
+            input to mutate
+        pool: List[str]
+            other inputs that can be spliced with the text
+
+        Returns
+        -------
+        mutated: str
+            mutated input
+        """
+        rng = self._rng
+        pos = rng.randint(0, len(text))
+        kind = rng.choice(["repeat", "digits", "punct", "splice", "delete", "case"])
+        if kind == "repeat" and text:
+            start = rng.randint(0, len(text) - 1)
+            chunk = text[start: rng.randint(start + 1, len(text))]
+            return text[:start] + chunk * rng.randint(2, 8) + text[start:]
+        if kind == "digits":
+            digits = "".join(rng.choice("0123456789") for _ in range(rng.randint(5, 50)))
+            return text[:pos] + digits + text[pos:]
+        if kind == "punct":
+            punct = "".join(rng.choice(single_char_punct_str) for _ in range(rng.randint(3, 30)))
+            return text[:pos] + punct + text[pos:]
+        if kind == "splice" and pool:
+            return text + rng.choice([" ", "-", "/", ""]) + rng.choice(pool)
+        if kind == "delete" and text:
+            start = rng.randint(0, len(text) - 1)
+            return text[:start] + text[rng.randint(start + 1, len(text)):]
+        end = rng.randint(pos, len(text))
+        return text[:pos] + text[pos:end].swapcase() + text[end:]
+
+    def run(self, text: str) -> float:
+        """
+        Measures processing time of the input, tracking the slowest and failing ones
+
+        Parameters
+        ----------
+        text: str
+            unescaped input to measure
+
+        Returns
+        -------
+        elapsed: float
+            processing time in seconds, -1 if input was measured before
+        """
+        if text in self._seen or "\n" in text:
+            return -1
+        self._seen.add(text)
+        self.measured += 1
+        start = time.perf_counter()
+        try:
+            self._measure(text)
+        except Exception as e:
+            if len(self._failing) < self._keep:
+                self._failing[text] = str(e).replace("\n", " ")
+        elapsed = time.perf_counter() - start
+        if len(self._slowest) < self._keep:
+            heapq.heappush(self._slowest, (elapsed, text))
+        elif elapsed > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, (elapsed, text))
+        return elapsed
+
+    def fuzz(self, samples: int, max_length: int, mutations: int, rounds: int):
+        """
+        Runs fuzzing: measures sampled inputs and their mutations, then
+        repeatedly mutates the slowest inputs found so far.
+
+        Parameters
+        ----------
+        samples: int
+            number of inputs to sample from the grammar
+        max_length: int
+            max length of sampled path
+        mutations: int
+            number of mutations per input
+        rounds: int
+            number of rounds that mutate the slowest inputs
+        """
+        pool = self.sample(samples, max_length)
+        for text in pool:
+            self.run(text)
+            for _ in range(mutations):
+                self.run(self.mutate(text, pool))
+        for _ in range(rounds):
+            for _, text in self.get_slowest():
+                for _ in range(mutations):
+                    self.run(self.mutate(text, pool))
+
+    def get_slowest(self) -> List[Tuple[float, str]]:
+        """
+        Returns
+        -------
+        slowest: List[Tuple[float, str]]
+            slowest inputs with their processing time, starting from the slowest
+        """
+        return sorted(self._slowest, reverse=True)
+
+    def get_failing(self) -> List[Tuple[str, str]]:
+        """
+        Returns
+        -------
+        failing: List[Tuple[str, str]]
+            inputs that failed processing along with an error message
+        """
+        return list(self._failing.items())
+
+    def get_scaling(self, text: str, max_repeats: int = 8) -> List[Tuple[int, float]]:
+        """
+        Measures how processing time grows when input is repeated,
+        which reveals grammars with superlinear composition cost.
+
+        Parameters
+        ----------
+        text: str
+            input to repeat
+        max_repeats: int
+            max number of repetitions, input is repeated 1, 2, 4, ... times
+
+        Returns
+        -------
+        timings: List[Tuple[int, float]]
+            number of repetitions and corresponding processing time
+        """
+        timings = []
+        repeats = 1
+        while repeats <= max_repeats:
+            start = time.perf_counter()
+            try:
+                self._measure(" ".join([text] * repeats))
+            except Exception:
+                break
+            timings.append((repeats, time.perf_counter() - start))
+            repeats *= 2
+        return timings
+
+
+def store_corpus(fuzzer: LatencyFuzzer, out_dir: str, name: str):
+    """
+    Stores slowest and failing inputs found by fuzzer.
+    `<name>.slowest.txt` and `<name>.failing.txt` contain just inputs, one per line,
+    so they can be fed to `demo_normalize --file`. `.tsv` files also contain timing / error.
+    """
+    slowest = fuzzer.get_slowest()
+    failing = fuzzer.get_failing()
+    with open(os.path.join(out_dir, name + ".slowest.txt"), "w", encoding="utf-8") as fp:
+        fp.writelines(text + "\n" for _, text in slowest)
+    with open(os.path.join(out_dir, name + ".slowest.tsv"), "w", encoding="utf-8") as fp:
+        fp.writelines("{:.6f}\t{}\t{}\n".format(elapsed, len(text), text) for elapsed, text in slowest)
+    with open(os.path.join(out_dir, name + ".failing.txt"), "w", encoding="utf-8") as fp:
+        fp.writelines(text + "\n" for text, _ in failing)
+    with open(os.path.join(out_dir, name + ".failing.tsv"), "w", encoding="utf-8") as fp:
+        fp.writelines("{}\t{}\n".format(text, error) for text, error in failing)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    os.makedirs(args.out, exist_ok=True)
+
+    loader = GrammarLoader(args.grammars)
+    normalizer = None
+    if args.addon:
+        from balacoon_frontend import TextNormalizer
+        normalizer = TextNormalizer(args.addon, args.locale)
+
+    for grammar_str in args.grammar or ["classify.classify:ClassifyFst"]:
+        module_str, class_name = grammar_str.split(":")
+        grammar = loader.get_grammar(module_str, class_name)
+        if normalizer:
+            measure = normalizer.normalize
+        else:
+            measure = lambda x: grammar.apply(pynini.escape(x))  # noqa: E731
+        fuzzer = LatencyFuzzer(grammar, measure, keep=args.keep, seed=args.seed)
+        fuzzer.fuzz(args.samples, args.max_length, args.mutations, args.rounds)
+        store_corpus(fuzzer, args.out, class_name)
+
+        slowest = fuzzer.get_slowest()
+        logging.info("{}: measured {} inputs, {} failed".format(
+            class_name, fuzzer.measured, len(fuzzer.get_failing())))
+        for elapsed, text in slowest[:5]:
+            logging.info("{:.4f} sec for [{}]".format(elapsed, text))
+        for _, text in slowest[:3]:
+            timings = fuzzer.get_scaling(text)
+            if len(timings) < 2:
+                continue
+            # ratio of time growth per doubling of input, ~2 is linear
+            growth = (timings[-1][1] / max(timings[0][1], 1e-9)) ** (1.0 / (len(timings) - 1))
+            logging.info("{}: time grows x{:.2f} per doubling of [{}]{}".format(
+                class_name, growth, text, ", superlinear!" if growth > 2.5 else ""))
@@ -0,0 +1,217 @@
+"""
+Copyright 2022 Balacoon
+
+Measures which grammars fire on a corpus. Tokenizer FST is
+applied to every utterance and produced tokens are counted
+per grammar name, together with time spent on them.
+Helps to find rarely used but expensive parts of the grammars.
+"""
+
+import os
+import time
+import tempfile
+import logging
+import argparse
+import multiprocessing
+from collections import Counter
+from typing import Iterator, List
+
+import pynini
+import tqdm
+
+from learn_to_normalize.evaluation.data_iterator_factory import get_data_iterator, get_supported_datasets
+from learn_to_normalize.grammar_utils.grammar_loader import GrammarLoader
+from learn_to_normalize.grammar_utils.token_parser import parse_tokens
+
+# name under which tokens not produced by any grammar are counted
+PLAIN_TOKEN = "<plain>"
+
+# tokenizer fst loaded in a worker process
+_worker_fst = None
+
+
+def parse_args():
+    ap = argparse.ArgumentParser(
+        description="Counts how many tokens each grammar classifies on a corpus and how much time it takes",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    ap.add_argument("--grammars", required=True, help="Directory with grammars")
+    ap.add_argument(
+        "--dataset",
+        required=True,
+        choices=get_supported_datasets(),
+        help="Dataset name, defines how to parse data from datadir",
+    )
+    ap.add_argument("--datadir", required=True, help="Location of the data, see `evaluate`")
+    ap.add_argument("--subset", default="all", help="Subset of the data to run over")
+    ap.add_argument("--num", default=-1, type=int, help="Number of utterances to process. By default - all")
+    ap.add_argument("--jobs", default=1, type=int, help="Number of worker processes that apply the tokenizer")
+    ap.add_argument("--chunk-size", default=256, type=int, help="Number of utterances sent to a worker at once")
+    ap.add_argument("--top", default=50, type=int, help="Number of grammars and connections to report")
+    ap.add_argument("--out", help="If provided, stores full coverage report as tsv")
+    args = ap.parse_args()
+    return args
+
+
+class GrammarCoverage:
+    """
+    Accumulates coverage statistics from tokenizer outputs.
+    Time of classifying utterance is attributed to produced tokens proportionally
+    to their length, since tokenizer is applied to the whole utterance at once.
+
+    Besides counts per grammar, counts sequences of `<grammar> <plain token> <same grammar>`,
+    which is what multi-token branches added by :func:`BaseFst.connect_to_self` produce
+    (for ex. "cardinal ~to~ cardinal" for ranges). Same sequence can also come from
+    ordinary adjacent tokens, so those counts are an upper bound on branch usage.
+    """
+
+    def __init__(self):
+        self.tokens = Counter()  # grammar name -> number of tokens
+        self.time = Counter()  # grammar name -> attributed time, in seconds
+        self.connected = Counter()  # "grammar ~connector~ grammar" -> number of occurrences
+        self.utterances = 0
+        self.failed = 0
+        self.total_time = 0.0
+
+    def add(self, classified: str, elapsed: float):
+        """
+        Adds statistics of classifying a single utterance
+
+        Parameters
+        ----------
+        classified: str
+            tokenizer output
+        elapsed: float
+            time spent on classification, in seconds
+        """
+        self.utterances += 1
+        self.total_time += elapsed
+        tokens = parse_tokens(classified)
+        lengths = [x.get_text_length() + 1 for x in tokens]
+        total_length = float(sum(lengths))
+        for idx, (token, length) in enumerate(zip(tokens, lengths)):
+            name = token.name or PLAIN_TOKEN
+            self.tokens[name] += 1
+            self.time[name] += elapsed * length / total_length
+            if 0 < idx < len(tokens) - 1 and not token.name and tokens[idx - 1].name \
+                    and tokens[idx - 1].name == tokens[idx + 1].name:
+                connector = " ".join(str(value) for _, value in token.fields)
+                self.connected["{0} ~{1}~ {0}".format(tokens[idx - 1].name, connector)] += 1
+
+    def add_failure(self, elapsed: float):
+        """
+        accounts for utterance that tokenizer failed to process
+        """
+        self.utterances += 1
+        self.failed += 1
+        self.total_time += elapsed
+
+    def update(self, other: "GrammarCoverage"):
+        """
+        merges statistics collected elsewhere, for ex. in another worker
+        """
+        self.tokens.update(other.tokens)
+        self.time.update(other.time)
+        self.connected.update(other.connected)
+        self.utterances += other.utterances
+        self.failed += other.failed
+        self.total_time += other.total_time
+
+    def report(self, top: int = 50):
+        """
+        Writes grammars sorted by attributed time into the log
+        """
+        logging.info("Classified {} utterances in {:.2f}s, {} failed".format(
+            self.utterances, self.total_time, self.failed))
+        total_tokens = max(sum(self.tokens.values()), 1)
+        total_time = max(self.total_time, 1e-9)
+        logging.info("{:<24} {:>10} {:>8} {:>10} {:>8} {:>12}".format(
+            "grammar", "tokens", "tokens%", "time,s", "time%", "us/token"))
+        for name, elapsed in self.time.most_common(top):
+            count = self.tokens[name]
+            logging.info("{:<24} {:>10} {:>8.2f} {:>10.2f} {:>8.2f} {:>12.1f}".format(
+                name, count, 100.0 * count / total_tokens, elapsed, 100.0 * elapsed / total_time,
+                1e6 * elapsed / count))
+        if self.connected:
+            logging.info("Most frequent connected tokens (possible connect_to_self branches):")
+            for name, count in self.connected.most_common(top):
+                logging.info("  {}: {}".format(name, count))
+
+    def store(self, path: str):
+        """
+        stores coverage of all grammars as tsv
+        """
+        with open(path, "w", encoding="utf-8") as fp:
+            fp.write("grammar\ttokens\ttime\n")
+            for name, elapsed in self.time.most_common():
+                fp.write("{}\t{}\t{:.6f}\n".format(name, self.tokens[name], elapsed))
+            for name, count in self.connected.most_common():
+                fp.write("{}\t{}\t\n".format(name, count))
+
+
+def _cover(fst: pynini.Fst, texts: List[str]) -> GrammarCoverage:
+    """
+    applies tokenizer to utterances and collects coverage
+    """
+    coverage = GrammarCoverage()
+    for text in texts:
+        start = time.perf_counter()
+        try:
+            lattice = pynini.escape(text) @ fst
+            classified = pynini.shortestpath(lattice, nshortest=1, unique=True).string()
+        except Exception:
+            coverage.add_failure(time.perf_counter() - start)
+            continue
+        coverage.add(classified, time.perf_counter() - start)
+    return coverage
+
+
+def _init_worker(fst_path: str):
+    """
+    loads tokenizer fst once per worker
+    """
+    global _worker_fst
+    _worker_fst = pynini.Fst.read(fst_path)
+
+
+def _cover_chunk(texts: List[str]) -> GrammarCoverage:
+    return _cover(_worker_fst, texts)
+
+
+def _iter_chunks(data_iterator, chunk_size: int) -> Iterator[List[str]]:
+    chunk = []
+    for unnormalized, _ in data_iterator:
+        chunk.append(unnormalized)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+
+    loader = GrammarLoader(args.grammars)
+    fst = loader.get_grammar("classify.classify", "ClassifyFst").fst
+    data_iterator = get_data_iterator(name=args.dataset, location=args.datadir, subset=args.subset,
+                                      n_utterances=args.num)
+    chunks = tqdm.tqdm(_iter_chunks(data_iterator, args.chunk_size), unit="chunk")
+    coverage = GrammarCoverage()
+    if args.jobs <= 1:
+        for chunk in chunks:
+            coverage.update(_cover(fst, chunk))
+    else:
+        # workers read compiled fst from disk instead of compiling grammars again
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            fst_path = os.path.join(tmp_dir, "tokenizer.fst")
+            fst.write(fst_path)
+            context = multiprocessing.get_context("spawn")
+            with context.Pool(processes=args.jobs, initializer=_init_worker, initargs=(fst_path,)) as pool:
+                for chunk_coverage in pool.imap_unordered(_cover_chunk, chunks):
+                    coverage.update(chunk_coverage)
+    coverage.report(args.top)
+    if args.out:
+        coverage.store(args.out)
+        logging.info("Stored coverage report to {}".format(args.out))
@@ -16,7 +16,15 @@ Recipe interacts with grammar directory through utils
 Some functions and pynini shortcuts that are reused in grammars
 throughout the locales are in data_loader.py and shortcuts.py
 
+Grammars can be exported as FST types optimized for runtime, see fst_types.py
+
+Grammar modules can be reloaded in-process when they change, see grammar_watcher.py
+
+Output of tokenization/classification can be parsed in python
+with `parse_tokens` from token_parser.py
+
 """
 
-from learn_to_normalize.grammar_utils.base_fst import BaseFst
+from learn_to_normalize.grammar_utils.base_fst import BaseFst, LatticeSizeError
 from learn_to_normalize.grammar_utils.grammar_loader import GrammarLoader
+from learn_to_normalize.grammar_utils.token_parser import ParsedToken, parse_tokens
@@ -4,7 +4,8 @@ Copyright 2022 Balacoon
 base class for all the grammars
 """
 
-from typing import Union, List
+import time
+from typing import Any, Dict, Union, List, Optional
 
 import pynini
 from pynini.lib import pynutil
@@ -12,6 +13,13 @@ from pynini.lib import pynutil
 from learn_to_normalize.grammar_utils.shortcuts import wrap_token, delete_space, insert_space
 
 
+class LatticeSizeError(RuntimeError):
+    """
+    Raised when lattice of applying grammar to input exceeds allowed size,
+    which is a sign of ambiguous grammar
+    """
+
+
 class BaseFst:
     """
     Base class for text normalization rules. Wrapper around
@@ -25,15 +33,71 @@ class BaseFst:
     multi or single fst depending on what's available.
 
     When reusing fst in other semiotic classes you probably want to access single_fst though.
+
+    By default, each :func:`.connect_to_self` call optimizes accumulated multi-token fst.
+    With deferred optimization (see :func:`.set_deferred_optimization`), branches are only
+    recorded and optimized together once, when fst is accessed first time. Accepted language
+    is the same, but grammars with many connectors are built faster.
     """
 
+    # whether to postpone optimization of multi-token branches until fst is accessed
+    DEFERRED_OPTIMIZATION = False
+    # time spent on optimizing multi-token fsts, shared by all grammars
+    OPTIMIZATION_STATS = {"branches": 0, "optimizations": 0, "time": 0.0}
+
     def __init__(self, name: str):
         self._name = name
         self._single_fst = None
         self._multi_fst = None
+        self._pending_branches = []  # multi-token branches that are not yet merged into multi-token fst
+
+    @classmethod
+    def set_deferred_optimization(cls, enabled: bool):
+        """
+        Switches deferred optimization of multi-token branches for grammars created afterwards.
+
+        Parameters
+        ----------
+        enabled: bool
+            if True, :func:`.connect_to_self` only records branches,
+            which are merged and optimized once, when fst is accessed
+        """
+        BaseFst.DEFERRED_OPTIMIZATION = enabled
+
+    @classmethod
+    def get_optimization_stats(cls) -> Dict[str, Any]:
+        """
+        Returns
+        -------
+        stats: Dict[str, Any]
+            number of multi-token branches added with :func:`.connect_to_self`,
+            number of optimizations run on multi-token fsts and total time of those, in seconds
+        """
+        return dict(BaseFst.OPTIMIZATION_STATS)
+
+    @classmethod
+    def reset_optimization_stats(cls):
+        """
+        Zeroes statistics of optimization of multi-token fsts, for ex. before building another addon section
+        """
+        BaseFst.OPTIMIZATION_STATS = {"branches": 0, "optimizations": 0, "time": 0.0}
+
+    def _merge_branches(self, branches: List[pynini.FstLike]):
+        """
+        unions branches into multi-token fst and optimizes the result
+        """
+        start = time.perf_counter()
+        multi_fst = self._multi_fst if self._multi_fst is not None else self._single_fst
+        self._multi_fst = pynini.union(multi_fst, *branches)
+        self._multi_fst.optimize()
+        BaseFst.OPTIMIZATION_STATS["optimizations"] += 1
+        BaseFst.OPTIMIZATION_STATS["time"] += time.perf_counter() - start
 
     @property
     def fst(self) -> pynini.FstLike:
+        if self._pending_branches:
+            branches, self._pending_branches = self._pending_branches, []
+            self._merge_branches(branches)
         if self._multi_fst is not None:
             return self._multi_fst
         assert self._single_fst is not None, "both single- and multi-token fsts are None for {}".format(self.name)
@@ -153,13 +217,27 @@ class BaseFst:
         multi_fst = self.single_fst + extra_fst
         if weight != 1.0:
             multi_fst = pynutil.add_weight(multi_fst, weight)
-        if self._multi_fst is not None:
-            self._multi_fst |= multi_fst
+        BaseFst.OPTIMIZATION_STATS["branches"] += 1
+        if self.DEFERRED_OPTIMIZATION:
+            self._pending_branches.append(multi_fst)
         else:
-            self._multi_fst = self._single_fst | multi_fst
-        self._multi_fst.optimize()
+            self._merge_branches([multi_fst])
+
+    @staticmethod
+    def get_lattice_size(lattice: pynini.Fst) -> Dict[str, int]:
+        """
+        Returns
+        -------
+        size: Dict[str, int]
+            number of states and arcs in the lattice
+        """
+        return {
+            "states": lattice.num_states(),
+            "arcs": sum(lattice.num_arcs(state) for state in lattice.states()),
+        }
 
-    def apply(self, text: str) -> str:
+    def apply(self, text: str, prune_weight: Optional[float] = None, max_lattice_states: int = -1,
+              stats: Optional[Dict[str, Any]] = None) -> str:
         """
         helper method to apply the grammar to input text
 
@@ -167,6 +245,16 @@ class BaseFst:
         ----------
         text: str
             input string to apply transducer to
+        prune_weight: Optional[float]
+            if provided, paths of the lattice with weight worse than the best one
+            by more than this threshold are pruned before searching for the best path
+        max_lattice_states: int
+            if > 0, max number of states in the lattice. Larger lattices raise :class:`LatticeSizeError`.
+            Lattice is checked once it is composed, so the limit bounds the cost of the search
+            and flags ambiguous grammars, but not the cost of composition itself
+        stats: Optional[Dict[str, Any]]
+            if provided, it is filled with size of the lattice (`states`, `arcs`), its size after
+            pruning (`pruned_states`, `pruned_arcs`) and time of composition and best path search, in seconds
 
         Returns
         -------
@@ -175,6 +263,23 @@ class BaseFst:
             string parsable into protobuf. In case of verbalization,
             converts the text into spoken form
         """
+        start = time.perf_counter()
         lattice = text @ self.fst
+        compose_time = time.perf_counter() - start
+        if stats is not None or max_lattice_states > 0:
+            size = self.get_lattice_size(lattice)
+            if stats is not None:
+                stats.update(size)
+                stats["compose_time"] = compose_time
+            if 0 < max_lattice_states < size["states"]:
+                raise LatticeSizeError("Lattice of {} for [{}] has {} states, {} arcs, which exceeds {} states".format(
+                    self._name, text, size["states"], size["arcs"], max_lattice_states))
+        start = time.perf_counter()
+        if prune_weight is not None:
+            lattice = pynini.prune(lattice, weight=prune_weight)
+            if stats is not None:
+                stats.update({"pruned_" + key: value for key, value in self.get_lattice_size(lattice).items()})
         res = pynini.shortestpath(lattice, nshortest=1, unique=True).string()
+        if stats is not None:
+            stats["shortestpath_time"] = time.perf_counter() - start
         return res
@@ -0,0 +1,137 @@
+"""
+Copyright 2022 Balacoon
+
+helpers to export grammars as FST types other than default mutable vector FST.
+
+- `const` - immutable FST stored in a few flat arrays. Loads with a couple of large reads
+  instead of per-state allocations, and takes less resident memory.
+- `compact_unweighted` - immutable FST with compact arc representation. Only applicable
+  to unweighted FSTs, for ex. verbalizers that have no weighted alternatives.
+- `arc_lookahead` - FST with lookahead matcher. When used as the right operand of
+  composition (`input @ tokenizer`), composition looks ahead along tokenizer arcs
+  and doesn't expand paths that can't match the rest of the input.
+
+Label lookahead types (`ilabel_lookahead`, `olabel_lookahead`) are not offered:
+they relabel the FST, and the same relabeling would have to be applied to input
+strings at runtime, which balacoon_frontend doesn't do.
+Lookahead types require OpenFST built with lookahead FSTs registered,
+both for export and for the runtime that loads the addon. With pynini wheels
+from PyPI, lookahead FSTs are not available, check :func:`get_supported_fst_types`.
+"""
+
+import os
+import sys
+import logging
+import functools
+import contextlib
+from typing import List, Tuple
+
+import pynini
+import pywrapfst
+
+# FST type produced by pynini by default
+DEFAULT_FST_TYPE = "vector"
+FST_TYPES = [DEFAULT_FST_TYPE, "const", "compact_unweighted", "arc_lookahead"]
+
+
+def convert_fst(fst: pynini.Fst, fst_type: str) -> pywrapfst.Fst:
+    """
+    Converts fst to the given type, preparing it first if type requires that
+
+    Parameters
+    ----------
+    fst: pynini.Fst
+        fst to convert
+    fst_type: str
+        one of `FST_TYPES`
+
+    Returns
+    -------
+    fst: pywrapfst.Fst
+        converted fst
+    """
+    if fst_type not in FST_TYPES:
+        raise RuntimeError("Unsupported FST type {}, pick one from {}".format(fst_type, FST_TYPES))
+    if fst_type == DEFAULT_FST_TYPE:
+        return fst
+    if fst_type == "arc_lookahead":
+        # lookahead matcher on input side expects input labels to be sorted
+        fst = fst.copy().arcsort("ilabel")
+    try:
+        return pywrapfst.convert(fst, fst_type=fst_type)
+    except pywrapfst.FstOpError as e:
+        if fst_type.endswith("lookahead"):
+            hint = "Lookahead FST types require OpenFST built with --enable-lookahead-fsts"
+        elif fst_type.startswith("compact"):
+            hint = "Compact FST types are only applicable to FSTs matching the compactor, for ex. unweighted ones"
+        else:
+            hint = "FST type is not supported"
+        raise RuntimeError("Failed to convert fst to {}. {}: {}".format(fst_type, hint, e))
+
+
+@contextlib.contextmanager
+def _silence_stderr():
+    """
+    hides errors OpenFST writes directly to stderr file descriptor
+    """
+    sys.stderr.flush()
+    saved_fd = os.dup(2)
+    devnull_fd = os.open(os.devnull, os.O_WRONLY)
+    try:
+        os.dup2(devnull_fd, 2)
+        yield
+    finally:
+        os.dup2(saved_fd, 2)
+        os.close(saved_fd)
+        os.close(devnull_fd)
+
+
+@functools.lru_cache(maxsize=None)
+def _probe_fst_types() -> Tuple[str, ...]:
+    """
+    tries to convert a small fst to each of the types, once per process
+    """
+    # unweighted probe, so that compact types are checked for availability only
+    probe = pynini.cross("ab", "ba").optimize()
+    supported = []
+    with _silence_stderr():
+        for fst_type in FST_TYPES:
+            try:
+                convert_fst(probe, fst_type)
+                supported.append(fst_type)
+            except RuntimeError:
+                logging.debug("{} FST type is not supported".format(fst_type))
+    return tuple(supported)
+
+
+def get_supported_fst_types() -> List[str]:
+    """
+    Returns
+    -------
+    fst_types: List[str]
+        FST types from `FST_TYPES`, that current OpenFST build can convert to.
+        Whether particular fst can be converted, depends on its properties
+    """
+    return list(_probe_fst_types())
+
+
+def write_far(fst: pynini.Fst, rule_name: str, out_path: str, fst_type: str = DEFAULT_FST_TYPE):
+    """
+    Stores fst of the given type into FAR
+
+    Parameters
+    ----------
+    fst: pynini.Fst
+        fst to store
+    rule_name: str
+        name under which to store fst in FAR
+    out_path: str
+        path to store FAR to
+    fst_type: str
+        one of `FST_TYPES`
+    """
+    converted = convert_fst(fst, fst_type)
+    writer = pywrapfst.FarWriter.create(out_path, arc_type=converted.arc_type())
+    writer.add(rule_name, converted)
+    # FAR is finalized when writer is destroyed
+    del writer
@@ -15,6 +15,7 @@ import pynini
 from pynini.export import grm
 
 from learn_to_normalize.grammar_utils.base_fst import BaseFst
+from learn_to_normalize.grammar_utils.fst_types import DEFAULT_FST_TYPE, write_far
 
 
 class GrammarLoader:
@@ -29,7 +30,18 @@ class GrammarLoader:
         "verbalizer_serialization_spec.ascii_proto",
     ]
 
-    def __init__(self, grammars_dir: str):
+    def __init__(self, grammars_dir: str, deferred_optimization: bool = False):
+        """
+        Parameters
+        ----------
+        grammars_dir: str
+            directory with normalization grammars
+        deferred_optimization: bool
+            if True, multi-token branches of grammars are optimized once, when grammar fst is accessed,
+            instead of each time branch is added. Applies only to grammars created by this loader.
+            See :class:`BaseFst`
+        """
+        self._deferred_optimization = deferred_optimization
         # all imports within grammars repo are done relative to parent dir of grammar repo.
         # so <grammar_repo>/../ should be added to PYTHONPATH and suffix stored to be used
         # during grammar loading. First <grammar_repo> directory should be identified
@@ -66,6 +78,20 @@ class GrammarLoader:
                     )
                 )
 
+    @property
+    def grammars_dir(self) -> str:
+        """
+        absolute path to directory with grammars
+        """
+        return self._grammars_dir
+
+    @property
+    def module_prefix(self) -> str:
+        """
+        prefix of grammar modules, for ex. `en_us_normalization.production`
+        """
+        return self._module_prefix
+
     def get_grammar(self, module_str: str, class_name: str) -> BaseFst:
         """
         Loads grammar from grammar dir based on module name and class name of the grammar
@@ -95,14 +121,20 @@ class GrammarLoader:
         if not hasattr(module, class_name):
             raise RuntimeError("{} doesn't have {}".format(grammar_path, class_name))
         grammar_class = getattr(module, class_name)
-        grammar = grammar_class()
+        # optimization mode is global, switch it only while this loader creates the grammar
+        previous = BaseFst.DEFERRED_OPTIMIZATION
+        BaseFst.set_deferred_optimization(self._deferred_optimization)
+        try:
+            grammar = grammar_class()
+        finally:
+            BaseFst.set_deferred_optimization(previous)
         assert isinstance(
             grammar, BaseFst
         ), "loaded grammar does not inherit base grammar"
         return grammar
 
     @staticmethod
-    def _serialize_fst(fst: pynini.FstLike, rule_name: str, out_path: str) -> bytes:
+    def _serialize_fst(fst: pynini.FstLike, rule_name: str, out_path: str, fst_type: str = DEFAULT_FST_TYPE) -> bytes:
         """
         Exports FAR, reads exported far as bytes.
         TODO: check if possible to serialize without saving to disk
@@ -115,20 +147,25 @@ class GrammarLoader:
             name under which to store fst in FAR
         out_path: str
             path to export FAR to during serialization
+        fst_type: str
+            type of fst to store in FAR, see :mod:`learn_to_normalize.grammar_utils.fst_types`
 
         Returns
         -------
         res: bytes
             serialized fst as bytes
         """
-        exporter = grm.Exporter(out_path)
-        exporter[rule_name] = fst
-        exporter.close()
+        if fst_type == DEFAULT_FST_TYPE:
+            exporter = grm.Exporter(out_path)
+            exporter[rule_name] = fst
+            exporter.close()
+        else:
+            write_far(fst, rule_name, out_path, fst_type=fst_type)
         with open(out_path, "rb") as fp:
             res = fp.read()
         return res
 
-    def get_verbalizer(self, work_dir: str) -> bytes:
+    def get_verbalizer(self, work_dir: str, fst_type: str = DEFAULT_FST_TYPE) -> bytes:
         """
         Exports verbalizer, stores FAR on disk, returns serialized FAR
 
@@ -136,6 +173,8 @@ class GrammarLoader:
         ----------
         work_dir: str
             directory to store verbalizer FAR to
+        fst_type: str
+            type of fst to export verbalizer as, for ex. `const` to reduce load time and memory
 
         Returns
         -------
@@ -145,9 +184,9 @@ class GrammarLoader:
         verb_path = os.path.join(work_dir, "verbalizer.far")
         verb = self.get_grammar("verbalize.verbalize", "VerbalizeFst")
         # should match rule name in configs/verbalizer.ascii_proto
-        return self._serialize_fst(verb.fst, "ALL", verb_path)
+        return self._serialize_fst(verb.fst, "ALL", verb_path, fst_type=fst_type)
 
-    def get_tokenizer(self, work_dir: str) -> bytes:
+    def get_tokenizer(self, work_dir: str, fst_type: str = DEFAULT_FST_TYPE) -> bytes:
         """
         Exports tokenizer/classifier, stores FAR on disk, returns serialized FAR
 
@@ -155,6 +194,8 @@ class GrammarLoader:
         ----------
         work_dir: str
             directory to store tokenizer FAR to
+        fst_type: str
+            type of fst to export tokenizer as, for ex. `arc_lookahead` to speed up composition with input
 
         Returns
         -------
@@ -164,7 +205,7 @@ class GrammarLoader:
         classify_path = os.path.join(work_dir, "tokenizer.far")
         classify = self.get_grammar("classify.classify", "ClassifyFst")
         # should match rule name in configs/tokenizer.ascii_proto
-        return self._serialize_fst(classify.fst, "TOKENIZE_AND_CLASSIFY", classify_path)
+        return self._serialize_fst(classify.fst, "TOKENIZE_AND_CLASSIFY", classify_path, fst_type=fst_type)
 
     @staticmethod
     def _read_text_file(path: str) -> str:
@@ -0,0 +1,223 @@
+"""
+Copyright 2022 Balacoon
+
+Watches grammars directory for changes and reloads only affected grammar modules
+in-process, so grammars can be rebuilt without restarting and re-importing everything.
+Reloading is incremental, but the grammar itself is then rebuilt in full,
+since grammar classes construct their sub-grammars in `__init__`.
+"""
+
+import os
+import ast
+import sys
+import logging
+import importlib
+import importlib.util
+from typing import Dict, List, Set
+
+from learn_to_normalize.grammar_utils.grammar_loader import GrammarLoader
+
+# extensions of data files that grammars load
+DATA_EXTENSIONS = (".tsv", ".csv", ".txt")
+
+
+class GrammarWatcher:
+    """
+    Polls modification times of grammar modules and data files.
+    Dependencies between modules are obtained by parsing their imports, and modules
+    depend on data files whose names appear in their string literals.
+    When files change, modules that changed, that refer to changed data files,
+    and all the modules that import those (transitively) are reloaded, dependencies first.
+    Data files that are not referred to by any module trigger reload of all grammar modules.
+    Extra watched files (for ex. probe inputs) are reported by :func:`.poll`, but never trigger reloads.
+    """
+
+    def __init__(self, loader: GrammarLoader, extra_paths: List[str] = None):
+        """
+        Parameters
+        ----------
+        loader: GrammarLoader
+            loader grammars are obtained with
+        extra_paths: List[str]
+            additional files to watch, for ex. file with probe inputs. Those don't trigger reloads
+        """
+        self._grammars_dir = loader.grammars_dir
+        self._prefix = loader.module_prefix
+        self._extra_paths = [os.path.abspath(x) for x in extra_paths or []]
+        self._mtimes = self._scan()
+        self._imports: Dict[str, Set[str]] = {}  # module -> grammar modules it imports
+        self._data_refs: Dict[str, Set[str]] = {}  # data file name -> modules referring to it
+        self._build_graph()
+
+    def _scan(self) -> Dict[str, float]:
+        """
+        modification times of watched files
+        """
+        mtimes = {}
+        for root, dirs, files in os.walk(self._grammars_dir):
+            dirs[:] = [x for x in dirs if not x.startswith(".") and x != "__pycache__"]
+            for name in files:
+                if name.endswith(".py") or name.endswith(DATA_EXTENSIONS):
+                    path = os.path.join(root, name)
+                    mtimes[path] = os.path.getmtime(path)
+        for path in self._extra_paths:
+            if os.path.isfile(path):
+                mtimes[path] = os.path.getmtime(path)
+        return mtimes
+
+    def _get_module_name(self, path: str) -> str:
+        """
+        name of the module under which grammar file is imported
+        """
+        rel_path = os.path.relpath(path, self._grammars_dir)[: -len(".py")]
+        parts = rel_path.split(os.sep)
+        if parts[-1] == "__init__":
+            parts = parts[:-1]
+        return ".".join([self._prefix] + parts)
+
+    def _parse_module(self, path: str, module: str, data_names: Set[str]) -> Set[str]:
+        """
+        parses grammar module, returns grammar modules it imports and records data files it refers to
+        """
+        try:
+            with open(path, "r", encoding="utf-8") as fp:
+                tree = ast.parse(fp.read(), filename=path)
+        except (SyntaxError, UnicodeDecodeError) as e:
+            # file is probably being edited, it is parsed again once it changes
+            logging.warning("Can't parse {}: {}".format(path, e))
+            return set()
+        package = module if path.endswith("__init__.py") else module.rpartition(".")[0]
+        imported = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                imported.update(alias.name for alias in node.names)
+            elif isinstance(node, ast.ImportFrom):
+                base = node.module or ""
+                if node.level:
+                    base = importlib.util.resolve_name("." * node.level + base, package)
+                imported.add(base)
+                # `from package import module` imports a module as well
+                imported.update(base + "." + alias.name for alias in node.names)
+            elif isinstance(node, ast.Constant) and isinstance(node.value, str):
+                name = os.path.basename(node.value)
+                if name in data_names:
+                    self._data_refs.setdefault(name, set()).add(module)
+        return set(x for x in imported if x == self._prefix or x.startswith(self._prefix + "."))
+
+    def _build_graph(self):
+        """
+        collects imports of other grammar modules and references to data files from all grammar modules
+        """
+        self._imports = {}
+        self._data_refs = {}
+        data_names = set(os.path.basename(x) for x in self._mtimes
+                         if x.endswith(DATA_EXTENSIONS) and x not in self._extra_paths)
+        for path in self._mtimes:
+            if path.endswith(".py") and path.startswith(self._grammars_dir):
+                module = self._get_module_name(path)
+                self._imports[module] = self._parse_module(path, module, data_names)
+
+    def poll(self) -> List[str]:
+        """
+        Returns
+        -------
+        changed: List[str]
+            files that were modified, added or removed since the last poll
+        """
+        mtimes = self._scan()
+        changed = [path for path, mtime in mtimes.items() if self._mtimes.get(path) != mtime]
+        changed.extend(path for path in self._mtimes if path not in mtimes)
+        self._mtimes = mtimes
+        return sorted(changed)
+
+    def get_affected_modules(self, changed: List[str]) -> List[str]:
+        """
+        Finds grammar modules that have to be reloaded because of changed files
+
+        Parameters
+        ----------
+        changed: List[str]
+            changed files, see :func:`.poll`
+
+        Returns
+        -------
+        modules: List[str]
+            modules to reload, ordered so that dependencies go before modules importing them
+        """
+        affected = set()
+        for path in changed:
+            if path in self._extra_paths:
+                continue
+            if path.endswith(".py") and path.startswith(self._grammars_dir):
+                affected.add(self._get_module_name(path))
+            elif path.endswith(DATA_EXTENSIONS) and path.startswith(self._grammars_dir):
+                referring = self._data_refs.get(os.path.basename(path))
+                # if it is not clear which module loads the data, reload everything
+                affected.update(referring or self._imports.keys())
+        return self._order(self._add_dependents(affected))
+
+    def _add_dependents(self, modules: Set[str]) -> Set[str]:
+        """
+        extends modules with all the modules that import them, directly or transitively
+        """
+        dependents: Dict[str, Set[str]] = {}
+        for module, imported in self._imports.items():
+            for name in imported:
+                dependents.setdefault(name, set()).add(module)
+        modules = set(modules)
+        queue = list(modules)
+        while queue:
+            for dependent in dependents.get(queue.pop(), set()):
+                if dependent not in modules:
+                    modules.add(dependent)
+                    queue.append(dependent)
+        return modules
+
+    def _order(self, modules: Set[str]) -> List[str]:
+        """
+        orders modules so that dependencies go first
+        """
+        ordered, visited = [], set()
+
+        def _visit(module: str):
+            visited.add(module)
+            for name in sorted(self._imports.get(module, set())):
+                if name in modules and name not in visited:
+                    _visit(name)
+            ordered.append(module)
+
+        for module in sorted(modules):
+            if module not in visited:
+                _visit(module)
+        return ordered
+
+    def reload(self, changed: List[str]) -> List[str]:
+        """
+        Reloads grammar modules affected by changed files. Modules that were not imported yet
+        are skipped, those are imported on next :func:`GrammarLoader.get_grammar`.
+        Grammars have to be created again with reloaded modules, which builds all their sub-grammars.
+
+        Parameters
+        ----------
+        changed: List[str]
+            changed files, see :func:`.poll`
+
+        Returns
+        -------
+        reloaded: List[str]
+            names of reloaded modules
+        """
+        self._build_graph()
+        importlib.invalidate_caches()
+        reloaded = []
+        for name in self.get_affected_modules(changed):
+            module = sys.modules.get(name)
+            if module is None:
+                continue
+            if not os.path.isfile(getattr(module, "__file__", None) or ""):
+                # module was removed
+                del sys.modules[name]
+                continue
+            importlib.reload(module)
+            reloaded.append(name)
+        return reloaded
@@ -0,0 +1,96 @@
+"""
+Copyright 2022 Balacoon
+
+parser of tokenization/classification output, i.e. strings like
+
+::
+
+    tokens { name: "hi" } tokens { cardinal { integer: "12" } }
+
+Those are normally parsed into protobuf by balacoon_frontend.
+Parser here is used to analyze grammars from python.
+"""
+
+import re
+from typing import Any, List, NamedTuple, Tuple
+
+# quoted value ends with a quote that is followed by closing bracket or by next field/message.
+# values themselves may contain quotes, for ex. `name: ""x""`
+_VALUE = re.compile(r'"(.*?)"(?=\s*(?:}|[A-Za-z_][A-Za-z0-9_]*\s*[:{]))', re.DOTALL)
+_KEY = re.compile(r"\s*([A-Za-z_][A-Za-z0-9_]*)\s*([:{])\s*")
+_CLOSE = re.compile(r"\s*}")
+
+
+class ParsedToken(NamedTuple):
+    """
+    Single token of classification output
+    """
+
+    name: str
+    """ name of the grammar (semiotic class) that produced the token, empty for plain tokens """
+    fields: List[Tuple[str, Any]]
+    """ fields of the token. values are strings or, for nested messages, lists of fields """
+
+    def get_text_length(self) -> int:
+        """
+        total length of field values, approximates length of input span the token was produced from
+        """
+        return _get_fields_length(self.fields)
+
+
+def _get_fields_length(fields: List[Tuple[str, Any]]) -> int:
+    return sum(len(value) if isinstance(value, str) else _get_fields_length(value) for _, value in fields)
+
+
+def _parse_message(text: str, pos: int) -> Tuple[List[Tuple[str, Any]], int]:
+    """
+    parses fields of a message until closing bracket, returns fields and position after the bracket
+    """
+    fields = []
+    while True:
+        close = _CLOSE.match(text, pos)
+        if close:
+            return fields, close.end()
+        key = _KEY.match(text, pos)
+        if not key:
+            raise RuntimeError("Can't parse tokens at position {}: [{}]".format(pos, text[pos: pos + 50]))
+        if key.group(2) == "{":
+            value, pos = _parse_message(text, key.end())
+        else:
+            value_match = _VALUE.match(text, key.end())
+            if not value_match:
+                raise RuntimeError("Can't parse value of {} at position {}: [{}]".format(
+                    key.group(1), key.end(), text[key.end(): key.end() + 50]))
+            value, pos = value_match.group(1), value_match.end()
+        fields.append((key.group(1), value))
+
+
+def parse_tokens(text: str) -> List[ParsedToken]:
+    """
+    Parses output of tokenization/classification grammar
+
+    Parameters
+    ----------
+    text: str
+        classification output, sequence of `tokens { ... }`
+
+    Returns
+    -------
+    tokens: List[ParsedToken]
+        parsed tokens. Tokens produced by a grammar, i.e. `tokens { cardinal { ... } }`
+        get the name of the grammar, while fields of plain tokens (`tokens { name: "hi" }`)
+        are stored directly, with empty name
+    """
+    fields, pos = _parse_message(text + " }", 0)
+    if pos != len(text) + 2:
+        raise RuntimeError("Unbalanced brackets in [{}]".format(text))
+    tokens = []
+    for key, value in fields:
+        if key != "tokens" or isinstance(value, str):
+            raise RuntimeError("Expected sequence of `tokens {{ ... }}`, got {} in [{}]".format(key, text))
+        if len(value) == 1 and not isinstance(value[0][1], str):
+            # token produced by a grammar
+            tokens.append(ParsedToken(value[0][0], value[0][1]))
+        else:
+            tokens.append(ParsedToken("", value))
+    return tokens
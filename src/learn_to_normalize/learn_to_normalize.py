@@ -8,11 +8,15 @@ import os
 import shutil
 import argparse
 import logging
-
-import msgpack
+import multiprocessing
+from typing import Any, Dict
 
 from balacoon_frontend import TextNormalizer as tn
 
+from learn_to_normalize.addon.addon_io import LAYOUTS, write_addon
+from learn_to_normalize.addon.compression import CODECS, NO_COMPRESSION, compress_section
+from learn_to_normalize.grammar_utils.base_fst import BaseFst
+from learn_to_normalize.grammar_utils.fst_types import DEFAULT_FST_TYPE, FST_TYPES, get_supported_fst_types
 from learn_to_normalize.grammar_utils.grammar_loader import GrammarLoader
 
 
@@ -24,43 +28,183 @@ def parse_args():
     ap.add_argument(
         "--grammars",
         required=True,
+        nargs="+",
         help="Directory with normalization grammars. Those are stored in repos that are submodules to this repo. "
-        "For ex. `grammars/en_us_normalization/production`",
+        "For ex. `grammars/en_us_normalization/production`. Multiple directories can be provided "
+        "to build several locales at once, one per each locale in `--locale`",
     )
     ap.add_argument(
         "--locale",
         required=True,
+        nargs="+",
         help="Locale corresponding to resources, that will be stored in addon. For ex. `en_us`",
     )
     ap.add_argument(
         "--work-dir",
         default="work_dir",
-        help="Working directory to put intermediate artifacts to",
+        help="Working directory to put intermediate artifacts to. "
+        "If multiple locales are built, each gets its own subdirectory",
     )
     ap.add_argument(
         "--out",
-        help="Path to put produced artifact to. It is also stored at work_dir/normalization.addon",
+        help="Path to put produced artifact to. It is also stored at work_dir/normalization.addon. "
+        "If `--split` is specified, it is a directory to put per-locale addons to",
+    )
+    ap.add_argument(
+        "--layout",
+        default="msgpack",
+        choices=LAYOUTS,
+        help="Layout of the addon:\n"
+        "`msgpack` - single msgpack list, expected by balacoon_frontend\n"
+        "`mapped` - index header followed by aligned uncompressed FARs, that can be memory-mapped",
+    )
+    ap.add_argument(
+        "--compress",
+        default=NO_COMPRESSION,
+        choices=CODECS,
+        help="Codec to compress tokenizer/verbalizer FARs with. Makes addon smaller for distribution, "
+        "but balacoon_frontend expects uncompressed FARs, so such addon has to be unpacked "
+        "with `compress_addon --codec none` before use. Only for `msgpack` layout. "
+        "zstd and lz4 fall back to zlib if not installed",
+    )
+    ap.add_argument(
+        "--tokenizer-fst-type",
+        default=DEFAULT_FST_TYPE,
+        choices=FST_TYPES,
+        help="Type of tokenizer FST stored in addon. `const` loads faster and takes less memory, "
+        "`arc_lookahead` speeds up composition with input, but requires OpenFST with lookahead FSTs "
+        "both at build time and in balacoon_frontend (not available with pynini from PyPI). "
+        "Availability is checked before grammars are compiled. Compare types with `benchmark_fst_types`",
+    )
+    ap.add_argument(
+        "--verbalizer-fst-type",
+        default=DEFAULT_FST_TYPE,
+        choices=FST_TYPES,
+        help="Type of verbalizer FST stored in addon. `const` loads faster and takes less memory, "
+        "`compact_unweighted` is even smaller, but only applicable if verbalizer is unweighted",
+    )
+    ap.add_argument(
+        "--deferred-optimization",
+        action="store_true",
+        help="Optimize multi-token branches of grammars once, when grammar is used, "
+        "instead of each time a branch is added. Speeds up compilation of grammars with many connectors",
+    )
+    ap.add_argument(
+        "--split",
+        action="store_true",
+        help="If multiple locales are built, store them in separate addons "
+        "(work_dir/<locale>/normalization.addon) instead of a single multi-locale addon",
+    )
+    ap.add_argument(
+        "--jobs",
+        default=-1,
+        type=int,
+        help="Number of locales to compile in parallel. By default - all at once",
     )
     args = ap.parse_args()
+    if len(args.grammars) != len(args.locale):
+        ap.error("Number of --grammars and --locale should match")
+    if args.layout == "mapped" and args.compress != NO_COMPRESSION:
+        ap.error("Mapped layout stores uncompressed FARs to memory-map them, it can't be combined with --compress")
+    # check before grammars are compiled, which takes a while
+    for fst_type in {args.tokenizer_fst_type, args.verbalizer_fst_type} - {DEFAULT_FST_TYPE}:
+        if fst_type not in get_supported_fst_types():
+            ap.error("{} FST type is not available in current OpenFST build, supported types: {}".format(
+                fst_type, ", ".join(get_supported_fst_types())))
     return args
 
 
-def main():
-    logging.basicConfig(level=logging.INFO)
-    args = parse_args()
+def build_section(
+    grammars: str,
+    locale: str,
+    work_dir: str,
+    deferred_optimization: bool = False,
+    tokenizer_fst_type: str = DEFAULT_FST_TYPE,
+    verbalizer_fst_type: str = DEFAULT_FST_TYPE,
+) -> Dict[Any, Any]:
+    """
+    Compiles grammars of a single locale into addon section
+
+    Parameters
+    ----------
+    grammars: str
+        directory with normalization grammars
+    locale: str
+        locale corresponding to the grammars
+    work_dir: str
+        directory to put intermediate artifacts to
+    deferred_optimization: bool
+        whether to postpone optimization of multi-token branches, see :class:`BaseFst`
+    tokenizer_fst_type: str
+        type of tokenizer fst to store in the addon
+    verbalizer_fst_type: str
+        type of verbalizer fst to store in the addon
 
-    loader = GrammarLoader(args.grammars)
+    Returns
+    -------
+    addon: Dict[Any, Any]
+        addon section with configs and serialized FARs
+    """
+    loader = GrammarLoader(grammars, deferred_optimization=deferred_optimization)
+    # report optimization of this section only, even if several sections are built in the same process
+    BaseFst.reset_optimization_stats()
     # TODO reuse fields from text_normalization package
-    addon = {tn.AddonFields.ID_KEY: tn.AddonFields.ID_VALUE, tn.AddonFields.LOCALE: args.locale}
+    addon = {tn.AddonFields.ID_KEY: tn.AddonFields.ID_VALUE, tn.AddonFields.LOCALE: locale}
     tokenizer_config, verbalizer_config, verbalizer_specification = loader.get_configs()
     addon[tn.AddonFields.TOKENIZER_CONFIG] = tokenizer_config
     addon[tn.AddonFields.VERBALIZER_CONFIG] = verbalizer_config
     addon[tn.AddonFields.VERBALIZER_SPECIFICATION] = verbalizer_specification
-    os.makedirs(args.work_dir, exist_ok=True)
-    addon[tn.AddonFields.TOKENIZER] = loader.get_tokenizer(args.work_dir)
-    addon[tn.AddonFields.VERBALIZER] = loader.get_verbalizer(args.work_dir)
-    default_addon_path = os.path.join(args.work_dir, "normalization.addon")
-    with open(default_addon_path, "wb") as fp:
-        msgpack.dump([addon], fp)
-    if args.out:
-        shutil.copy(default_addon_path, args.out)
+    os.makedirs(work_dir, exist_ok=True)
+    addon[tn.AddonFields.TOKENIZER] = loader.get_tokenizer(work_dir, fst_type=tokenizer_fst_type)
+    addon[tn.AddonFields.VERBALIZER] = loader.get_verbalizer(work_dir, fst_type=verbalizer_fst_type)
+    stats = BaseFst.get_optimization_stats()
+    logging.info("{}: {} multi-token branches, optimized in {} calls, {:.2f}s ({} optimization)".format(
+        locale, stats["branches"], stats["optimizations"], stats["time"],
+        "deferred" if deferred_optimization else "eager"))
+    return addon
+
+
+def _build_section_job(job_args) -> Dict[Any, Any]:
+    """
+    Builds section in worker process. Each locale is compiled in a freshly spawned process,
+    so `sys.path` modifications and imported grammar modules of one locale don't leak into another.
+    """
+    grammars, locale, work_dir, deferred_optimization, tokenizer_fst_type, verbalizer_fst_type = job_args
+    logging.basicConfig(level=logging.INFO)
+    logging.info("Compiling {} from {}".format(locale, grammars))
+    return build_section(grammars, locale, work_dir, deferred_optimization, tokenizer_fst_type, verbalizer_fst_type)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+
+    if len(args.locale) == 1:
+        work_dirs = [args.work_dir]
+        sections = [build_section(args.grammars[0], args.locale[0], args.work_dir, args.deferred_optimization,
+                                  args.tokenizer_fst_type, args.verbalizer_fst_type)]
+    else:
+        work_dirs = [os.path.join(args.work_dir, x) for x in args.locale]
+        jobs = args.jobs if args.jobs > 0 else len(args.locale)
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(processes=jobs, maxtasksperchild=1) as pool:
+            fst_types = (args.tokenizer_fst_type, args.verbalizer_fst_type)
+            jobs_args = [(grammars, locale, work_dir, args.deferred_optimization) + fst_types
+                         for grammars, locale, work_dir in zip(args.grammars, args.locale, work_dirs)]
+            sections = pool.map(_build_section_job, jobs_args, chunksize=1)
+    if args.compress != NO_COMPRESSION:
+        sections = [compress_section(x, args.compress) for x in sections]
+
+    if args.split:
+        if args.out:
+            os.makedirs(args.out, exist_ok=True)
+        for locale, work_dir, section in zip(args.locale, work_dirs, sections):
+            addon_path = os.path.join(work_dir, "normalization.addon")
+            write_addon([section], addon_path, layout=args.layout)
+            if args.out:
+                shutil.copy(addon_path, os.path.join(args.out, locale + ".addon"))
+    else:
+        default_addon_path = os.path.join(args.work_dir, "normalization.addon")
+        write_addon(sections, default_addon_path, layout=args.layout)
+        if args.out:
+            shutil.copy(default_addon_path, args.out)
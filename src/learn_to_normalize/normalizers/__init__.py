@@ -0,0 +1,31 @@
+"""
+Normalizers
+===========
+Wrappers around text normalizers that are used by demos and evaluation.
+Those do not change normalization itself, but make it cheaper or safer
+to run on large amounts of text.
+
+.. autosummary::
+    :toctree: generated/
+    :nosignatures:
+    :template: class.rst
+
+    LruCache
+    CachedNormalizer
+    GuardedNormalizer
+
+Reference normalizer runs grammars with pynini directly, so it is not imported here,
+keeping pynini out of normalization with addons:
+
+.. autosummary::
+    :toctree: generated/
+    :nosignatures:
+    :template: class.rst
+
+    learn_to_normalize.normalizers.reference_normalizer.ReferenceNormalizer
+    learn_to_normalize.normalizers.plain_text_prefilter.PlainTextPrefilter
+
+"""
+
+from learn_to_normalize.normalizers.cached_normalizer import LruCache, CachedNormalizer
+from learn_to_normalize.normalizers.guarded_normalizer import GuardedNormalizer
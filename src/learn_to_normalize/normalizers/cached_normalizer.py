@@ -0,0 +1,272 @@
+"""
+Copyright 2022 Balacoon
+
+Caching wrapper around text normalizer.
+Normalization of repeated utterances is served from memory.
+"""
+
+import os
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+import msgpack
+
+
+def get_addon_hash(addon_path: str, locale: str = "") -> str:
+    """
+    Computes digest of the addon file, that identifies normalization rules.
+    Results obtained with one addon are not valid for another one.
+
+    Parameters
+    ----------
+    addon_path: str
+        path to the addon with normalization rules
+    locale: str
+        locale that is picked from the addon, since multi-locale addons
+        produce different results depending on the locale
+
+    Returns
+    -------
+    digest: str
+        hex digest of addon content and locale
+    """
+    hasher = hashlib.sha1()
+    with open(addon_path, "rb") as fp:
+        for chunk in iter(lambda: fp.read(1 << 20), b""):
+            hasher.update(chunk)
+    hasher.update(locale.encode("utf-8"))
+    return hasher.hexdigest()
+
+
+class LruCache:
+    """
+    Bounded least-recently-used cache. Memory is bounded both by number of entries
+    and by accumulated size of entries (number of characters in keys and values).
+    Tracks hits, misses and evictions.
+    """
+
+    def __init__(self, max_entries: int = 100000, max_chars: int = -1):
+        """
+        Parameters
+        ----------
+        max_entries: int
+            max number of entries to keep. if <= 0, number of entries is not bounded.
+        max_chars: int
+            max accumulated size of keys and values. if <= 0, size is not bounded.
+        """
+        self._max_entries = max_entries
+        self._max_chars = max_chars
+        self._entries = OrderedDict()
+        self._chars = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _size(key: Hashable, value: Any) -> int:
+        """
+        approximate size of the entry, used for size-aware eviction
+        """
+        size = len(key) if isinstance(key, str) else 1
+        size += len(value) if isinstance(value, str) else 1
+        return size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Looks up the key in the cache, marking it as recently used.
+
+        Parameters
+        ----------
+        key: Hashable
+            key to look up
+
+        Returns
+        -------
+        value: Optional[Any]
+            cached value or None if key is not in the cache
+        """
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        """
+        Stores the value in the cache, evicting least recently used entries if needed.
+
+        Parameters
+        ----------
+        key: Hashable
+            key to store value under
+        value: Any
+            value to store
+        """
+        if key in self._entries:
+            self._chars -= self._size(key, self._entries.pop(key))
+        self._entries[key] = value
+        self._chars += self._size(key, value)
+        while self._entries and (
+            0 < self._max_entries < len(self._entries) or 0 < self._max_chars < self._chars
+        ):
+            old_key, old_value = self._entries.popitem(last=False)
+            self._chars -= self._size(old_key, old_value)
+            self.evictions += 1
+
+    def items(self):
+        """
+        iterates over cached entries from least to most recently used
+        """
+        return self._entries.items()
+
+    def get_stats(self) -> Dict[str, float]:
+        """
+        Returns
+        -------
+        stats: Dict[str, float]
+            hits, misses, evictions, current size and hit rate of the cache
+        """
+        requests = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "chars": self._chars,
+            "hit_rate": self.hits / float(requests) if requests else 0.0,
+        }
+
+
+class CachedNormalizer:
+    """
+    Wraps a normalizer (anything with `normalize(str) -> str`, for ex. `balacoon_frontend.TextNormalizer`)
+    and memorizes its results in a bounded LRU cache. Entries are keyed by addon hash and input text,
+    so cache persisted on disk can be shared between runs and addons without mixing up results.
+    """
+
+    def __init__(
+        self,
+        normalizer: Any,
+        addon_hash: str,
+        max_entries: int = 100000,
+        max_chars: int = -1,
+        cache_path: str = None,
+    ):
+        """
+        Parameters
+        ----------
+        normalizer: Any
+            normalizer to wrap, should have `normalize` method
+        addon_hash: str
+            identifier of normalization rules, see :func:`get_addon_hash`
+        max_entries: int
+            max number of utterances to keep in cache
+        max_chars: int
+            max number of characters (inputs and outputs) to keep in cache
+        cache_path: str
+            if provided, cache is loaded from this path at creation
+            and stored back with :func:`.save`
+        """
+        self._normalizer = normalizer
+        self._addon_hash = addon_hash
+        self._cache = LruCache(max_entries=max_entries, max_chars=max_chars)
+        self._cache_path = cache_path
+        # entries of other addons found in persisted cache, stored back as is
+        self._foreign_entries = []
+        if cache_path and os.path.isfile(cache_path):
+            self._load(cache_path)
+
+    def _load(self, path: str):
+        """
+        loads persisted entries, which are stored as list of [addon_hash, text, normalized]
+        """
+        with open(path, "rb") as fp:
+            entries = msgpack.load(fp)
+        loaded = 0
+        for addon_hash, text, normalized in entries:
+            if addon_hash == self._addon_hash:
+                self._cache.put(text, normalized)
+                loaded += 1
+            else:
+                self._foreign_entries.append([addon_hash, text, normalized])
+        logging.info("Loaded {} cached normalizations from {}".format(loaded, path))
+
+    def save(self, path: str = None):
+        """
+        Persists cache to disk, so it can be reused in the next run.
+
+        Parameters
+        ----------
+        path: str
+            where to store the cache. By default, the path cache was created with is used.
+        """
+        path = path or self._cache_path
+        if not path:
+            raise RuntimeError("No path to store normalization cache to")
+        entries = list(self._foreign_entries)
+        entries.extend([self._addon_hash, text, normalized] for text, normalized in self._cache.items())
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as fp:
+            msgpack.dump(entries, fp)
+        os.replace(tmp_path, path)
+
+    def normalize(self, text: str) -> str:
+        """
+        Normalizes text, reusing previous result if the same text was already normalized.
+
+        Parameters
+        ----------
+        text: str
+            utterance to normalize
+
+        Returns
+        -------
+        normalized: str
+            normalized utterance
+        """
+        normalized = self._cache.get(text)
+        if normalized is None:
+            normalized = self._normalizer.normalize(text)
+            self._cache.put(text, normalized)
+        return normalized
+
+    def get_stats(self) -> Dict[str, float]:
+        """
+        Returns
+        -------
+        stats: Dict[str, float]
+            cache hit-rate metrics, see :func:`LruCache.get_stats`
+        """
+        return self._cache.get_stats()
+
+    def log_stats(self):
+        """
+        helper that reports cache performance
+        """
+        stats = self.get_stats()
+        logging.info(
+            "Normalization cache: {:.3f} hit rate ({} hits, {} misses), {} entries, {} evictions".format(
+                stats["hit_rate"], stats["hits"], stats["misses"], stats["entries"], stats["evictions"]
+            )
+        )
+
+    def close(self):
+        """
+        Reports cache stats and persists cache if it was created with a path.
+        Closes wrapped normalizer if it requires that.
+        """
+        self.log_stats()
+        if self._cache_path:
+            self.save()
+        if hasattr(self._normalizer, "close"):
+            self._normalizer.close()
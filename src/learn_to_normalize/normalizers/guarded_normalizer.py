@@ -0,0 +1,266 @@
+"""
+Copyright 2022 Balacoon
+
+Wrapper around text normalizer that protects batch processing
+from pathological inputs by limiting time and size per utterance.
+"""
+
+import time
+import logging
+import multiprocessing
+from multiprocessing.connection import Connection
+from typing import Any, Callable, Dict, List, Optional
+
+
+def _worker_loop(conn: Connection, factory: Callable[[], Any]):
+    """
+    Entry point of normalization worker. Creates normalizer, reports whether it succeeded
+    and normalizes texts received through the pipe until None is received.
+    """
+    try:
+        normalizer = factory()
+    except Exception as e:
+        conn.send((False, str(e)))
+        return
+    conn.send((True, None))
+    while True:
+        text = conn.recv()
+        if text is None:
+            break
+        try:
+            conn.send((True, normalizer.normalize(text)))
+        except Exception as e:
+            conn.send((False, str(e)))
+
+
+class GuardedNormalizer:
+    """
+    Runs normalization within time and size budgets. If timeout is set, normalization happens
+    in a separate worker process, which is killed and restarted if it doesn't respond in time.
+    Utterances that exceed the budget are normalized with a cheap fallback strategy
+    and reported, so they can be investigated later.
+
+    Supported fallback strategies:
+
+    - `passthrough` - input is returned as is
+    - `chunked` - input is split by whitespaces into chunks of at most `chunk_size` characters,
+      which are normalized separately, sharing a single time budget. Chunks that are too long
+      and all the chunks after the budget is exceeded are passed through.
+    """
+
+    FALLBACKS = ["passthrough", "chunked"]
+
+    def __init__(
+        self,
+        factory: Callable[[], Any],
+        timeout: float = -1,
+        max_length: int = -1,
+        fallback: str = "passthrough",
+        chunk_size: int = 100,
+        offenders_path: str = None,
+    ):
+        """
+        Parameters
+        ----------
+        factory: Callable[[], Any]
+            picklable callable that creates normalizer with `normalize(str) -> str` method,
+            for ex. `functools.partial(TextNormalizer, addon, locale)`.
+        timeout: float
+            max time in seconds to normalize single utterance. if <= 0, time is not limited
+            and normalization happens in the current process.
+        max_length: int
+            max length of utterance in characters. Longer utterances go straight to fallback.
+            if <= 0, length is not limited.
+        fallback: str
+            strategy to use when budget is exceeded, one of `FALLBACKS`
+        chunk_size: int
+            max length of chunk for `chunked` fallback
+        offenders_path: str
+            if provided, inputs exceeding the budget are appended to this file
+            as "<reason>\\t<utterance>" lines
+        """
+        if fallback not in self.FALLBACKS:
+            raise RuntimeError("Unknown fallback strategy: {}. Pick one from {}".format(fallback, self.FALLBACKS))
+        self._factory = factory
+        self._timeout = timeout
+        self._max_length = max_length
+        self._fallback = fallback
+        self._chunk_size = chunk_size
+        self._offenders_fp = open(offenders_path, "a", encoding="utf-8") if offenders_path else None
+        self._context = multiprocessing.get_context("spawn")
+        self._normalizer = None  # in-process normalizer, if time is not limited
+        self._process = None  # worker process, if time is limited
+        self._conn = None  # connection to the worker process
+        self._stats = {"timeouts": 0, "too_long": 0, "restarts": 0}
+
+    def _start_worker(self):
+        """
+        starts worker process that normalizes utterances and waits until normalizer is loaded,
+        so loading time is not accounted in the time budget of the first utterance
+        """
+        self._conn, child_conn = self._context.Pipe()
+        self._process = self._context.Process(target=_worker_loop, args=(child_conn, self._factory), daemon=True)
+        self._process.start()
+        child_conn.close()
+        try:
+            is_ok, error = self._conn.recv()
+        except EOFError:
+            is_ok, error = False, "worker process died"
+        if not is_ok:
+            self._process.join()
+            self._conn.close()
+            self._process = None
+            self._conn = None
+            raise RuntimeError("Failed to create normalizer: {}".format(error))
+
+    def _kill_worker(self):
+        """
+        kills worker process that exceeded time budget
+        """
+        self._process.kill()
+        self._process.join()
+        self._conn.close()
+        self._process = None
+        self._conn = None
+        self._stats["restarts"] += 1
+
+    def _run(self, text: str, timeout: float = None) -> Optional[str]:
+        """
+        Normalizes text within time budget.
+
+        Parameters
+        ----------
+        text: str
+            utterance to normalize
+        timeout: float
+            time budget in seconds, by default - the one normalizer is configured with
+
+        Returns
+        -------
+        normalized: Optional[str]
+            normalized text or None if time budget was exceeded
+        """
+        if self._timeout <= 0:
+            if self._normalizer is None:
+                self._normalizer = self._factory()
+            return self._normalizer.normalize(text)
+        if self._process is None:
+            self._start_worker()
+        self._conn.send(text)
+        if not self._conn.poll(self._timeout if timeout is None else timeout):
+            self._kill_worker()
+            return None
+        try:
+            is_ok, result = self._conn.recv()
+        except EOFError:
+            # worker died while normalizing, for ex. ran out of memory
+            self._kill_worker()
+            return None
+        if not is_ok:
+            raise RuntimeError("Failed to normalize [{}]: {}".format(text, result))
+        return result
+
+    def _report(self, reason: str, text: str):
+        """
+        logs the input that exceeded the budget
+        """
+        self._stats[reason] += 1
+        logging.warning("Normalization budget exceeded ({}), using {} fallback for: {}".format(
+            reason, self._fallback, text[:200]))
+        if self._offenders_fp:
+            self._offenders_fp.write("{}\t{}\n".format(reason, text))
+            self._offenders_fp.flush()
+
+    def _split_chunks(self, text: str) -> List[str]:
+        """
+        splits text by whitespaces into chunks of at most `chunk_size` characters.
+        words that are longer than `chunk_size` form their own chunk.
+        """
+        chunks = []
+        current = []
+        current_len = 0
+        for word in text.split():
+            if current and current_len + 1 + len(word) > self._chunk_size:
+                chunks.append(" ".join(current))
+                current = []
+                current_len = 0
+            current_len += len(word) + (1 if current else 0)
+            current.append(word)
+        if current:
+            chunks.append(" ".join(current))
+        return chunks
+
+    def _apply_fallback(self, text: str) -> str:
+        """
+        cheap normalization for utterances exceeding the budget
+        """
+        if self._fallback == "passthrough":
+            return text
+        if self._timeout > 0 and self._process is None:
+            # restart worker killed by timeout before the budget of chunks starts
+            self._start_worker()
+        # all the chunks share a single time budget. Once it is exceeded,
+        # remaining chunks are passed through, so the worker is not restarted again
+        deadline = time.perf_counter() + self._timeout
+        results = []
+        exceeded = False
+        for chunk in self._split_chunks(text):
+            result = None
+            if not exceeded and len(chunk) <= self._chunk_size:
+                if self._timeout > 0:
+                    remaining = deadline - time.perf_counter()
+                    result = self._run(chunk, timeout=remaining) if remaining > 0 else None
+                    exceeded = result is None
+                else:
+                    result = self._run(chunk)
+            results.append(chunk if result is None else result)
+        return " ".join(results)
+
+    def normalize(self, text: str) -> str:
+        """
+        Normalizes text within time and size budgets, falling back to cheap
+        normalization if budgets are exceeded.
+
+        Parameters
+        ----------
+        text: str
+            utterance to normalize
+
+        Returns
+        -------
+        normalized: str
+            normalized utterance
+        """
+        if 0 < self._max_length < len(text):
+            self._report("too_long", text)
+            return self._apply_fallback(text)
+        result = self._run(text)
+        if result is None:
+            self._report("timeouts", text)
+            return self._apply_fallback(text)
+        return result
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        Returns
+        -------
+        stats: Dict[str, int]
+            number of utterances that timed out, that were too long
+            and number of times worker was restarted
+        """
+        return dict(self._stats)
+
+    def close(self):
+        """
+        Stops worker process and reports how many utterances exceeded the budget
+        """
+        if self._process is not None:
+            self._conn.send(None)
+            self._process.join()
+            self._conn.close()
+            self._process = None
+        if self._offenders_fp:
+            self._offenders_fp.close()
+            self._offenders_fp = None
+        logging.info("Normalization guard: {} timeouts, {} too long utterances, {} worker restarts".format(
+            self._stats["timeouts"], self._stats["too_long"], self._stats["restarts"]))
@@ -0,0 +1,133 @@
+"""
+Copyright 2022 Balacoon
+
+factory to create normalizer for the addon,
+wrapped according to command line arguments.
+Shared between demos and evaluation.
+"""
+
+import os
+import atexit
+import argparse
+import functools
+from typing import Any
+
+from balacoon_frontend import TextNormalizer
+
+from learn_to_normalize.addon.compression import ensure_uncompressed
+from learn_to_normalize.normalizers.cached_normalizer import CachedNormalizer, get_addon_hash
+from learn_to_normalize.normalizers.guarded_normalizer import GuardedNormalizer
+
+# number of cached utterances if cache is requested with --cache-path only
+DEFAULT_CACHE_SIZE = 100000
+
+
+def add_normalizer_args(ap: argparse.ArgumentParser):
+    """
+    Adds arguments that configure normalizer wrappers to argument parser
+
+    Parameters
+    ----------
+    ap: argparse.ArgumentParser
+        parser to extend
+    """
+    ap.add_argument(
+        "--cache-size",
+        default=0,
+        type=int,
+        help="If > 0, caches results of normalization for that many utterances. "
+        "If only --cache-path is given, cache keeps up to {} utterances".format(DEFAULT_CACHE_SIZE),
+    )
+    ap.add_argument(
+        "--cache-chars",
+        default=-1,
+        type=int,
+        help="If > 0, additionally bounds normalization cache by number of characters stored",
+    )
+    ap.add_argument(
+        "--cache-path",
+        help="If provided, normalization cache is loaded from / stored to this path. "
+        "Cache is bounded by --cache-size (and --cache-chars) also when persisted",
+    )
+    ap.add_argument(
+        "--timeout",
+        default=-1,
+        type=float,
+        help="If > 0, max time in seconds to normalize single utterance. "
+        "Normalization runs in a worker process that is killed if it exceeds the time",
+    )
+    ap.add_argument(
+        "--max-length",
+        default=-1,
+        type=int,
+        help="If > 0, utterances longer than that many characters are not normalized as a whole",
+    )
+    ap.add_argument(
+        "--fallback",
+        default="passthrough",
+        choices=GuardedNormalizer.FALLBACKS,
+        help="How to normalize utterances that exceed --timeout or --max-length",
+    )
+    ap.add_argument(
+        "--offenders",
+        help="If provided, utterances that exceed --timeout or --max-length are appended to this file",
+    )
+
+
+def create_normalizer(addon: str, locale: str, args: argparse.Namespace) -> Any:
+    """
+    Creates normalizer for the addon, wrapping it according to parsed arguments.
+
+    Parameters
+    ----------
+    addon: str
+        path to the addon with normalization rules. Compressed addons are unpacked to a temporary file
+    locale: str
+        locale to pick from the addon, empty string if addon has a single locale
+    args: argparse.Namespace
+        arguments parsed with parser extended by :func:`add_normalizer_args`
+
+    Returns
+    -------
+    normalizer: Any
+        object that has `normalize(str) -> str` method
+    """
+    addon_hash = get_addon_hash(addon, locale) if args.cache_size > 0 or args.cache_path else ""
+    unpacked_addon = ensure_uncompressed(addon)
+    if unpacked_addon != addon:
+        atexit.register(os.remove, unpacked_addon)
+        addon = unpacked_addon
+    if args.timeout > 0 or args.max_length > 0:
+        normalizer = GuardedNormalizer(
+            functools.partial(TextNormalizer, addon, locale),
+            timeout=args.timeout,
+            max_length=args.max_length,
+            fallback=args.fallback,
+            chunk_size=args.max_length if args.max_length > 0 else 100,
+            offenders_path=args.offenders,
+        )
+    else:
+        normalizer = TextNormalizer(addon, locale)
+    if args.cache_size > 0 or args.cache_path:
+        normalizer = CachedNormalizer(
+            normalizer,
+            addon_hash,
+            max_entries=args.cache_size if args.cache_size > 0 else DEFAULT_CACHE_SIZE,
+            max_chars=args.cache_chars,
+            cache_path=args.cache_path,
+        )
+    return normalizer
+
+
+def close_normalizer(normalizer: Any):
+    """
+    Finalizes normalizer created with :func:`create_normalizer`,
+    for ex. reports stats and persists cache.
+
+    Parameters
+    ----------
+    normalizer: Any
+        normalizer to finalize
+    """
+    if hasattr(normalizer, "close"):
+        normalizer.close()
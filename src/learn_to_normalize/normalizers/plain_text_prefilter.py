@@ -0,0 +1,142 @@
+"""
+Copyright 2022 Balacoon
+
+Prefilter that detects utterances consisting only of plain words
+and classifies them word by word with memoization, instead of
+composing the whole utterance with the tokenizer.
+"""
+
+import logging
+from typing import Callable, Dict, FrozenSet, Iterable
+
+import pynini
+
+from learn_to_normalize.grammar_utils.shortcuts import ALPHA, PUNCT
+from learn_to_normalize.normalizers.cached_normalizer import LruCache
+
+
+def get_single_chars(fsts: Iterable[pynini.Fst]) -> FrozenSet[str]:
+    """
+    Collects single characters accepted by character class fsts, for ex. `ALPHA` from shortcuts.
+    Multi-character strings (for ex. escaped quote in `PUNCT`) are skipped.
+
+    Parameters
+    ----------
+    fsts: Iterable[pynini.Fst]
+        acyclic acceptors of character classes
+
+    Returns
+    -------
+    chars: FrozenSet[str]
+        characters accepted by any of the fsts
+    """
+    chars = set()
+    for fst in fsts:
+        chars.update(x for x in fst.paths().ostrings() if len(x) == 1)
+    return frozenset(chars)
+
+
+class PlainTextPrefilter:
+    """
+    Utterances that consist only of characters from given character classes
+    (letters and punctuation by default, digits are excluded since they trigger
+    most of the grammars) are classified word by word. Classification of each
+    distinct word is memorized, so for typical text most of the words skip the tokenizer fst.
+
+    This is equivalent to classifying the whole utterance only if no grammar spans several
+    plain words (for ex. multi-word abbreviations). Use :func:`.verify` on a corpus to check that
+    for specific grammars.
+    """
+
+    def __init__(
+        self,
+        classify_word: Callable[[str], str],
+        char_classes: Iterable[pynini.Fst] = (ALPHA, PUNCT),
+        cache_size: int = 100000,
+    ):
+        """
+        Parameters
+        ----------
+        classify_word: Callable[[str], str]
+            function that applies tokenizer to a text, used to classify separate words
+        char_classes: Iterable[pynini.Fst]
+            character classes words may consist of to be classified separately
+        cache_size: int
+            max number of distinct words to memorize classification for
+        """
+        self._classify_word = classify_word
+        self._chars = get_single_chars(char_classes) | frozenset(" ")
+        self._cache = LruCache(max_entries=cache_size)
+        self._stats = {"plain": 0, "verified": 0, "mismatches": 0}
+
+    def is_plain(self, text: str) -> bool:
+        """
+        checks if utterance consists only of plain words separated by spaces
+        """
+        return self._chars.issuperset(text) and not text.isspace() and bool(text)
+
+    def classify(self, text: str) -> str:
+        """
+        Classifies utterance word by word. Utterance should pass :func:`.is_plain`
+
+        Parameters
+        ----------
+        text: str
+            plain utterance
+
+        Returns
+        -------
+        classified: str
+            classification output, sequence of `tokens { ... }`
+        """
+        self._stats["plain"] += 1
+        classified = []
+        for word in text.split(" "):
+            if not word:
+                # tokenizer collapses spaces
+                continue
+            word_classified = self._cache.get(word)
+            if word_classified is None:
+                word_classified = self._classify_word(word)
+                self._cache.put(word, word_classified)
+            classified.append(word_classified)
+        return " ".join(classified)
+
+    def verify(self, text: str, expected: str) -> bool:
+        """
+        Compares word-by-word classification against classification of the whole utterance
+
+        Parameters
+        ----------
+        text: str
+            plain utterance
+        expected: str
+            classification of the whole utterance by tokenizer fst
+
+        Returns
+        -------
+        matches: bool
+            whether classifications are the same
+        """
+        self._stats["verified"] += 1
+        try:
+            classified = self.classify(text)
+        except Exception as e:
+            classified = "failed: {}".format(e)
+        if classified == expected:
+            return True
+        self._stats["mismatches"] += 1
+        logging.warning("Word by word classification of [{}] differs:\n{}\nvs\n{}".format(text, classified, expected))
+        return False
+
+    def get_stats(self) -> Dict[str, float]:
+        """
+        Returns
+        -------
+        stats: Dict[str, float]
+            number of utterances classified word by word, number of verified ones,
+            number of mismatches against the tokenizer and hit rate of word memoization
+        """
+        stats = dict(self._stats)
+        stats["hit_rate"] = self._cache.get_stats()["hit_rate"]
+        return stats
@@ -0,0 +1,292 @@
+"""
+Copyright 2022 Balacoon
+
+Reference normalizer that runs grammars directly with pynini,
+without building an addon. Mimics what balacoon_frontend does:
+tokenization/classification, parsing of classified tokens and
+verbalization of each token. Time spent in each stage is tracked,
+so regressions of grammars can be attributed to a specific stage.
+Verbalizations of tokens can be memorized, since the same tokens
+(years, amounts, times) repeat a lot in real text. Utterances with
+plain words only can be classified word by word, see `PlainTextPrefilter`.
+"""
+
+import time
+import logging
+from collections import Counter
+from typing import Any, Callable, Dict, List, Tuple
+
+import pynini
+
+from learn_to_normalize.grammar_utils.grammar_loader import GrammarLoader
+from learn_to_normalize.grammar_utils.token_parser import ParsedToken, parse_tokens
+from learn_to_normalize.normalizers.cached_normalizer import LruCache
+from learn_to_normalize.normalizers.plain_text_prefilter import PlainTextPrefilter
+
+# name under which plain tokens (not produced by any grammar) are accounted
+PLAIN_TOKEN = "<plain>"
+
+
+def serialize_token(token: ParsedToken) -> str:
+    """
+    Serializes classified token into verbalizer input, i.e. `cardinal|integer:12|`.
+    Fields of nested messages are flattened. Fields are serialized in the order
+    classifier produced them, while balacoon_frontend orders them according to
+    verbalizer serialization spec, so grammars relying on reordering may differ.
+
+    Parameters
+    ----------
+    token: ParsedToken
+        token produced by a grammar
+
+    Returns
+    -------
+    serialized: str
+        string to pass to verbalizer
+    """
+    parts = [token.name + "|"]
+
+    def _add_fields(fields: List[Tuple[str, Any]]):
+        for key, value in fields:
+            if isinstance(value, str):
+                parts.append("{}:{}|".format(key, value))
+            else:
+                _add_fields(value)
+
+    _add_fields(token.fields)
+    return "".join(parts)
+
+
+def _get_plain_text(token: ParsedToken) -> str:
+    """
+    text of a plain token, which is passed through as is
+    """
+    for key, value in token.fields:
+        if key == "name" and isinstance(value, str):
+            return value
+    return " ".join(value for _, value in token.fields if isinstance(value, str))
+
+
+class ReferenceNormalizer:
+    """
+    Normalizes text with `ClassifyFst` and `VerbalizeFst` from the grammars,
+    tracking time spent in each stage:
+
+    - `classify` - composition of input with tokenizer and search of the best path
+    - `parse` - parsing of `tokens { ... }` into separate tokens
+    - `verbalize` - verbalization of each token, additionally tracked per token class
+
+    Results should match normalization with the addon built from the same grammars,
+    but it is much slower, so it is meant for debugging and profiling of grammars.
+
+    Verbalization depends only on the serialized token, so with verbalization cache
+    enabled, repeated tokens skip the verbalizer fst. Time of cache hits is still
+    accounted in `verbalize` stage.
+
+    With fast path enabled, utterances that consist only of plain words are classified
+    word by word with memoization, see :class:`PlainTextPrefilter`. In verification mode,
+    such utterances are classified both ways, mismatches are reported and the result
+    of the whole-utterance classification is used.
+    """
+
+    STAGES = ["classify", "parse", "verbalize"]
+
+    def __init__(
+        self,
+        grammars_dir: str,
+        deferred_optimization: bool = False,
+        timing_hook: Callable[[str, str, float], None] = None,
+        verbalization_cache_size: int = 0,
+        fast_path: bool = False,
+        verify_fast_path: bool = False,
+    ):
+        """
+        Parameters
+        ----------
+        grammars_dir: str
+            directory with normalization grammars
+        deferred_optimization: bool
+            whether to defer optimization of multi-token branches, see :class:`GrammarLoader`
+        timing_hook: Callable[[str, str, float], None]
+            if provided, called after each measured step with stage name,
+            token class (empty for `classify` and `parse`) and elapsed time in seconds
+        verbalization_cache_size: int
+            if > 0, verbalizations of that many most recently seen tokens are memorized
+        fast_path: bool
+            if True, utterances with plain words only are classified word by word
+        verify_fast_path: bool
+            if True, fast path is checked against classification of the whole utterance
+        """
+        loader = GrammarLoader(grammars_dir, deferred_optimization=deferred_optimization)
+        start = time.perf_counter()
+        self._classify_fst = loader.get_grammar("classify.classify", "ClassifyFst").fst
+        self._verbalize_fst = loader.get_grammar("verbalize.verbalize", "VerbalizeFst").fst
+        logging.info("Compiled grammars from {} in {:.2f}s".format(grammars_dir, time.perf_counter() - start))
+        self._timing_hook = timing_hook
+        self._stage_time = Counter()  # stage -> seconds
+        self._class_time = Counter()  # token class -> seconds spent on verbalization
+        self._class_count = Counter()  # token class -> number of verbalized tokens
+        self._utterances = 0
+        self._cache = LruCache(max_entries=verbalization_cache_size) if verbalization_cache_size > 0 else None
+        self._prefilter = None
+        if fast_path or verify_fast_path:
+            self._prefilter = PlainTextPrefilter(lambda word: self._rewrite(word, self._classify_fst))
+        self._verify_fast_path = verify_fast_path
+
+    def _track(self, stage: str, token_class: str, elapsed: float):
+        self._stage_time[stage] += elapsed
+        if stage == "verbalize":
+            self._class_time[token_class] += elapsed
+            self._class_count[token_class] += 1
+        if self._timing_hook is not None:
+            self._timing_hook(stage, token_class, elapsed)
+
+    @staticmethod
+    def _rewrite(text: str, fst: pynini.Fst) -> str:
+        """
+        applies fst to escaped text and returns the best output
+        """
+        lattice = pynini.escape(text) @ fst
+        return pynini.shortestpath(lattice, nshortest=1, unique=True).string()
+
+    def classify(self, text: str) -> str:
+        """
+        Tokenizes and classifies text
+
+        Parameters
+        ----------
+        text: str
+            utterance to classify
+
+        Returns
+        -------
+        classified: str
+            classification output, sequence of `tokens { ... }`
+        """
+        start = time.perf_counter()
+        try:
+            if self._prefilter is not None and not self._verify_fast_path and self._prefilter.is_plain(text):
+                classified = self._prefilter.classify(text)
+            else:
+                classified = self._rewrite(text, self._classify_fst)
+        except Exception as e:
+            raise RuntimeError("Failed to classify [{}]: {}".format(text, e))
+        finally:
+            self._track("classify", "", time.perf_counter() - start)
+        if self._verify_fast_path and self._prefilter.is_plain(text):
+            # verification is not accounted in timing
+            self._prefilter.verify(text, classified)
+        return classified
+
+    def verbalize_token(self, token: ParsedToken) -> str:
+        """
+        Verbalizes single classified token. Plain tokens are passed through
+
+        Parameters
+        ----------
+        token: ParsedToken
+            parsed token
+
+        Returns
+        -------
+        verbalized: str
+            spoken form of the token
+        """
+        start = time.perf_counter()
+        if not token.name:
+            verbalized = _get_plain_text(token)
+            self._track("verbalize", PLAIN_TOKEN, time.perf_counter() - start)
+            return verbalized
+        serialized = serialize_token(token)
+        verbalized = self._cache.get(serialized) if self._cache is not None else None
+        if verbalized is not None:
+            self._track("verbalize", token.name, time.perf_counter() - start)
+            return verbalized
+        try:
+            verbalized = self._rewrite(serialized, self._verbalize_fst)
+        except Exception as e:
+            raise RuntimeError("Failed to verbalize [{}]: {}".format(serialized, e))
+        finally:
+            self._track("verbalize", token.name, time.perf_counter() - start)
+        if self._cache is not None:
+            self._cache.put(serialized, verbalized)
+        return verbalized
+
+    def normalize(self, text: str) -> str:
+        """
+        Normalizes text, going through all the stages
+
+        Parameters
+        ----------
+        text: str
+            utterance to normalize
+
+        Returns
+        -------
+        normalized: str
+            normalized utterance
+        """
+        self._utterances += 1
+        classified = self.classify(text)
+        start = time.perf_counter()
+        tokens = parse_tokens(classified)
+        self._track("parse", "", time.perf_counter() - start)
+        return " ".join(self.verbalize_token(token) for token in tokens)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Returns
+        -------
+        stats: Dict[str, Any]
+            number of normalized utterances, time spent in each stage
+            and time and number of verbalized tokens per token class.
+            If verbalization cache is enabled, also its stats, see :func:`LruCache.get_stats`.
+            If fast path is enabled, also its stats, see :func:`PlainTextPrefilter.get_stats`
+        """
+        stats = {
+            "utterances": self._utterances,
+            "stages": {stage: self._stage_time[stage] for stage in self.STAGES},
+            "classes": {name: (self._class_count[name], self._class_time[name]) for name in self._class_count},
+        }
+        if self._cache is not None:
+            stats["verbalization_cache"] = self._cache.get_stats()
+        if self._prefilter is not None:
+            stats["fast_path"] = self._prefilter.get_stats()
+        return stats
+
+    def log_stats(self, top: int = 50):
+        """
+        Writes time per stage and per token class into the log
+
+        Parameters
+        ----------
+        top: int
+            number of token classes with the most verbalization time to report
+        """
+        total_time = max(sum(self._stage_time.values()), 1e-9)
+        utterances = max(self._utterances, 1)
+        logging.info("Normalized {} utterances in {:.2f}s".format(self._utterances, total_time))
+        logging.info("{:<12} {:>10} {:>8} {:>12}".format("stage", "time,s", "time%", "ms/utt"))
+        for stage in self.STAGES:
+            elapsed = self._stage_time[stage]
+            logging.info("{:<12} {:>10.2f} {:>8.2f} {:>12.3f}".format(
+                stage, elapsed, 100.0 * elapsed / total_time, 1000 * elapsed / utterances))
+        logging.info("{:<24} {:>10} {:>10} {:>12}".format("token class", "tokens", "time,s", "us/token"))
+        for name, elapsed in self._class_time.most_common(top):
+            count = self._class_count[name]
+            logging.info("{:<24} {:>10} {:>10.2f} {:>12.1f}".format(name, count, elapsed, 1e6 * elapsed / count))
+        if self._cache is not None:
+            stats = self._cache.get_stats()
+            logging.info("Verbalization cache: {:.3f} hit rate ({} hits, {} misses), {} entries, {} evictions".format(
+                stats["hit_rate"], stats["hits"], stats["misses"], stats["entries"], stats["evictions"]))
+        if self._prefilter is not None:
+            stats = self._prefilter.get_stats()
+            logging.info("Plain text fast path: {} utterances classified word by word, {:.3f} word hit rate, "
+                         "{} verified, {} mismatches".format(
+                             stats["plain"], stats["hit_rate"], stats["verified"], stats["mismatches"]))
+
+    def close(self):
+        """
+        reports time spent in each stage
+        """
+        self.log_stats()
@@ -0,0 +1,81 @@
+"""
+Copyright 2022 Balacoon
+
+Profiles normalization with grammars directly, without building an addon.
+Reports time spent in tokenization/classification, token parsing
+and verbalization, as well as verbalization time per token class.
+"""
+
+import logging
+import argparse
+
+import tqdm
+
+from learn_to_normalize.evaluation.data_iterator_factory import get_data_iterator, get_supported_datasets
+from learn_to_normalize.normalizers.reference_normalizer import ReferenceNormalizer
+
+
+def parse_args():
+    ap = argparse.ArgumentParser(
+        description="Normalizes a corpus with grammars through pynini and reports time spent per stage",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    ap.add_argument("--grammars", required=True, help="Directory with grammars")
+    ap.add_argument(
+        "--dataset",
+        required=True,
+        choices=get_supported_datasets(),
+        help="Dataset name, defines how to parse data from datadir",
+    )
+    ap.add_argument("--datadir", required=True, help="Location of the data, see `evaluate`")
+    ap.add_argument("--subset", default="test", help="Subset of the data to normalize")
+    ap.add_argument("--num", default=1000, type=int, help="Number of utterances to normalize. -1 for all")
+    ap.add_argument("--top", default=50, type=int, help="Number of token classes to report")
+    ap.add_argument(
+        "--verbalization-cache-size",
+        default=0,
+        type=int,
+        help="If > 0, verbalizations of that many most recent tokens are memorized",
+    )
+    ap.add_argument(
+        "--fast-path",
+        action="store_true",
+        help="Classify utterances that consist of plain words only word by word, with memoization",
+    )
+    ap.add_argument(
+        "--verify-fast-path",
+        action="store_true",
+        help="Check word by word classification against classification of whole utterances, reporting mismatches",
+    )
+    ap.add_argument(
+        "--deferred-optimization",
+        action="store_true",
+        help="Defer optimization of multi-token branches, see `learn_to_normalize`",
+    )
+    args = ap.parse_args()
+    return args
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+
+    normalizer = ReferenceNormalizer(args.grammars, deferred_optimization=args.deferred_optimization,
+                                     verbalization_cache_size=args.verbalization_cache_size,
+                                     fast_path=args.fast_path, verify_fast_path=args.verify_fast_path)
+    data_iterator = get_data_iterator(name=args.dataset, location=args.datadir, subset=args.subset,
+                                      n_utterances=args.num)
+    length = data_iterator.estimate_length()
+    total, failed, mismatched = 0, 0, 0
+    for unnormalized, normalized in tqdm.tqdm(data_iterator, total=length if length > 0 else None):
+        total += 1
+        try:
+            result = normalizer.normalize(unnormalized)
+        except RuntimeError as e:
+            failed += 1
+            logging.debug(str(e))
+            continue
+        if result != normalized:
+            mismatched += 1
+    logging.info("{} utterances, {} failed, {} don't match expected normalization".format(total, failed, mismatched))
+    normalizer.log_stats(args.top)